@@ -37,6 +37,7 @@ async def example():
     # Cleanup everything gracefully.
     await pipe.close()
     await tunnel.close()
+    await client.close()
     await toxid.close()
     
     # Give tasks time to finish..
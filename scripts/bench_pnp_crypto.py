@@ -0,0 +1,92 @@
+"""
+Measures PNP server requests per second as the number of crypto
+workers grows. Every request is a signed write followed by an
+unsigned fetch that misses the name cache. Uses the SQLite backend
+so no MySQL server is needed.
+
+Clients are built the same way as PNPClient. Their keys and
+messages are made before timing starts.
+"""
+
+import tempfile
+from ecdsa import SigningKey, SECP256k1
+from p2pd import *
+
+N_CLIENTS = 50
+N_REQS = 100
+
+class FakeClock():
+    def time(self):
+        return time.time()
+
+class FakePipe():
+    def __init__(self):
+        self.sock = type("Sock", (), {"type": TCP})()
+        self.route = type("Route", (), {"af": IP4})()
+        self.stream = self
+
+    def set_dest_tup(self, dest_tup):
+        pass
+
+    async def send(self, buf, dest_tup=None):
+        return len(buf)
+
+def gen_keys():
+    sk = SigningKey.generate(curve=SECP256k1)
+    return sk, sk.get_verifying_key().to_string("compressed")
+
+def gen_reqs(serv_pk):
+    owners = [gen_keys() for _ in range(0, N_CLIENTS)]
+    _, reply_pk = gen_keys()
+    reqs = []
+    for n in range(0, N_REQS):
+        sk, vkc = owners[n % N_CLIENTS]
+        name = to_b("name{0}".format(n))
+        for value in [b"value", b""]:
+            pkt = PNPPacket(name, value, vkc, None, time.time_ns() // 1000)
+            pkt.reply_pk = reply_pk
+            pnp_msg = pkt.get_msg_to_sign()
+
+            # Fetches aren't signed.
+            sig = sk.sign(pnp_msg) if len(value) else b""
+            reqs.append(encrypt(serv_pk, pnp_msg + sig))
+
+    return reqs
+
+async def bench(workers, reqs, serv_sk, serv_pk):
+    tmp = tempfile.TemporaryDirectory()
+    storage = SQLiteStorage(os.path.join(tmp.name, "pnp.sqlite3"))
+    storage.name_cache.size = 0
+    serv = PNPServer(
+        None,
+        None,
+        None,
+        serv_sk.to_string(),
+        serv_pk,
+        FakeClock(),
+        storage=storage,
+        crypto_workers=workers
+    )
+    await serv.start()
+
+    # Many clients at once.
+    start = time.perf_counter()
+    tasks = []
+    for req in reqs:
+        tasks.append(serv.msg_cb(req, ("127.0.0.1", 1337), FakePipe()))
+
+    await asyncio.gather(*tasks)
+    duration = time.perf_counter() - start
+    await serv.close()
+    tmp.cleanup()
+
+    print("{0:>8} {1:>12.1f}".format(workers, len(reqs) / duration))
+
+async def main():
+    serv_sk, serv_pk = gen_keys()
+    reqs = gen_reqs(serv_pk)
+    print("{0:>8} {1:>12}".format("workers", "reqs/sec"))
+    for workers in [0, 1, 2, 4, 8]:
+        await bench(workers, reqs, serv_sk, serv_pk)
+
+async_test(main)
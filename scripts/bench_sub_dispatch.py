@@ -0,0 +1,65 @@
+"""
+Measures the cost of routing a message to a subscription as the
+number of subs on a pipe grows. Subs are set up the same way the
+STUN client does it: one escaped TXID per request with the
+server address as the host pattern.
+
+The 'linear' column is the old approach of scanning every sub
+and running re.findall over the payload.
+"""
+
+import re
+import time
+from p2pd import *
+
+SERVER_TUP = ("127.0.0.1", 3478)
+N_MSGS = 2000
+
+def linear_match(subs, data, client_tup):
+    matches = []
+    for offset, (b_msg_p, m_client_tup) in subs.items():
+        if m_client_tup is not None:
+            if m_client_tup[1]:
+                if m_client_tup != client_tup:
+                    continue
+            else:
+                if m_client_tup[0] != client_tup[0]:
+                    continue
+
+        if b_msg_p:
+            if re.findall(b_msg_p, data) == []:
+                continue
+
+        matches.append(offset)
+
+    return matches
+
+def time_it(f, msgs):
+    start = time.perf_counter()
+    for msg in msgs:
+        f(msg, SERVER_TUP)
+
+    return ((time.perf_counter() - start) / len(msgs)) * 1000000
+
+def bench(sub_no):
+    subs = {}
+    index = SubIndex()
+    txids = [os.urandom(12) for _ in range(0, sub_no)]
+    for offset, txid in enumerate(txids):
+        sub = (re.escape(txid), SERVER_TUP)
+        subs[offset] = sub
+        index.add(offset, *sub)
+
+    # STUN header = type + len + magic cookie + TXID.
+    msgs = []
+    for n in range(0, N_MSGS):
+        txid = txids[n % sub_no]
+        msgs.append(b"\x01\x01\x00\x0c\x21\x12\xa4\x42" + txid + os.urandom(12))
+
+    linear = time_it(lambda d, c: linear_match(subs, d, c), msgs)
+    indexed = time_it(index.match, msgs)
+    print("{0:>6} {1:>12.2f} {2:>12.2f}".format(sub_no, linear, indexed))
+
+print("{0:>6} {1:>12} {2:>12}".format("subs", "linear (us)", "index (us)"))
+for sub_no in [1, 10, 100, 500, 1000]:
+    bench(sub_no)
@@ -16,24 +16,32 @@ if __name__ != '__main__':
     from .nic.route.route_defs import Route, RoutePool
     from .nic.route.route_utils import get_routes_with_res
     from .net.pipe.pipe_utils import *
+    from .protocol.rudp_stream import RUDPStream, rudp_open
     from .nic.interface import Interface, init_p2pd
+    from .nic.if_cache import IFCache, IF_CACHE_TTL, load_interfaces_cached, refresh_interfaces, if_resolved_info, if_swap_resolved
     from .protocol.ntp.clock_skew import SysClock
     from .protocol.stun.stun_client import STUNClient, get_stun_clients
+    from .protocol.stun.stun_pool import STUNPool, STUN_POOL, stun_serv_key
+    from .protocol.stun.stun_mux import *
+    from .protocol.stun.stun_codec import *
+    from .protocol.stun.stun_utils import get_stun_reply
     from .traversal.turn.turn_client import TURNClient
     from .traversal.tcp_punch.tcp_punch_client import TCPPuncher
     from .net.daemon import Daemon
     from .protocol.echo.echo_server import *
     from .protocol.http.http_client_lib import ParseHTTPResponse, WebCurl
+    from .protocol.http.http_client_lib import HTTPResponseParser, HTTPPool, HTTPBodyReader
     from .protocol.http.http_client_lib import http_req_buf
     from .protocol.http.http_server_lib import rest_service, send_json, send_binary, RESTD, api_route_closure
-    from .protocol.http.http_server_lib import ParseHTTPRequest
+    from .protocol.http.http_server_lib import ParseHTTPRequest, HTTPRequest, HTTPRequestParser, HTTP_MAX_BODY
     from .node.rest_api import P2PDServer, start_p2pd_server, P2PD_PORT
     from .node.p2p_addr import *
     from .node.p2p_pipe import *
     from .node.p2p_node_extra import P2PNodeExtra
     from .node.p2p_node import P2PNode, NODE_CONF, NODE_PORT
-    from .node.p2p_utils import get_pp_executors
+    from .node.p2p_utils import get_pp_executors, IdlePipes, idle_timeout
     from .node.signaling import SignalMock, is_valid_mqtt
+    from .node.sig_dispatch import SigDispatcher, sig_msg_split
     from .install import *
     from .protocol.toxiproxy.toxiclient import ToxiToxic, ToxiTunnel, ToxiClient
     from .protocol.toxiproxy.toxiserver import ToxiMainServer
@@ -45,6 +53,8 @@ if __name__ != '__main__':
     except:
         pass
 
+    from .protocol.pnp.pnp_pool import *
+    from .protocol.pnp.pnp_crypto import *
     from .protocol.pnp.pnp_client import *
     from .node.nickname import *
     from .utility.test_init import *
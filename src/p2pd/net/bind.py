@@ -267,7 +267,11 @@ class Bind():
     def supported(self):
         return [self.af]
 
-async def socket_factory(route, dest_addr=None, sock_type=TCP, conf=NET_CONF):
+"""
+Socket creation never blocks so it's also exposed as a
+regular function for code that runs in loop callbacks.
+"""
+def socket_factory_sync(route, dest_addr=None, sock_type=TCP, conf=NET_CONF):
     # Check route is bound.
     if not route.resolved:
         raise Exception("You didn't bind the route!")
@@ -366,6 +370,9 @@ async def socket_factory(route, dest_addr=None, sock_type=TCP, conf=NET_CONF):
             sock.close()
         return None
 
+async def socket_factory(route, dest_addr=None, sock_type=TCP, conf=NET_CONF):
+    return socket_factory_sync(route, dest_addr, sock_type, conf)
+
 async def get_high_port_socket(route, sock_type=TCP):
     # Minimal config to pass socket factory.
     conf = {
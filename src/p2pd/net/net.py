@@ -146,6 +146,11 @@ IP_BIND_TUP = 6
 NOT_WINDOWS = platform.system() != "Windows"
 SUB_ALL = [None, None]
 
+# What to do when a subscription queue is full.
+QSIZE_DROP_OLDEST = 1
+QSIZE_DROP_NEWEST = 2
+QSIZE_BACKPRESSURE = 3
+
 # Fine tune various network settings.
 NET_CONF = {
     # Seconds to use for a DNS request before timeout exception.
@@ -169,6 +174,14 @@ NET_CONF = {
     # No of messages to receive per subscription.
     "max_qsize": 0,
 
+    # Action to take when a sub queue reaches max_qsize.
+    # Backpressure stops reading from the socket instead.
+    "qsize_policy": QSIZE_DROP_OLDEST,
+
+    # Resume reading when a queue drains below this
+    # portion of max_qsize (for backpressure.)
+    "qsize_low": 0.5,
+
     # Require unique messages or not.
     "enable_msg_ids": 0,
 
@@ -197,6 +210,45 @@ NET_CONF = {
     # Retry N times on reply timeout.
     "send_retry": 2,
 
+    # Pass received data as a memoryview and cache normalized
+    # peer addresses. Handlers must copy data they keep.
+    "fast_recv": False,
+
+    # Max normalized peer addresses to cache for fast_recv.
+    "addr_cache_size": 1024,
+
+    # Max datagrams to read or write per syscall for UDP
+    # pipes (recvmmsg / sendmmsg on Linux.) 0 = off.
+    "udp_batch": 0,
+
+    # Recv buffer size per datagram when batching.
+    "udp_batch_buf": 2 ** 16,
+
+    # Seconds to hold ACKs for reliable UDP so they can be
+    # sent together as one SACK. Both sides must enable it
+    # for SACKs to be used. 0 = off.
+    "sack_delay": 0,
+
+    # Max seqs per SACK before it's sent early.
+    "sack_max": 64,
+
+    # Max payload bytes per RUDP stream segment.
+    "rudp_mss": 1200,
+
+    # Bytes of unACKed + unsent data before RUDP stream
+    # sends wait.
+    "rudp_send_buf": 2 ** 20,
+
+    # Bytes an RUDP stream buffers before its window closes.
+    "rudp_recv_buf": 2 ** 20,
+
+    # Congestion window limits in segments.
+    "rudp_init_cwnd": 4,
+    "rudp_max_cwnd": 1024,
+
+    # Transmits per segment before the stream fails.
+    "rudp_max_tries": 10,
+
     # Ref to an event loop.
     "loop": None
 }
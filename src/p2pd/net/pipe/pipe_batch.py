@@ -0,0 +1,305 @@
+"""
+asyncio's datagram transport reads one packet per readiness event
+and does one sendto() syscall per send. For UDP pipes that move a
+lot of small packets (TURN relays, reliable UDP) the syscall and
+event loop overhead ends up being the limit.
+
+Linux has recvmmsg and sendmmsg which move many datagrams in a
+single syscall. They're called here using ctypes against libc so
+no C extension is needed. Where they aren't available reads fall
+back to a loop of recvfrom() calls per readiness event and sends
+go through the regular transport.
+
+Batching is enabled per pipe with NET_CONF["udp_batch"] = N
+where N is the max datagrams to read or write per syscall.
+"""
+
+import asyncio
+import socket
+import struct
+import ctypes
+import ctypes.util
+import errno
+import sys
+from ...utility.utils import *
+from ..net import *
+
+# Max sockaddrs to keep packed for sends.
+BATCH_MAX_ADDRS = 1000
+
+class IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+# Load recvmmsg / sendmmsg from libc if supported.
+def load_mmsg_funcs():
+    if not sys.platform.startswith("linux"):
+        return None, None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        recvmmsg = libc.recvmmsg
+        recvmmsg.argtypes = [
+            ctypes.c_int,
+            ctypes.POINTER(MMsgHdr),
+            ctypes.c_uint,
+            ctypes.c_int,
+            ctypes.c_void_p
+        ]
+        recvmmsg.restype = ctypes.c_int
+
+        sendmmsg = libc.sendmmsg
+        sendmmsg.argtypes = [
+            ctypes.c_int,
+            ctypes.POINTER(MMsgHdr),
+            ctypes.c_uint,
+            ctypes.c_int
+        ]
+        sendmmsg.restype = ctypes.c_int
+        return recvmmsg, sendmmsg
+    except Exception:
+        log_exception()
+        return None, None
+
+RECVMMSG, SENDMMSG = load_mmsg_funcs()
+
+# Convert a raw sockaddr into a tup like recvfrom returns.
+def sockaddr_to_tup(buf):
+    family, = struct.unpack_from("=H", buf, 0)
+    port, = struct.unpack_from("!H", buf, 2)
+    if family == AF_INET:
+        ip = socket.inet_ntop(AF_INET, bytes(buf[4:8]))
+        return (ip, port)
+
+    if family == AF_INET6:
+        flow_info, = struct.unpack_from("!I", buf, 4)
+        ip = socket.inet_ntop(AF_INET6, bytes(buf[8:24]))
+        scope_id, = struct.unpack_from("=I", buf, 24)
+        return (ip, port, flow_info, scope_id)
+
+    return None
+
+# Convert an (ip, port) tup into a raw sockaddr.
+def tup_to_sockaddr(af, dest_tup):
+    port = struct.pack("!H", dest_tup[1])
+    if af == AF_INET:
+        ip = socket.inet_pton(AF_INET, dest_tup[0])
+        return struct.pack("=H", AF_INET) + port + ip + (b"\0" * 8)
+
+    scope_id = dest_tup[3] if len(dest_tup) > 3 else 0
+    return b"".join([
+        struct.pack("=H", AF_INET6),
+        port,
+        struct.pack("!I", 0),
+        socket.inet_pton(AF_INET6, dest_tup[0]),
+        struct.pack("=I", scope_id)
+    ])
+
+class UDPBatch():
+    def __init__(self, pipe_events, transport, loop, conf=NET_CONF):
+        self.pipe_events = pipe_events
+        self.transport = transport
+        self.loop = loop
+        self.conf = conf
+        self.sock = transport.get_extra_info("socket")
+        self.fd = self.sock.fileno()
+        self.af = self.sock.family
+        self.vlen = conf["udp_batch"]
+        self.buf_size = conf["udp_batch_buf"]
+
+        # Queued sends for the next flush.
+        self.send_queue = []
+        self.flush_scheduled = False
+        self.addrs = {}
+
+        # Reused buffers for recvmmsg.
+        self.use_mmsg = RECVMMSG is not None
+        if self.use_mmsg:
+            self.setup_recv_bufs()
+
+    def setup_recv_bufs(self):
+        self.recv_buf = bytearray(self.vlen * self.buf_size)
+        self.recv_view = memoryview(self.recv_buf)
+        self.name_buf = bytearray(self.vlen * 128)
+        self.name_view = memoryview(self.name_buf)
+        recv_base = ctypes.addressof(
+            (ctypes.c_char * len(self.recv_buf)).from_buffer(self.recv_buf)
+        )
+        name_base = ctypes.addressof(
+            (ctypes.c_char * len(self.name_buf)).from_buffer(self.name_buf)
+        )
+
+        self.recv_iovs = (IOVec * self.vlen)()
+        self.recv_msgs = (MMsgHdr * self.vlen)()
+        for i in range(0, self.vlen):
+            self.recv_iovs[i].iov_base = recv_base + (i * self.buf_size)
+            self.recv_iovs[i].iov_len = self.buf_size
+            hdr = self.recv_msgs[i].msg_hdr
+            hdr.msg_name = name_base + (i * 128)
+            hdr.msg_iov = ctypes.pointer(self.recv_iovs[i])
+            hdr.msg_iovlen = 1
+
+    # Replace the transports reader with the batched reader.
+    def install(self):
+        self.transport._read_ready = self.read_ready
+        if not self.transport.is_closing():
+            self.loop._add_reader(self.fd, self.read_ready)
+
+        return self
+
+    def recv_batch(self):
+        # Name len is an in-out param so it's reset per call.
+        for i in range(0, self.vlen):
+            self.recv_msgs[i].msg_hdr.msg_namelen = 128
+
+        n = RECVMMSG(self.fd, self.recv_msgs, self.vlen, socket.MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+
+            raise OSError(err, os.strerror(err))
+
+        msgs = []
+        for i in range(0, n):
+            msg_len = self.recv_msgs[i].msg_len
+            start = i * self.buf_size
+            data = self.recv_view[start:start + msg_len]
+            if not self.conf["fast_recv"]:
+                data = data.tobytes()
+
+            name_start = i * 128
+            client_tup = sockaddr_to_tup(self.name_view[name_start:name_start + 128])
+            msgs.append([data, client_tup])
+
+        return msgs
+
+    def recv_loop(self):
+        msgs = []
+        for _ in range(0, self.vlen):
+            try:
+                msgs.append(self.sock.recvfrom(self.buf_size))
+            except (BlockingIOError, InterruptedError):
+                break
+
+        return msgs
+
+    # Drain up to vlen datagrams per readiness event.
+    def read_ready(self):
+        if self.transport.is_closing():
+            return
+
+        try:
+            if self.use_mmsg:
+                msgs = self.recv_batch()
+            else:
+                msgs = self.recv_loop()
+        except OSError as exc:
+            self.pipe_events.error_received(exc)
+            return
+        except Exception:
+            log_exception()
+            return
+
+        for data, client_tup in msgs:
+            try:
+                self.pipe_events.handle_data(data, client_tup)
+            except Exception:
+                log_exception()
+
+    def get_sockaddr(self, dest_tup):
+        if dest_tup not in self.addrs:
+            if len(self.addrs) > BATCH_MAX_ADDRS:
+                self.addrs = {}
+
+            self.addrs[dest_tup] = tup_to_sockaddr(self.af, dest_tup)
+
+        return self.addrs[dest_tup]
+
+    # Sends are queued and written in one syscall per loop pass.
+    def sendto(self, data, dest_tup):
+        if SENDMMSG is None or dest_tup is None:
+            self.transport.sendto(data, dest_tup)
+            return
+
+        self.send_queue.append([bytes(data), dest_tup])
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.flush)
+
+    def send_batch(self, batch):
+        n = len(batch)
+        msgs = (MMsgHdr * n)()
+        iovs = (IOVec * n)()
+
+        # References must live until the syscall returns.
+        refs = []
+        for i, (data, dest_tup) in enumerate(batch):
+            sockaddr = self.get_sockaddr(dest_tup)
+            refs.append(sockaddr)
+            iovs[i].iov_base = ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p)
+            iovs[i].iov_len = len(data)
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = ctypes.cast(ctypes.c_char_p(sockaddr), ctypes.c_void_p)
+            hdr.msg_namelen = len(sockaddr)
+            hdr.msg_iov = ctypes.pointer(iovs[i])
+            hdr.msg_iovlen = 1
+
+        sent = SENDMMSG(self.fd, msgs, n, socket.MSG_DONTWAIT)
+        return max(sent, 0)
+
+    def flush(self):
+        self.flush_scheduled = False
+        queue = self.send_queue
+        self.send_queue = []
+        if self.transport.is_closing():
+            return
+
+        # Keep ordering with anything buffered in the transport.
+        if self.transport.get_write_buffer_size():
+            for data, dest_tup in queue:
+                self.transport.sendto(data, dest_tup)
+
+            return
+
+        # Transport handles EAGAIN + errors for unsent msgs.
+        p = 0
+        while p < len(queue):
+            batch = queue[p:p + self.vlen]
+            sent = self.send_batch(batch)
+            p += sent
+            if sent < len(batch):
+                for data, dest_tup in queue[p:]:
+                    self.transport.sendto(data, dest_tup)
+
+                break
+
+# Enables batched I/O for a UDP pipe if its conf sets it.
+def pipe_batch_setup(pipe_events, transport, loop, conf=NET_CONF):
+    if not conf["udp_batch"]:
+        return None
+
+    # Needs a selector event loop.
+    if not hasattr(transport, "_sock_fd") or not hasattr(loop, "_add_reader"):
+        return None
+
+    return UDPBatch(pipe_events, transport, loop, conf).install()
@@ -1,8 +1,10 @@
 import asyncio
 import re
+from collections import OrderedDict
 from ...protocol.ack_udp import *
 from ..net import *
 from ..ip_range import *
+from .pipe_subs import *
 
 def tup_to_sub(dest_tup):
     dest_tup = client_tup_norm(dest_tup)
@@ -15,6 +17,70 @@ def norm_client_tup(client_tup):
     ip = ip_norm(client_tup[0])
     return (ip, client_tup[1])
 
+# Data from a reused recv buffer must be copied before it's kept.
+def own_data(data):
+    if isinstance(data, memoryview):
+        return data.tobytes()
+
+    return data
+
+# Async handlers run after the recv buffer has been reused.
+def handler_data(handler, data):
+    if inspect.iscoroutinefunction(handler):
+        return own_data(data)
+
+    return data
+
+"""
+Normalizing an IP means parsing it with ipaddress for every
+message received. Peers rarely change so the normalized form
+is cached here keyed by the raw tuple the OS returned.
+"""
+class AddrCache():
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.tups = OrderedDict()
+
+    def norm(self, client_tup):
+        if client_tup in self.tups:
+            self.tups.move_to_end(client_tup)
+            return self.tups[client_tup]
+
+        norm_tup = norm_client_tup(client_tup)
+        self.tups[client_tup] = norm_tup
+        if len(self.tups) > self.max_size:
+            self.tups.popitem(last=False)
+
+        return norm_tup
+
+"""
+Backpressure works by no longer reading from the socket.
+Received data stays in the OS buffer (and TCP tells the
+sender to slow down.) Older Pythons only support pausing
+stream transports so for UDP the reader is removed
+from the event loop directly.
+"""
+def transport_pause(transport, loop):
+    try:
+        transport.pause_reading()
+        return 1
+    except (AttributeError, NotImplementedError):
+        pass
+
+    if hasattr(transport, "_sock_fd") and hasattr(loop, "_remove_reader"):
+        loop._remove_reader(transport._sock_fd)
+        return 2
+
+    return 0
+
+def transport_resume(transport, loop, how):
+    if how == 1:
+        transport.resume_reading()
+
+    if how == 2:
+        if not transport.is_closing():
+            loop._add_reader(transport._sock_fd, transport._read_ready)
+
 """
 The code in this class supports a pull / fetch style use-case.
 More suitable for some apps whereas the parent class allows
@@ -25,6 +91,8 @@ class PipeClient(ACKUDP):
     def __init__(self, pipe_events, loop=None, conf=NET_CONF):
         super().__init__()
         self.conf = conf
+        self.sack_delay = conf["sack_delay"]
+        self.sack_max = conf["sack_max"]
         self.dest = None
         self.dest_tup = None
         self.loop = loop or asyncio.get_event_loop()
@@ -33,6 +101,9 @@ class PipeClient(ACKUDP):
         # Lets convert this to [b"msg pattern", b"host pattern"] = [Queue]
         self.subs = {}
 
+        # Subs grouped by host pattern for fast matching.
+        self.sub_index = SubIndex()
+
         # Instance of the base proto class.
         self.pipe_events = pipe_events
         self.route = self.pipe_events.route
@@ -40,6 +111,16 @@ class PipeClient(ACKUDP):
         # Used for doing send calls.
         self.handle = {}
 
+        # Batched UDP I/O if enabled.
+        self.batch = None
+
+        # [offset] = messages dropped due to full queue.
+        self.drops = {}
+
+        # Subs with full queues that paused reading.
+        self.full_subs = set()
+        self.paused = 0
+
     """
     (1) UDP is multiplexed and doesn't need a destination bound.
     (2) TCP cons have a dest set.
@@ -87,6 +168,9 @@ class PipeClient(ACKUDP):
                 handler
             ]
 
+            self.sub_index.add(offset, b_msg_p, client_tup)
+            self.drops[offset] = 0
+
         return offset
 
     # Remove a subscription.
@@ -94,60 +178,94 @@ class PipeClient(ACKUDP):
         offset = self.hash_sub(sub)
         if offset in self.subs:
             del self.subs[offset]
+            del self.drops[offset]
+            self.sub_index.remove(offset)
+            self.check_resume(offset)
 
         return self
 
-    # Adds a message to the first valid bucket.
-    """
-    TODO: If the queue is full what should the default
-    actions be? Should the program await the queue
-    being empty? Should it discard data? Maybe on limit - 1
-    call https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.remove_reader and on queue empty add it back.
-    """
-    def add_msg(self, data, client_tup):
+    # Number of messages a sub has lost to a full queue.
+    def drop_count(self, sub=SUB_ALL):
+        msg_p, addr_p = sub
+        if addr_p is not None:
+            addr_p = client_tup_norm(addr_p)
+            sub = (msg_p, addr_p)
+
+        return self.drops.get(self.hash_sub(sub), 0)
+
+    # Stop reading from the socket until a full queue drains.
+    def pause(self, offset):
+        self.full_subs.add(offset)
+        if self.paused:
+            return
+
+        transport = self.pipe_events.transport
+        if transport is None:
+            return
+
+        self.paused = transport_pause(transport, self.loop)
+        if self.paused:
+            log(fstr("Paused reading for sub {0}", (offset,)))
+
+    # Resume reading when no sub queues are above the low mark.
+    def check_resume(self, offset, q=None):
+        if offset not in self.full_subs:
+            return
+
+        if q is not None:
+            low = int(self.conf["max_qsize"] * self.conf["qsize_low"])
+            if q.qsize() > low:
+                return
+
+        self.full_subs.discard(offset)
+        if len(self.full_subs) or not self.paused:
+            return
+
+        transport = self.pipe_events.transport
+        if transport is not None:
+            transport_resume(transport, self.loop, self.paused)
+
+        self.paused = 0
+
+    # Adds a message to every matching bucket.
+    def add_msg(self, data, client_tup, is_norm=False):
         # No subscriptions.
         if not len(self.subs):
             return
         
         # Norm compressed IPv6 addresses.
-        client_tup = client_tup_norm(client_tup)
+        if not is_norm:
+            client_tup = client_tup_norm(client_tup)
 
         # Add message to queue and raise an event.
-        def do_add(q):
+        policy = self.conf["qsize_policy"]
+        def do_add(offset, q):
             # Check queue isn't full.
             if q.full():
-                # TODO: Remove sock from event select.
-                # To give time for queue to be processed.
-                q.get_nowait()
+                self.drops[offset] += 1
+                if policy == QSIZE_DROP_OLDEST:
+                    q.get_nowait()
+                else:
+                    # Newest msg is dropped (data already read
+                    # before a pause is also dropped.)
+                    return
 
             # Put an item on the queue.
             assert(isinstance(client_tup, tuple))
-            q.put_nowait([client_tup, data])
+            q.put_nowait([client_tup, own_data(data)])
+
+            # Stop reading until the consumer catches up.
+            if policy == QSIZE_BACKPRESSURE and q.full():
+                self.pause(offset)
 
-        # Apply bool filters to message.
+        # Only check subs that could match the sender.
         msg_added = False
-        for sub, q, handler in self.subs.values():
-            # Msg pattern, address pattern.
-            b_msg_p, m_client_tup = sub[:2]
-
-            # Check client_addr matches their host pattern.
-            if m_client_tup is not None:
-                # Also check the source port.
-                assert(isinstance(m_client_tup[1], int))
-                if m_client_tup[1]:
-                    if m_client_tup != client_tup:
-                        continue
-
-                # Ignore source port but check IPs.
-                if not m_client_tup[1]:
-                    if m_client_tup[0] != client_tup[0]:
-                        continue
-
-            # Check data matches their message pattern.
-            if b_msg_p:
-                msg_matches = re.findall(b_msg_p, data)
-                if msg_matches == []:
-                    continue
+        for offset in self.sub_index.match(data, client_tup):
+            # Handlers may have unsubscribed.
+            if offset not in self.subs:
+                continue
+
+            _, q, handler = self.subs[offset]
 
             # Execute message using handle instead of adding to queue.
             if handler is not None:
@@ -155,14 +273,14 @@ class PipeClient(ACKUDP):
                     self.pipe_events,
                     handler,
                     client_tup,
-                    data
+                    handler_data(handler, data)
                 )
 
                 continue
 
             # Add message to queue.
             msg_added = True
-            do_add(q)
+            do_add(offset, q)
 
         if not msg_added:
             log(fstr("Discarded {0} = {1}", (client_tup, data,)))
@@ -189,6 +307,9 @@ class PipeClient(ACKUDP):
                 recv_timeout
             )
 
+            # Resume reading if paused by this queue.
+            self.check_resume(offset, q)
+
             # Run handler if one is set.
             if handler is not None:
                 run_handler(
@@ -228,6 +349,10 @@ class PipeClient(ACKUDP):
             # UDP send -- not connected - can be sent to anyone.
             # Single handle for multiplexing.
             if isinstance(handle, DATAGRAM_TYPES):
+                if self.batch is not None:
+                    self.batch.sendto(data, dest_tup)
+                    return 1
+
                 handle.sendto(
                     data,
                     dest_tup
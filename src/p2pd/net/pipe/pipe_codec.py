@@ -0,0 +1,136 @@
+"""
+TCP is a byte stream so a single read may hold part of a message,
+one message, or many messages. Codecs keep a reassembly buffer per
+connection and return every complete frame found after each read.
+Anything left over is kept for the next read.
+
+    - LineCodec: frames end with a delimiter (default new line.)
+    Same as unframed node messages but partial lines are kept.
+    - LenCodec: frames start with a 4 byte big-endian length.
+    Frames may hold any bytes including new lines.
+
+P2PNode only uses a codec if NODE_CONF['msg_codec'] is set or a
+pipe opts in with P2PNode.use_msg_codec. Both peers must agree.
+
+For datagram pipes each packet is already a whole message so
+the tail of a packet is returned as a frame instead of being
+buffered.
+"""
+
+import socket
+import struct
+from ...utility.utils import *
+
+# Frames above this size are treated as a protocol error.
+CODEC_MAX_FRAME = 2 ** 24
+
+LEN_CODEC_HDR = struct.Struct("!I")
+
+class LineCodec():
+    def __init__(self, delim=b"\n", max_frame=CODEC_MAX_FRAME):
+        self.delim = delim
+        self.max_frame = max_frame
+        self.buf = bytearray()
+
+        # Where to resume searching for a delim.
+        self.scan_from = 0
+
+    def encode(self, msg):
+        return to_b(msg) + self.delim
+
+    def decode(self, data, is_stream=True):
+        self.buf += data
+        frames = []
+        start = 0
+        pos = self.buf.find(self.delim, self.scan_from)
+        while pos != -1:
+            frames.append(bytes(self.buf[start:pos]))
+            start = pos + len(self.delim)
+            pos = self.buf.find(self.delim, start)
+
+        # Remove complete frames in one go.
+        if start:
+            del self.buf[:start]
+
+        # Datagrams don't span packets.
+        if not is_stream:
+            if len(self.buf):
+                frames.append(bytes(self.buf))
+
+            self.clear()
+            return frames
+
+        # Don't rescan bytes already checked for the delim.
+        self.scan_from = max(len(self.buf) - len(self.delim) + 1, 0)
+        if len(self.buf) > self.max_frame:
+            log("Line codec frame too large. Clearing buffer.")
+            self.clear()
+
+        return frames
+
+    def clear(self):
+        self.buf = bytearray()
+        self.scan_from = 0
+
+class LenCodec():
+    def __init__(self, max_frame=CODEC_MAX_FRAME):
+        self.max_frame = max_frame
+        self.buf = bytearray()
+
+    def encode(self, msg):
+        msg = to_b(msg)
+        return LEN_CODEC_HDR.pack(len(msg)) + msg
+
+    def decode(self, data, is_stream=True):
+        self.buf += data
+        frames = []
+        view = memoryview(self.buf)
+        p = 0
+        try:
+            while len(view) - p >= LEN_CODEC_HDR.size:
+                size, = LEN_CODEC_HDR.unpack_from(view, p)
+                if size > self.max_frame:
+                    log("Len codec frame too large. Clearing buffer.")
+                    p = len(view)
+                    break
+
+                end = p + LEN_CODEC_HDR.size + size
+                if end > len(view):
+                    break
+
+                frames.append(view[p + LEN_CODEC_HDR.size:end].tobytes())
+                p = end
+        finally:
+            # The buffer can't be resized while a view exists.
+            view.release()
+
+        if p:
+            del self.buf[:p]
+
+        # Partial datagrams are invalid.
+        if not is_stream:
+            self.buf = bytearray()
+
+        return frames
+
+    def clear(self):
+        self.buf = bytearray()
+
+def is_stream_pipe(pipe):
+    sock = getattr(pipe, "sock", None)
+    if sock is None:
+        return False
+
+    return sock.type == socket.SOCK_STREAM
+
+# Get (or create) the codec for a connection.
+def pipe_codec(pipe, codec_class=LineCodec):
+    if pipe.codec is None:
+        pipe.codec = codec_class()
+
+    return pipe.codec
+
+# Decode all complete frames in data received by a pipe.
+def pipe_decode(pipe, data, codec_class=LineCodec):
+    codec = pipe_codec(pipe, codec_class)
+    return codec.decode(data, is_stream_pipe(pipe))
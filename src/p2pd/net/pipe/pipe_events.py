@@ -105,6 +105,9 @@ class PipeEvents(BaseACKProto):
         # For unique messages if enabled.
         self.msg_ids = {}
 
+        # Normalized peer addresses for fast_recv.
+        self.addr_cache = AddrCache(conf["addr_cache_size"])
+
         # Event fired when stream set.
         self.stream_ready = asyncio.Event()
 
@@ -116,6 +119,9 @@ class PipeEvents(BaseACKProto):
         self.is_running = True
         self.proc_lock = None
 
+        # Per-connection frame reassembly (see pipe_codec.)
+        self.codec = None
+
     # Indicates the type of endpoint this is.
     def set_endpoint_type(self, endpoint_type):
         self.endpoint_type = endpoint_type
@@ -127,7 +133,7 @@ class PipeEvents(BaseACKProto):
         self.handler_tasks = rm_done_tasks(self.handler_tasks)
         for handler in handlers:
             # Run the handler as a callback or coroutine.
-            run_handler(self, handler, client_tup, data)
+            run_handler(self, handler, client_tup, handler_data(handler, data))
 
     def get_client_tup(self):
         # Get transport address.
@@ -252,7 +258,7 @@ class PipeEvents(BaseACKProto):
                 self.client_tup = self.get_client_tup()
 
             # Set stream object for doing I/O.
-            self.stream = PipeClient(self, loop=self.loop)
+            self.stream = PipeClient(self, loop=self.loop, conf=self.conf)
             self.stream_ready.set()
 
         # Process messages using any registered handlers.
@@ -278,7 +284,7 @@ class PipeEvents(BaseACKProto):
         for pipe in self.pipes:
             task = create_task(
                 pipe.send(
-                    data,
+                    own_data(data),
                     pipe.sock.getpeername()
                 )
             )
@@ -293,16 +299,21 @@ class PipeEvents(BaseACKProto):
         # there is a need to convert ip to bytes.
         self.stream.add_msg(
             data,
-            (client_tup[0], client_tup[1])
+            (client_tup[0], client_tup[1]),
+            is_norm=True
         )
 
     def handle_data(self, data, client_tup):
-        # Convert data to bytes.
-        if isinstance(data, bytearray):
-            data = bytes(data)
+        if self.conf["fast_recv"]:
+            # Data is only copied if it needs to be kept.
+            client_tup = self.addr_cache.norm(client_tup)
+        else:
+            # Convert data to bytes.
+            if isinstance(data, bytearray):
+                data = bytes(data)
 
-        # Norm IP.
-        client_tup = norm_client_tup(client_tup)
+            # Norm IP.
+            client_tup = norm_client_tup(client_tup)
 
         # Ack UDP msg if enabled.
         if self.is_ack and self.is_ackable:
@@ -316,7 +327,8 @@ class PipeEvents(BaseACKProto):
                 data,
                 self.is_ack,
                 self.is_ackable,
-                lambda buf: self.stream.send(buf, client_tup)
+                lambda buf: self.stream.send(buf, client_tup),
+                ack_key=client_tup
             )
 
             """
@@ -384,11 +396,15 @@ class PipeEvents(BaseACKProto):
             self.transport.shutdown()
         """
 
+        # Write out any queued batched sends.
+        if self.stream is not None and self.stream.batch is not None:
+            self.stream.batch.flush()
+
         # Wait for sending tasks in ACK UDP.
         if self.stream is not None:
-            # Set ACKs for all sent messages.
-            for seq_no in self.stream.seq.keys():
-                self.stream.seq[seq_no].set()
+            # Send any held ACKs and set ACKs for all sent messages.
+            self.stream.sack_flush_all()
+            self.stream.ack_cancel_all()
 
             # Wait for all send loops to end.
             if len(self.stream.ack_send_tasks):
@@ -458,3 +474,43 @@ class PipeEvents(BaseACKProto):
         buf = bytearray().join([b"ECHO ", msg, b"\n"])
         await self.send(buf, dest_tup)
 
+
+"""
+With fast_recv enabled TCP cons read straight into a buffer
+that's reused for every recv call instead of the transport
+allocating a new bytes object per read. Messages are passed
+along as a memoryview over the buffer so anything that keeps
+a message past its callback must copy it (own_data.)
+"""
+if hasattr(asyncio, "BufferedProtocol"):
+    class PipeEventsBuffered(PipeEvents, asyncio.BufferedProtocol):
+        def __init__(self, sock, route=None, loop=None, conf=NET_CONF):
+            super().__init__(sock, route, loop, conf)
+            self.recv_buf = bytearray(conf["reader_limit"])
+            self.recv_view = memoryview(self.recv_buf)
+
+        def get_buffer(self, sizehint):
+            return self.recv_view
+
+        def buffer_updated(self, nbytes):
+            try:
+                if self.transport is None:
+                    log(fstr("Skipping process data cause transport none 3."))
+                    return
+
+                self.handle_data(
+                    self.recv_view[:nbytes],
+                    self.client_tup
+                )
+            except:
+                log_exception()
+else:
+    PipeEventsBuffered = None
+
+# Returns the class used to route messages for a pipe.
+def get_pipe_events_class(proto, dest, conf=NET_CONF):
+    if proto == TCP and dest is not None and conf["fast_recv"]:
+        if PipeEventsBuffered is not None:
+            return PipeEventsBuffered
+
+    return PipeEvents
@@ -0,0 +1,219 @@
+"""
+Subscriptions were originally stored in a flat dict that had to be
+scanned for every message received. Each entry ran a regex over
+the full payload even when the sender didn't match the host
+pattern. That's fine for a few subs but STUN and TURN code
+subscribes to a unique transaction ID for every request so a
+busy pipe can easily have hundreds of subs in it.
+
+The index here groups subs by their host pattern so only subs
+that could match the sender are checked. Within a group message
+patterns are split into:
+
+    (1) Empty patterns -- match any message.
+    (2) Literal patterns -- e.g. re.escape(txid). These are
+    stored in a dict keyed by the literal bytes. The index also
+    remembers the (offset, length) locations where literals have
+    been found before. For a protocol like STUN the TXID is always
+    at the same offset so a match becomes a slice + dict lookup.
+    (3) Regex patterns -- compiled once and checked with search().
+
+Note: remembered offsets are only used when a group has a single
+literal. With more than one, another literal could be anywhere in
+the message so they're all scanned to deliver it to every sub.
+"""
+
+import re
+
+# Max number of (offset, len) pairs to remember for literals.
+SUB_MAX_HINTS = 8
+
+# Used to reverse re.escape on literal patterns.
+SUB_UNESCAPE_P = re.compile(rb"\\(.)", re.DOTALL)
+
+# Return the literal bytes for a pattern if it has no regex meaning.
+def sub_literal(b_msg_p):
+    if not isinstance(b_msg_p, (bytes, bytearray)):
+        return None
+
+    b_msg_p = bytes(b_msg_p)
+    literal = SUB_UNESCAPE_P.sub(rb"\1", b_msg_p)
+    if re.escape(literal) == b_msg_p:
+        return literal
+
+    return None
+
+class SubBucket():
+    def __init__(self):
+        # [offset] = seq.
+        self.any = {}
+
+        # [offset] = [seq, compiled regex].
+        self.regex = {}
+
+        # [literal] = {offset: seq}.
+        self.literal = {}
+
+    def is_empty(self):
+        return not (len(self.any) or len(self.regex) or len(self.literal))
+
+class SubIndex():
+    def __init__(self, max_hints=SUB_MAX_HINTS):
+        # Subs with no host pattern.
+        self.any_host = SubBucket()
+
+        # Subs with an (ip, port) pattern.
+        self.by_tup = {}
+
+        # Subs with an (ip, 0) pattern -- any port.
+        self.by_ip = {}
+
+        # [offset] = [bucket key, kind, key].
+        self.entries = {}
+
+        # Known literal locations in messages.
+        self.hints = []
+        self.max_hints = max_hints
+
+        # Preserves the order subs were added.
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_bucket(self, client_tup, create=False):
+        if client_tup is None:
+            return self.any_host
+
+        # Ignore source port but check IPs.
+        if not client_tup[1]:
+            table = self.by_ip
+            key = client_tup[0]
+        else:
+            table = self.by_tup
+            key = client_tup
+
+        if key not in table:
+            if not create:
+                return None
+
+            table[key] = SubBucket()
+
+        return table[key]
+
+    def drop_bucket(self, client_tup):
+        if client_tup is None:
+            return
+
+        if not client_tup[1]:
+            table = self.by_ip
+            key = client_tup[0]
+        else:
+            table = self.by_tup
+            key = client_tup
+
+        if key in table and table[key].is_empty():
+            del table[key]
+
+    # Client tup must already be normalized.
+    def add(self, offset, b_msg_p, client_tup):
+        if offset in self.entries:
+            return
+
+        self.seq += 1
+        bucket = self.get_bucket(client_tup, create=True)
+        if not b_msg_p:
+            bucket.any[offset] = self.seq
+            self.entries[offset] = [client_tup, "any", None]
+            return
+
+        literal = sub_literal(b_msg_p)
+        if literal is not None:
+            if literal not in bucket.literal:
+                bucket.literal[literal] = {}
+
+            bucket.literal[literal][offset] = self.seq
+            self.entries[offset] = [client_tup, "literal", literal]
+            return
+
+        bucket.regex[offset] = [self.seq, re.compile(b_msg_p)]
+        self.entries[offset] = [client_tup, "regex", None]
+
+    def remove(self, offset):
+        if offset not in self.entries:
+            return
+
+        client_tup, kind, literal = self.entries.pop(offset)
+        bucket = self.get_bucket(client_tup)
+        if bucket is None:
+            return
+
+        if kind == "any":
+            bucket.any.pop(offset, None)
+        if kind == "regex":
+            bucket.regex.pop(offset, None)
+        if kind == "literal":
+            subs = bucket.literal.get(literal, {})
+            subs.pop(offset, None)
+            if not len(subs):
+                bucket.literal.pop(literal, None)
+
+        self.drop_bucket(client_tup)
+
+    def add_hint(self, data, literal):
+        if len(self.hints) >= self.max_hints:
+            return
+
+        hint = (data.find(literal), len(literal))
+        if hint not in self.hints:
+            self.hints.append(hint)
+
+    def match_literals(self, bucket, data, matches):
+        # Check places the only literal was found before.
+        if len(bucket.literal) == 1:
+            data_len = len(data)
+            for start, length in self.hints:
+                end = start + length
+                if end > data_len:
+                    continue
+
+                key = data[start:end]
+                if isinstance(key, memoryview):
+                    key = key.tobytes()
+
+                subs = bucket.literal.get(key)
+                if subs is not None:
+                    matches.update(subs)
+                    return
+
+        # Fallback to a substring scan of all literals.
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+
+        for literal, subs in bucket.literal.items():
+            if literal in data:
+                matches.update(subs)
+                self.add_hint(data, literal)
+
+    # Returns sub offsets that match a message in sub order.
+    def match(self, data, client_tup):
+        buckets = [
+            self.any_host,
+            self.by_tup.get(client_tup),
+            self.by_ip.get(client_tup[0])
+        ]
+
+        matches = {}
+        for bucket in buckets:
+            if bucket is None:
+                continue
+
+            matches.update(bucket.any)
+            if len(bucket.literal):
+                self.match_literals(bucket, data, matches)
+
+            for offset, (seq, regex) in bucket.regex.items():
+                if regex.search(data) is not None:
+                    matches[offset] = seq
+
+        return sorted(matches, key=matches.get)
@@ -25,6 +25,8 @@ from ...utility.utils import *
 from ..net import *
 from ..bind import *
 from .pipe_events import *
+from .pipe_batch import *
+from .pipe_codec import *
 from ..address import Address
 from ..ip_range import IPRange
 from ..address import *
@@ -307,7 +309,8 @@ async def pipe_open(proto, dest=None, route=None, sock=None, msg_cb=None, up_cb=
 
         # Main protocol instance for routing messages.
         #if base_proto is None:
-        pipe_events = PipeEvents(sock=sock, route=route, loop=loop, conf=conf)
+        events_class = get_pipe_events_class(proto, dest, conf)
+        pipe_events = events_class(sock=sock, route=route, loop=loop, conf=conf)
         pipe_events.proto = proto
 
         # Add message handler.
@@ -324,6 +327,12 @@ async def pipe_open(proto, dest=None, route=None, sock=None, msg_cb=None, up_cb=
 
             await pipe_events.stream_ready.wait()
             pipe_events.stream.set_handle(transport, client_tup=None)
+            pipe_events.stream.batch = pipe_batch_setup(
+                pipe_events,
+                transport,
+                loop,
+                conf
+            )
             if dest is not None:
                 pipe_events.set_endpoint_type(TYPE_UDP_CON)
             else:
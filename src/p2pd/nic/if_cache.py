@@ -0,0 +1,197 @@
+"""
+Resolving an interface means getting its external addresses from
+a quorum of STUN servers and then running NAT + delta tests against
+up to a dozen more. That's several seconds every time a node starts
+even though the results rarely change between runs.
+
+IFCache saves resolved interfaces to disk. Entries are keyed by the
+interface name, MAC, and NIC IPs so a machine that moves network
+gets a different key and does a full resolve. Entries older than
+the TTL are ignored.
+
+A node can start from cached interfaces immediately and revalidate
+them in the background. If anything changed the fresh routes + NAT
+details are swapped into the existing Interface objects so code
+holding references to them sees the update.
+"""
+
+import os
+import json
+import time
+import pathlib
+from ..utility.utils import *
+from ..install import get_p2pd_install_root
+from .interface import *
+
+# Seconds a cached interface is used for.
+IF_CACHE_TTL = 60 * 60 * 6
+
+# Home dir / p2pd / if_cache.json.
+def get_if_cache_path(install_root=None):
+    return os.path.realpath(
+        os.path.join(
+            install_root or get_p2pd_install_root(),
+            "if_cache.json"
+        )
+    )
+
+# Changes if the NIC moves to a different network.
+def if_cache_key(if_name, netifaces):
+    addr_infos = netifaces.ifaddresses(if_name)
+    mac = ""
+    if netifaces.AF_LINK in addr_infos:
+        if len(addr_infos[netifaces.AF_LINK]):
+            mac = addr_infos[netifaces.AF_LINK][0].get("addr", "")
+
+    nic_ips = []
+    for af in [netifaces.AF_INET, netifaces.AF_INET6]:
+        for addr_info in addr_infos.get(af, []):
+            if "addr" in addr_info:
+                nic_ips.append(addr_info["addr"])
+
+    return " ".join([to_s(if_name), to_s(mac)] + sorted(nic_ips))
+
+# JSON converts the int AF keys in Interface.to_dict to strings.
+def if_from_cache(d, netifaces):
+    d = copy.deepcopy(d)
+    for field in ["is_default", "rp"]:
+        d[field] = {int(af): v for af, v in d[field].items()}
+
+    interface = Interface.from_dict(d)
+    interface.netifaces = netifaces
+    interface.type = get_interface_type(interface.name)
+    return interface
+
+# Only the parts that come from network tests.
+def if_resolved_info(interface):
+    return [
+        [interface.rp[af].to_dict() for af in VALID_AFS],
+        interface.nat["type"],
+        interface.nat["delta"],
+    ]
+
+# Update an interface in place with fresh results.
+def if_swap_resolved(interface, fresh):
+    interface.rp = fresh.rp
+    for af in VALID_AFS:
+        for route in interface.rp[af].routes:
+            route.interface = interface
+
+    interface.nat = fresh.nat
+    interface.stack = fresh.stack
+    interface.mac = fresh.mac
+    interface.is_default = fresh.is_default
+    return interface
+
+class IFCache():
+    def __init__(self, path=None, ttl=IF_CACHE_TTL):
+        self.path = path or get_if_cache_path()
+        self.ttl = ttl
+        self.entries = {}
+
+    def load(self):
+        # A missing or corrupt cache is just empty.
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, mode="r") as fp:
+                    self.entries = json.load(fp)
+        except Exception:
+            log_exception()
+            self.entries = {}
+
+        return self
+
+    def save(self):
+        try:
+            self.do_save()
+        except Exception:
+            log_exception()
+
+    def do_save(self):
+        pathlib.Path(os.path.dirname(self.path)).mkdir(
+            parents=True,
+            exist_ok=True
+        )
+
+        # Readers never see a partly written file.
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(self.entries, fp)
+
+        os.replace(tmp_path, self.path)
+
+    # Returns None if not cached or expired.
+    def get(self, if_name, netifaces):
+        key = if_cache_key(if_name, netifaces)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        if time.time() - entry["time"] >= self.ttl:
+            del self.entries[key]
+            return None
+
+        try:
+            return if_from_cache(entry["if"], netifaces)
+        except Exception:
+            log_exception()
+            del self.entries[key]
+            return None
+
+    def put(self, interface, netifaces):
+        key = if_cache_key(interface.name, netifaces)
+        self.entries[key] = {
+            "time": time.time(),
+            "if": interface.to_dict(),
+        }
+
+    def remove(self, if_name, netifaces):
+        key = if_cache_key(if_name, netifaces)
+        self.entries.pop(key, None)
+
+"""
+Returns [interfaces, cached interfaces]. Interfaces that aren't
+cached are resolved normally and added to the cache.
+"""
+async def load_interfaces_cached(if_names, netifaces, cache):
+    nics = []
+    cached = []
+    misses = []
+    for if_name in if_names:
+        nic = cache.get(if_name, netifaces)
+        if nic is None:
+            misses.append(if_name)
+        else:
+            cached.append(nic)
+
+    nics += cached
+    if len(misses):
+        fresh = await load_interfaces(misses)
+        for nic in fresh:
+            cache.put(nic, netifaces)
+
+        nics += fresh
+        cache.save()
+
+    return nics, cached
+
+# Returns a list of the interfaces that changed.
+async def refresh_interfaces(nics, netifaces, cache):
+    changed = []
+    for nic in nics:
+        fresh = await load_interfaces([nic.name])
+
+        # Keep using the cached details.
+        if not len(fresh):
+            continue
+
+        fresh = fresh[0]
+        if if_resolved_info(fresh) != if_resolved_info(nic):
+            if_swap_resolved(nic, fresh)
+            changed.append(nic)
+
+        # Resets the TTL.
+        cache.put(fresh, netifaces)
+
+    cache.save()
+    return changed
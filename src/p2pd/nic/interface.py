@@ -455,8 +455,7 @@ class Interface():
             self.rp[af] = RoutePool()
 
             # Used to resolve nic addresses.
-            servs = STUN_MAP_SERVERS[UDP][af]
-            random.shuffle(servs[:max(20, max_agree)])
+            servs = STUN_POOL.order(STUN_MAP_SERVERS[UDP][af], af, UDP)
             stun_clients = await get_stun_clients(
                 af,
                 max_agree,
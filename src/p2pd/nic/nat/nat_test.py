@@ -164,7 +164,7 @@ async def fast_nat_test(pipe, test_no=NAT_TEST_NO, timeout=NAT_TEST_TIMEOUT):
     # Use a random portion of change servers for
     # the NAT test.
     serv_list = STUN_CHANGE_SERVERS[UDP][pipe.route.af]
-    serv_list = list_clone_rand(serv_list, test_no)
+    serv_list = STUN_POOL.pick(serv_list, test_no, pipe.route.af, UDP)
     test_servers = serv_list
 
     # Store STUN request results here.
@@ -6,6 +6,7 @@ make servers appear broken when they're not.
 import asyncio
 import hashlib
 from ..nic.interface import load_interfaces
+from ..nic.if_cache import *
 from ..net.daemon import *
 from .p2p_addr import *
 from .p2p_utils import *
@@ -16,6 +17,25 @@ NODE_CONF = dict_child({
     "reuse_addr": False,
     "enable_upnp": True,
     "sig_pipe_no": SIGNAL_PIPE_NO,
+
+    # Max signal msg publishes in progress at once.
+    "sig_workers": SIG_DISPATCH_WORKERS,
+
+    # Max signal msgs joined into one publish.
+    # Only raise this if all peers split batched publishes.
+    "sig_max_batch": SIG_DISPATCH_MAX_BATCH,
+
+    # Codec for framing messages on node connections.
+    # None = each read is split on new lines (unframed.)
+    # Both sides of a con must use the same codec.
+    "msg_codec": None,
+
+    # Start from interfaces resolved within this many secs.
+    # They're revalidated in the background. 0 = disable.
+    "if_cache_ttl": IF_CACHE_TTL,
+
+    # Keep STUN server stats across restarts.
+    "save_stun_pool": True,
 }, NET_CONF)
 
 # Main class for the P2P node server.
@@ -47,14 +67,17 @@ class P2PNode(P2PNodeExtra, Daemon):
         # Signal protocol class instance.
         self.sig_proto_handlers = SigProtoHandlers(self)
         self.sig_msg_queue = asyncio.Queue()
-        self.sig_msg_dispatcher_task = None
+        self.sig_dispatcher = None
 
         # Fixed reference for long-running tasks.
         self.tasks = []
 
         # Watch for idle connections.
-        self.last_recv_table = {} # [pipe] -> time
-        self.last_recv_queue = [] # FIFO pipe ref
+        self.idle_pipes = IdlePipes()
+
+        # Background check of cached interfaces.
+        self.if_cache = None
+        self.if_refresh_task = None
 
         # Set on start.
         self.addr_bytes = None
@@ -63,48 +86,90 @@ class P2PNode(P2PNodeExtra, Daemon):
     def add_msg_cb(self, msg_cb):
         self.msg_cbs.append(msg_cb)
 
+    # Opt a pipe into framed messages.
+    def use_msg_codec(self, pipe, codec_class=LineCodec):
+        return pipe_codec(pipe, codec_class)
+
+    # Codec for a node pipe or None if it's unframed.
+    def msg_codec(self, pipe):
+        if getattr(pipe, "codec", None) is None:
+            if self.conf["msg_codec"] is None:
+                return None
+
+            pipe_codec(pipe, self.conf["msg_codec"])
+
+        return pipe.codec
+
+    # Frame a message for a node pipe.
+    def frame_msg(self, pipe, msg):
+        codec = self.msg_codec(pipe)
+        if codec is None:
+            return to_b(msg) + b"\n"
+
+        return codec.encode(msg)
+
     # Used by the node servers.
     async def msg_cb(self, msg, client_tup, pipe):
         """
         TCP is stream-orientated and may buffer small sends.
-        New lines end messages. So multiple messages can
-        be read by splitting at a new line. Excluding
-        complex cases of partial replies (who cares for now.)
-
-        TODO: implement actual buffered protocol.
+        Unframed pipes split each read at new lines. Pipes
+        with a codec keep partial messages until the rest
+        arrives and return all complete messages per read.
         """
 
         # Recv a message for a pipe being monitored for idleness.
-        if pipe in self.last_recv_queue:
-            self.last_recv_table[pipe.sock] = time.time()
+        self.idle_pipes.touch(pipe)
+
+        codec = self.msg_codec(pipe)
+        if codec is None:
+            msgs = msg.split(b"\n")
+        else:
+            msgs = codec.decode(msg, is_stream_pipe(pipe))
+            if not len(msgs):
+                return
+
+        # The node protocol gets every message from the read.
+        await node_protocol(self, msgs, client_tup, pipe)
 
-        msgs = msg.split(b"\n")
+        # Pass messages directly to clients own handlers.
+        # Don't interfere so they can write their own protocol.
         for msg in msgs:
-            # Pass messages directly to clients own handlers.
-            # Don't interfere so they can write their own protocol.
-            await node_protocol(self, msg, client_tup, pipe)
             for msg_cb in self.msg_cbs:
                 run_handler(pipe, msg_cb, client_tup, msg)
     
     # Used by the MQTT clients.
     async def signal_protocol(self, msg, signal_pipe):
-        out = await async_wrap_errors(
-            self.sig_proto_handlers.proto(msg)
-        )
-
-        if isinstance(out, SigMsg):
-            await signal_pipe.send_msg(
-                out,
-                out.routing.dest["node_id"]
+        # A publish may hold several messages.
+        for buf in sig_msg_split(msg):
+            out = await async_wrap_errors(
+                self.sig_proto_handlers.proto(buf)
             )
 
+            if isinstance(out, SigMsg):
+                await signal_pipe.send_msg(
+                    out,
+                    out.routing.dest["node_id"]
+                )
+
     async def start(self, sys_clock=None, out=False):
         # Load ifs.
         t = time.time()
+        if self.conf["save_stun_pool"]:
+            STUN_POOL.load()
+
+        cached_ifs = []
         if not len(self.ifs):
             try:
                 if_names = await list_interfaces()
-                self.ifs = await load_interfaces(if_names)
+                if self.conf["if_cache_ttl"]:
+                    self.if_cache = IFCache(ttl=self.conf["if_cache_ttl"])
+                    self.ifs, cached_ifs = await load_interfaces_cached(
+                        if_names,
+                        Interface.get_netifaces(),
+                        self.if_cache.load()
+                    )
+                else:
+                    self.ifs = await load_interfaces(if_names)
             except:
                 log_exception()
                 self.ifs = []
@@ -249,6 +314,17 @@ class P2PNode(P2PNodeExtra, Daemon):
             self.sys_clock,
         )
 
+        if self.conf["save_stun_pool"]:
+            STUN_POOL.save()
+
+        # Check cached interfaces are still right.
+        if len(cached_ifs):
+            self.if_refresh_task = create_task(
+                async_wrap_errors(
+                    self.refresh_ifs(cached_ifs)
+                )
+            )
+
         return self
     
     def __await__(self):
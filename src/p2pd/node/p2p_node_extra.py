@@ -6,9 +6,11 @@ from ..traversal.tcp_punch.tcp_punch_client import PUNCH_CONF
 from .p2p_utils import *
 from .p2p_pipe import *
 from .signaling import *
+from .sig_dispatch import *
 from ..protocol.stun.stun_client import get_stun_clients
 from ..nic.nat.nat_utils import USE_MAP_NO
 from ..install import *
+from ..nic.if_cache import *
 from ..vendor.ecies import encrypt, decrypt
 import asyncio
 import pathlib
@@ -81,33 +83,48 @@ class P2PNodeExtra():
                     conf=PUNCH_CONF,
                 )
 
-    async def punch_queue_worker(self):
+    async def run_puncher(self, puncher, limit):
         try:
-            params = await self.punch_queue.get()
-            if params is None:
-                return
-            
-            if len(params):
+            await puncher.setup_punching_process()
+        finally:
+            limit.release()
+
+    """
+    One worker runs for the life of the node. At most max_punchers
+    punches run at once (one process each.) Each punch has its own
+    deadline in setup_punching_process.
+    """
+    async def punch_queue_worker(self):
+        limit = asyncio.Semaphore(max(1, self.max_punchers))
+        while 1:
+            try:
+                params = await self.punch_queue.get()
+                if params is None:
+                    return
+                
+                if not len(params):
+                    continue
+
                 pipe_id = params[0]
-                if pipe_id in self.tcp_punch_clients:
-                    puncher = self.tcp_punch_clients[pipe_id]
-                    task = create_task(
-                        async_wrap_errors(
-                            puncher.setup_punching_process()
-                        )
-                    )
+                if pipe_id not in self.tcp_punch_clients:
+                    continue
 
-                    # Avoid garbage collection for this task.
-                    self.tasks.append(task)
+                # Wait for a free slot.
+                await limit.acquire()
+                puncher = self.tcp_punch_clients[pipe_id]
+                task = create_task(
+                    async_wrap_errors(
+                        self.run_puncher(puncher, limit)
+                    )
+                )
 
-            self.punch_worker_task = create_task(
-                self.punch_queue_worker()
-            )
-        except RuntimeError:
-            log_exception()
-            return
-        except:
-            log_exception()
+                # Avoid garbage collection for this task.
+                self.tasks = rm_done_tasks(self.tasks)
+                self.tasks.append(task)
+            except asyncio.CancelledError:
+                raise
+            except:
+                log_exception()
         
     def start_punch_worker(self):
         self.punch_worker_task = create_task(
@@ -283,7 +300,8 @@ class P2PNodeExtra():
 
         return overlap + non_overlap
 
-    async def await_peer_con(self, msg, vk=None, m=0, relay_no=2):
+    # Encode a signal message for publishing.
+    def sig_msg_buf(self, msg, vk=None):
         # Encrypt the message if the public key is known.
         buf = b"\0" + msg.pack()
         dest_node_id = msg.routing.dest["node_id"]
@@ -301,12 +319,22 @@ class P2PNodeExtra():
             )
 
         # UTF-8 messes up binary data in MQTT.
-        buf = to_h(buf)
+        return to_b(to_h(buf))
+
+    async def await_peer_con(self, msg, vk=None, m=0, relay_no=2):
+        dest = msg.routing.dest
+        return await self.send_sig_buf(
+            self.sig_msg_buf(msg, vk),
+            dest["node_id"],
+            dest["signal"],
+            m,
+            relay_no
+        )
 
+    # Publish encoded signal message(s) to a node.
+    async def send_sig_buf(self, buf, dest_node_id, offsets, m=0, relay_no=2):
         # Try not to load a new signal pipe if
         # one already exists for the dest.
-        dest = msg.routing.dest
-        offsets = dest["signal"]
         offsets = self.prioritize_sig_pipe_overlap(offsets)
 
         # Try signal pipes in order.
@@ -340,7 +368,7 @@ class P2PNodeExtra():
             sent = await async_wrap_errors(
                 sig_pipe.send_msg(
                     buf,
-                    to_s(dest["node_id"])
+                    to_s(dest_node_id)
                 )
             )
 
@@ -355,35 +383,14 @@ class P2PNodeExtra():
         # TODO: no paths to host.
         # Need fallback plan here.
 
-    async def sig_msg_dispatcher(self):
-        try:
-            x = await self.sig_msg_queue.get()
-            if x is None:
-                return
-            else:
-                msg, vk, m = x
-            
-            await async_wrap_errors(
-                self.await_peer_con(
-                    msg,
-                    vk,
-                    m,
-                )
-            )
-
-            self.sig_msg_dispatcher_task = create_task(
-                self.sig_msg_dispatcher()
-            )
-        except RuntimeError:
-            log_exception()
-            return
-        
     def start_sig_msg_dispatcher(self):
         # Route messages to destination.
-        if self.sig_msg_dispatcher_task is None:
-            self.sig_msg_dispatcher_task = create_task(
-                self.sig_msg_dispatcher()
-            )
+        if self.sig_dispatcher is None:
+            self.sig_dispatcher = SigDispatcher(
+                self,
+                workers=self.conf["sig_workers"],
+                max_batch=self.conf["sig_max_batch"]
+            ).start()
 
     async def close_idle_pipes(self):
         """
@@ -394,42 +401,43 @@ class P2PNodeExtra():
         for the idle count down based on urgency (remaining
         processes) in reference to a min and max idle interval.)
         """
-        floor_check = 300
-        ceil_check = 7200
-        alloc_pcent = self.active_punchers / self.max_punchers
-        num_space = ceil_check - floor_check
-        rel_placement = num_space * alloc_pcent
-        abs_placement = ceil_check - rel_placement
-        cur_time = time.time()
         while 1:
-            # Check the list of oldest monitored pipes to least.
-            close_list = []
-            for pipe in self.last_recv_queue:
-                # Get last recv time.
-                last_recv = self.last_recv_table[pipe.sock]
-                elapsed = cur_time - last_recv
-
-                # No time passed.
-                if elapsed <= 0:
-                    break
-                
-                # Sorted by time so >= this aren't expired.
-                if elapsed < abs_placement:
-                    break
-
-                # Record pipe to close.
-                if elapsed >= abs_placement:
-                    close_list.append(pipe)
-
-            # Don't change the prev list we're iterating.
-            # Close these idle connections.
-            for pipe in close_list:
-                self.last_recv_queue.remove(pipe)
-                del self.last_recv_table[pipe.sock]
-                await pipe.close()
+            # Urgency changes as punchers start and finish.
+            idle_secs = idle_timeout(
+                self.active_punchers,
+                self.max_punchers
+            )
+
+            # Only the expired pipes at the front are visited.
+            for pipe in self.idle_pipes.pop_expired(idle_secs):
+                await async_wrap_errors(pipe.close())
 
             # Don't tie up event loop
-            await asyncio.sleep(5)
+            await asyncio.sleep(IDLE_CHECK_SECS)
+
+    # Revalidate interfaces loaded from the cache.
+    async def refresh_ifs(self, cached_ifs):
+        changed = await refresh_interfaces(
+            cached_ifs,
+            Interface.get_netifaces(),
+            self.if_cache
+        )
+
+        if not len(changed):
+            return
+
+        # External addresses may have changed.
+        for nic in changed:
+            self.log("if", fstr("Refreshed {0}", (nic.name,)))
+
+        self.addr_bytes = make_peer_addr(
+            self.node_id,
+            self.machine_id,
+            self.ifs,
+            list(self.signal_pipes),
+            port=self.listen_port,
+        )
+        self.p2p_addr = parse_peer_addr(self.addr_bytes)
 
     async def load_machine_id(self, app_id, netifaces):
         # Set machine id.
@@ -464,11 +472,16 @@ class P2PNodeExtra():
             self.punch_worker_task.cancel()
             self.punch_worker_task = None
 
+        # Stop checking cached interfaces.
+        if self.if_refresh_task is not None:
+            self.if_refresh_task.cancel()
+            self.if_refresh_task = None
+
         # Stop sig message dispatcher.
         self.sig_msg_queue.put_nowait(None)
-        if self.sig_msg_dispatcher_task is not None:
-            self.sig_msg_dispatcher_task.cancel()
-            self.sig_msg_dispatcher_task = None
+        if self.sig_dispatcher is not None:
+            await self.sig_dispatcher.close()
+            self.sig_dispatcher = None
 
         # Close other pipes.
         pipe_lists = [
@@ -501,6 +514,9 @@ class P2PNodeExtra():
         
         """
 
+        if self.conf["save_stun_pool"]:
+            STUN_POOL.save()
+
         # Stop node server.
         await super().close()
         await asyncio.sleep(.25)
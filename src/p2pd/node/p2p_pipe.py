@@ -140,7 +140,8 @@ class P2PPipe():
         if pipe.sock is None:
             return
 
-        await pipe.send(CON_ID_MSG + to_b(fstr(" {0}\n", (pipe_id,))))
+        msg = CON_ID_MSG + to_b(fstr(" {0}", (pipe_id,)))
+        await pipe.send(self.node.frame_msg(pipe, msg))
         self.node.pipe_ready(pipe_id, pipe)
         return pipe
 
@@ -275,8 +276,7 @@ class P2PPipe():
         pipe = await self.node.pipes[pipe_id]
 
         # Watch this pipe for idleness.
-        self.node.last_recv_table[pipe.sock] = time.time()
-        self.node.last_recv_queue.append(pipe)
+        self.node.idle_pipes.watch(pipe)
 
         # Close pipe if ping times out.
         return pipe
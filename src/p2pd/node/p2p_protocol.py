@@ -142,12 +142,21 @@ class SigProtoHandlers():
             self.node.log("net", fstr("unknown handling {0}", (buf,)))
             log_exception()
     
-async def node_protocol(self, msg, client_tup, pipe):
+# Handle all complete frames from a single read.
+async def node_protocol(self, msgs, client_tup, pipe):
+    for msg in msgs:
+        await node_proto_msg(self, msg, client_tup, pipe)
+
+async def node_proto_msg(self, msg, client_tup, pipe):
     log(fstr("> node proto = {0}, {1}", (msg, client_tup,)))
 
     # Simplified echo proto.
     if msg == b"long_p2pd_test_string_abcd123":
-        await pipe.send(b"p2pd test string\r\n\r\n", client_tup)
+        buf = b"p2pd test string\r\n\r\n"
+        if self.msg_codec(pipe) is not None:
+            buf = self.frame_msg(pipe, b"p2pd test string")
+
+        await pipe.send(buf, client_tup)
         return
     
     # Execute basic services of the node protocol.
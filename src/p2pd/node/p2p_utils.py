@@ -3,6 +3,8 @@ from concurrent.futures import ProcessPoolExecutor
 import hashlib
 import os
 import socket
+import time
+from collections import OrderedDict
 from ..settings import *
 from ..utility.utils import *
 from ..net.address import Address
@@ -18,6 +20,73 @@ CON_ID_MSG = b"P2P_CON_ID_EQ"
 
 f_path_txt = lambda x: "local" if x == NIC_BIND else "external"
 
+# Min and max seconds a P2P pipe may be idle before it's closed.
+IDLE_FLOOR_SECS = 300
+IDLE_CEIL_SECS = 7200
+
+# Seconds between checks for idle pipes.
+IDLE_CHECK_SECS = 5
+
+"""
+Pipes being watched for idleness ordered by last recv time.
+Updating a pipe moves it to the end so the oldest pipes are
+always at the front. Checks and updates are O(1) and
+finding expired pipes only looks at the pipes that expired.
+"""
+class IdlePipes():
+    def __init__(self):
+        # [pipe] = last recv time -- oldest first.
+        self.last_recv = OrderedDict()
+
+    def __len__(self):
+        return len(self.last_recv)
+
+    def __contains__(self, pipe):
+        return pipe in self.last_recv
+
+    def watch(self, pipe, now=None):
+        self.touch(pipe, now, add=True)
+
+        # Stop watching pipes closed elsewhere.
+        if hasattr(pipe, "add_end_cb"):
+            pipe.add_end_cb(self.on_end)
+
+    def touch(self, pipe, now=None, add=False):
+        if not add and pipe not in self.last_recv:
+            return
+
+        self.last_recv[pipe] = now or time.time()
+        self.last_recv.move_to_end(pipe)
+
+    def remove(self, pipe):
+        self.last_recv.pop(pipe, None)
+
+    def on_end(self, msg, client_tup, pipe):
+        self.remove(pipe)
+
+    # Remove and return pipes idle for at least idle_secs.
+    def pop_expired(self, idle_secs, now=None):
+        now = now or time.time()
+        expired = []
+        while len(self.last_recv):
+            pipe, last_recv = next(iter(self.last_recv.items()))
+            if now - last_recv < idle_secs:
+                break
+
+            self.last_recv.popitem(last=False)
+            expired.append(pipe)
+
+        return expired
+
+# Idle limit shrinks as the process pool fills up.
+def idle_timeout(active, max_active):
+    if not max_active:
+        return IDLE_CEIL_SECS
+
+    alloc_pcent = min(active / max_active, 1)
+    num_space = IDLE_CEIL_SECS - IDLE_FLOOR_SECS
+    return IDLE_CEIL_SECS - (num_space * alloc_pcent)
+
 def init_process_pool():
     # Make selector default event loop.
     # On Windows this changes it from proactor to selector.
@@ -0,0 +1,169 @@
+"""
+Signal messages used to be sent one at a time. Each send had to
+encrypt the message and publish it to several MQTT servers before
+the next message could go out so every connection attempt waited
+behind the slowest broker.
+
+The dispatcher here sends with a pool of workers:
+
+    - Messages are grouped by destination node, signal servers,
+    and strategy no (which picks the first server to try.)
+    - Only one publish per group is in progress at a time so
+    messages to a peer still arrive in order.
+    - Optionally, messages that queue up for a group while it's
+    publishing are sent together as one publish. The hex encoded
+    messages are joined with spaces (hex never has spaces.)
+
+The receiver splits a publish on spaces and handles each message.
+Older nodes expect one message per publish so batching changes the
+wire format. It's off by default (max_batch = 1) and should only be
+turned on when every peer is known to split publishes.
+"""
+
+import asyncio
+import time
+from ..utility.utils import *
+
+# Max publishes in progress at once.
+SIG_DISPATCH_WORKERS = 8
+
+# Max messages to join into one publish.
+# 1 = one message per publish (understood by all peers.)
+SIG_DISPATCH_MAX_BATCH = 1
+
+SIG_MSG_SEP = b" "
+
+# Split a received publish into its signal messages.
+def sig_msg_split(payload):
+    return [buf for buf in to_b(payload).split(SIG_MSG_SEP) if len(buf)]
+
+class SigDispatcher():
+    def __init__(self, node, workers=SIG_DISPATCH_WORKERS, max_batch=SIG_DISPATCH_MAX_BATCH):
+        self.node = node
+        self.queue = node.sig_msg_queue
+        self.worker_no = workers
+        self.max_batch = max_batch
+
+        # [group] = [[buf, queued at], ...]
+        self.pending = {}
+
+        # Groups with a publish in progress.
+        self.active = set()
+
+        # Groups waiting for a worker.
+        self.ready = asyncio.Queue()
+        self.tasks = []
+
+        # Metrics.
+        self.msg_count = 0
+        self.publish_count = 0
+        self.latency_total = 0
+        self.latency_max = 0
+
+    # Messages waiting to be published.
+    def depth(self):
+        pending = sum([len(bufs) for bufs in self.pending.values()])
+        return self.queue.qsize() + pending
+
+    def latency_avg(self):
+        if not self.msg_count:
+            return 0
+
+        return self.latency_total / self.msg_count
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "msgs": self.msg_count,
+            "publishes": self.publish_count,
+            "latency_avg": self.latency_avg(),
+            "latency_max": self.latency_max,
+        }
+
+    def start(self):
+        self.tasks.append(create_task(self.feeder()))
+        for _ in range(0, self.worker_no):
+            self.tasks.append(create_task(self.worker()))
+
+        return self
+
+    def group_key(self, msg, m):
+        dest = msg.routing.dest
+        return (to_s(dest["node_id"]), tuple(dest["signal"]), m)
+
+    def add(self, msg, vk, m):
+        # Messages are encoded up front so a batch is one join.
+        buf = self.node.sig_msg_buf(msg, vk)
+        key = self.group_key(msg, m)
+        if key not in self.pending:
+            self.pending[key] = []
+
+            # Wake a worker unless the group is already running.
+            # It will be requeued when that publish finishes.
+            if key not in self.active:
+                self.ready.put_nowait(key)
+
+        self.pending[key].append([buf, time.time()])
+
+    async def feeder(self):
+        while 1:
+            x = await self.queue.get()
+            if x is None:
+                return
+
+            msg, vk, m = x
+            try:
+                self.add(msg, vk, m)
+            except Exception:
+                log_exception()
+
+    async def worker(self):
+        while 1:
+            key = await self.ready.get()
+            if key is None:
+                return
+
+            await self.publish(key)
+
+    async def publish(self, key):
+        bufs = self.pending.pop(key, [])
+        if len(bufs) > self.max_batch:
+            self.pending[key] = bufs[self.max_batch:]
+            bufs = bufs[:self.max_batch]
+
+        self.active.add(key)
+        try:
+            # Any msg has the same route for its group.
+            dest_node_id, signal, m = key
+            await async_wrap_errors(
+                self.node.send_sig_buf(
+                    SIG_MSG_SEP.join([buf for buf, _ in bufs]),
+                    dest_node_id,
+                    list(signal),
+                    m
+                )
+            )
+        finally:
+            self.active.discard(key)
+
+        # Record how long messages waited to be sent.
+        now = time.time()
+        self.publish_count += 1
+        for _, queued in bufs:
+            latency = now - queued
+            self.msg_count += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+        # More msgs were queued during the publish.
+        if key in self.pending:
+            self.ready.put_nowait(key)
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+        if len(self.tasks):
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        self.tasks = []
@@ -2,15 +2,91 @@ import asyncio
 import struct
 import random
 from struct import pack
+from collections import OrderedDict
 from ..utility.utils import *
+from ..utility.timer_wheel import *
 
 UDP_MAX_DICT_LEN = 1000
 
+# Flag byte after the seq no in ACK UDP messages.
+ACK_FLAG_DATA = 0
+ACK_FLAG_ACK = 1
+ACK_FLAG_SACK = 2
+
+# Data from a sender that understands SACK frames.
+ACK_FLAG_DATA_SACK = 3
+
+"""
+A SACK frame acknowledges many messages at once. Its seq field
+holds the number of ranges in the frame. Each range is a start
+seq and the number of consecutive seqs it covers.
+"""
+def sack_encode(seqs):
+    ranges = []
+    for seq in sorted(set(seqs)):
+        if len(ranges) and ranges[-1][0] + ranges[-1][1] == seq:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([seq, 1])
+
+    buf = bytearray(struct.pack("!QB", len(ranges), ACK_FLAG_SACK))
+    for start, run in ranges:
+        buf += struct.pack("!QI", start, run)
+
+    return bytes(buf)
+
+def sack_decode(data):
+    range_no, = struct.unpack("!Q", data[0:8])
+    range_no = min(range_no, (len(data) - 9) // 12)
+    ranges = []
+    for i in range(0, range_no):
+        ranges.append(struct.unpack_from("!QI", data, 9 + (i * 12)))
+
+    return ranges
+
+# Retransmission timeouts in seconds (RFC 6298.)
+ACK_INIT_RTO = 1
+ACK_MIN_RTO = 0.2
+ACK_MAX_RTO = 60
+ACK_RTT_ALPHA = 1 / 8
+ACK_RTT_BETA = 1 / 4
+
+"""
+Smoothed round-trip time for a destination. Used to work out how
+long to wait for an ACK before retransmitting. Only messages that
+weren't retransmitted are sampled (Karn's algorithm) as it's not
+known which transmit an ACK is for otherwise.
+"""
+class RTTEstimator():
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = ACK_INIT_RTO
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - ACK_RTT_BETA) * self.rttvar
+            self.rttvar += ACK_RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ACK_RTT_ALPHA) * self.srtt
+            self.srtt += ACK_RTT_ALPHA * rtt
+
+        rto = self.srtt + max(TIMER_TICK, 4 * self.rttvar)
+        self.rto = min(max(rto, ACK_MIN_RTO), ACK_MAX_RTO)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, ACK_MAX_RTO)
+
 """
 Extended functionality to allow the UDP stream class
 to provide 'reliable' packet delivery. It uses message
 IDs for each message and acknowledgements. It doesn't
 guarantee ordered delivery. Inherited by udp_stream.
+
+Retransmissions for all messages are handled by one timer
+wheel instead of a coroutine per message.
 """
 
 class ACKUDP():
@@ -18,31 +94,50 @@ class ACKUDP():
         self.seq = {} # Waiting for acks.
         self.ack_send_tasks = []
 
+        # [seq] = retransmission state for sent msgs.
+        self.ack_pending = {}
+
+        # [dest_tup] = RTTEstimator (least recently used first.)
+        self.rtts = OrderedDict()
+        self.ack_timers = TimerWheel()
+
+        # Seconds to hold ACKs to send as one SACK. 0 = off.
+        self.sack_delay = 0
+        self.sack_max = 64
+
+        # [ack_key] = [seqs, f_send, timer].
+        self.sack_queue = {}
+
     # Returns a sequence number if a message is an ack.
+    # SACK frames return a list of [start seq, run] ranges.
     def is_ack(self, data, stream):
         if len(data) >= 9:
             seq, = struct.unpack("!Q", data[0:8])
             is_ack = data[8]
-            if is_ack == 1:
+            if is_ack == ACK_FLAG_ACK:
                 return seq
 
+            if is_ack == ACK_FLAG_SACK:
+                return sack_decode(data)
+
         return None
 
     # Received message that needs to be acked.
     # Return its sequence number and valid ack response.
+    # The last field says whether the sender accepts SACKs.
     def is_ackable(self, data, stream):
         payload = ack = is_ack = seq = None
         if len(data) >= 9:
             seq, = struct.unpack("!Q", data[0:8])
             is_ack = data[8]
         else:
-            return [None, None, None]
+            return [None, None, None, False]
 
-        if is_ack == 0:
+        if is_ack in (ACK_FLAG_DATA, ACK_FLAG_DATA_SACK):
             # Build ack message to send in response.
-            ack = struct.pack("!Q", seq) + struct.pack("!B", 1)
+            ack = struct.pack("!Q", seq) + struct.pack("!B", ACK_FLAG_ACK)
 
-        return [seq, ack, data[9:]]
+        return [seq, ack, data[9:], is_ack == ACK_FLAG_DATA_SACK]
 
     """
     Clients that receive a message that can be 'acked' now
@@ -51,26 +146,38 @@ class ACKUDP():
     don't know if the receiver has actually gotten the ack
     yet. Keep code to skip acking if a peer sent a message.
     This prevents getting into loops for the sender.
+
+    If SACKs are enabled and the sender supports them ACKs are
+    queued per ack_key (the senders address) and sent as one
+    frame after sack_delay.
     """
-    def handle_ack(self, data, f_is_ack, f_is_ackable, f_send):
+    def handle_ack(self, data, f_is_ack, f_is_ackable, f_send, ack_key=None):
         self.ack_send_tasks = rm_done_tasks(self.ack_send_tasks)
         data = data
         payload = recv_seq = ack_seq = ack = None
+        sack_ok = False
         self.timestamp = timestamp()
 
         # If this message is an ack then record its seq no.
         if f_is_ack is not None:
             ack_seq = f_is_ack(data, self)
             if ack_seq is not None:
-                if ack_seq in self.seq:
-                    self.seq[ack_seq].set()
+                if isinstance(ack_seq, list):
+                    for start, run in ack_seq:
+                        self.ack_range(start, run)
+                else:
+                    self.ack_received(ack_seq)
 
                 return 0, payload
 
         # If it's a regular message check if it needs
         # to be acknowledged and record the seq no.
         if f_is_ackable is not None:
-            recv_seq, ack, payload = f_is_ackable(data, self)
+            out = f_is_ackable(data, self)
+            recv_seq, ack, payload = out[:3]
+            if len(out) > 3:
+                sack_ok = out[3]
+
             if payload is None:
                 return 0, None
 
@@ -80,20 +187,21 @@ class ACKUDP():
                 # even if they didn't set the ACK flag.
                 if recv_seq in self.seq:
                     # Pretend we received an ACK for our message.
-                    self.seq[recv_seq].set()
+                    self.ack_received(recv_seq)
 
                     # Don't broadcast an ACK for this.
                     ack = None
 
-        # Keep dicts from taking up too much memory.
-        if len(self.seq) > UDP_MAX_DICT_LEN:
-            self.seq = {}
-
         """
         The TURN client implements a custom is_ackable that wraps an ACK
         in a channel message which allows the server to deliver the message.
         """
         if ack is not None:
+            # Coalesce ACKs into a SACK.
+            if sack_ok and self.sack_delay and ack_key is not None:
+                self.sack_add(ack_key, recv_seq, f_send)
+                return 2, payload
+
             task = asyncio.create_task(
                 async_wrap_errors(
                     f_send(ack)
@@ -105,12 +213,144 @@ class ACKUDP():
 
         return 1, payload
 
+    def get_rtt(self, dest_tup):
+        if dest_tup in self.rtts:
+            self.rtts.move_to_end(dest_tup)
+            return self.rtts[dest_tup]
+
+        # Keep dicts from taking up too much memory.
+        # Only the oldest peer's estimate is lost.
+        self.rtts[dest_tup] = RTTEstimator()
+        if len(self.rtts) > UDP_MAX_DICT_LEN:
+            self.rtts.popitem(last=False)
+
+        return self.rtts[dest_tup]
+
+    # Stop retransmitting a message.
+    def ack_finish(self, seq, status, sample=False):
+        pending = self.ack_pending.pop(seq, None)
+        event = self.seq.pop(seq, None)
+        if pending is None:
+            return
+
+        self.ack_timers.cancel(pending["timer"])
+        if status:
+            # Only sample RTT for msgs sent once.
+            if sample and pending["transmits"] == 1:
+                rtt = self.ack_timers.get_loop().time() - pending["sent"]
+                self.get_rtt(pending["dest"]).update(rtt)
+
+            if event is not None:
+                event.set()
+
+        if not pending["done"].done():
+            pending["done"].set_result(status)
+
+    def ack_received(self, seq):
+        if seq in self.ack_pending:
+            self.ack_finish(seq, 1, sample=True)
+            return
+
+        # Seq may be registered without a pending send.
+        if seq in self.seq:
+            self.seq.pop(seq).set()
+
+    # ACK all pending seqs in [start, start + run).
+    def ack_range(self, start, run):
+        if run == 1:
+            self.ack_received(start)
+            return
+
+        # Avoid walking huge ranges.
+        if run > len(self.ack_pending):
+            seqs = [seq for seq in self.ack_pending if start <= seq < start + run]
+        else:
+            seqs = range(start, start + run)
+
+        for seq in seqs:
+            self.ack_received(seq)
+
+    def sack_add(self, ack_key, seq, f_send):
+        if ack_key not in self.sack_queue:
+            timer = self.ack_timers.add(
+                self.sack_delay,
+                self.sack_flush,
+                ack_key
+            )
+            self.sack_queue[ack_key] = [[], f_send, timer]
+
+        seqs = self.sack_queue[ack_key][0]
+        seqs.append(seq)
+        if len(seqs) >= self.sack_max:
+            self.sack_flush(ack_key)
+
+    # Send queued ACKs for a peer as a SACK frame.
+    def sack_flush(self, ack_key):
+        if ack_key not in self.sack_queue:
+            return
+
+        seqs, f_send, timer = self.sack_queue.pop(ack_key)
+        self.ack_timers.cancel(timer)
+        task = asyncio.ensure_future(
+            async_wrap_errors(
+                f_send(sack_encode(seqs))
+            )
+        )
+        self.ack_send_tasks.append(task)
+
+    def sack_flush_all(self):
+        for ack_key in list(self.sack_queue.keys()):
+            self.sack_flush(ack_key)
+
+    # Called by the timer wheel when no ACK arrived in time.
+    def ack_timeout(self, seq):
+        pending = self.ack_pending.get(seq)
+        if pending is None:
+            return
+
+        # Max transmits reached.
+        if pending["transmits"] >= pending["tries"]:
+            self.ack_finish(seq, 0)
+            return
+
+        # Too much time passed.
+        now = self.ack_timers.get_loop().time()
+        if pending["deadline"] is not None:
+            if now >= pending["deadline"]:
+                self.ack_finish(seq, 0)
+                return
+
+        # Retransmit with exponential backoff.
+        self.get_rtt(pending["dest"]).backoff()
+        pending["rto"] = min(pending["rto"] * 2, ACK_MAX_RTO)
+        pending["transmits"] += 1
+        pending["timer"] = self.ack_timers.add(
+            pending["rto"],
+            self.ack_timeout,
+            seq
+        )
+
+        task = asyncio.ensure_future(
+            async_wrap_errors(
+                self.send(pending["buf"], pending["dest"])
+            )
+        )
+        self.ack_send_tasks.append(task)
+
+    # Mark all sent messages as done (e.g. on close.)
+    def ack_cancel_all(self):
+        for seq in list(self.ack_pending.keys()):
+            self.ack_finish(seq, 1)
+
+        for seq in list(self.seq.keys()):
+            self.seq.pop(seq).set()
+
     """
     A function that retransmits a UDP packet up to 'tries' time or
     'sock_timeout' duration. If a special acknowledgement is received
-    before an error condition - the function returns successfully with
-    a value of 0 (no errors.) The code uses events to wait on ACKs
-    so there are no inefficient busy-loop checks.
+    before an error condition - the returned future resolves to 1.
+    It resolves to 0 if no ACK was received. Retransmits wait
+    for the destinations RTO and back off exponentially.
     """
     async def ack_send(self, data, dest_tup, seq=None, sock_timeout=0, tries=3):
         # Keep sending until max sends reached.
@@ -126,64 +366,39 @@ class ACKUDP():
         event = asyncio.Event()
         self.seq[seq] = event
 
-        # Do the sending concurrently so event can be returned.
-        async def worker():
-            # Record when the process started.
-            start = 0
-            if sock_timeout:
-                start = timestamp()
-
-            # Build data to send.
-            buf = bytearray().join([
-                pack("!Q", seq),
-                pack("!B", 0),
-                memoryview(data)
-            ])
-
-            # Await on ACK events.
-            # Break on transmits >= tries, timeout, or success.
-            send_transmits = 0
-            while True:
-                # Initial send.
-                await self.send(buf, dest_tup)
-                send_transmits += 1
-
-                # Finish trying to send.
-                # First failure mode reached.
-                if send_transmits >= tries:
-                    break
-
-                # Recheck for ack every second.
-                try:
-                    # Will return instantly on receiving a related ACK.
-                    # Otherwise it suspends for other code to execute.
-                    await asyncio.wait_for(
-                        self.seq[seq].wait(),
-                        3
-                    )
-
-                    # No timeout error = success.
-                    break
-                except asyncio.TimeoutError:
-                    pass
-
-                # Too much time passed.
-                # Second failure mode reached.
-                if sock_timeout:
-                    elapsed = timestamp() - start
-                    if elapsed >= sock_timeout:
-                        break
-
-            # Do cleanup.
-            if seq in self.seq:
-                del self.seq[seq]
-
-        # Schedule sending task.
-        task = asyncio.create_task(worker())
-        self.ack_send_tasks.append(task)
+        # Tell the receiver if SACKs can be used.
+        flag = ACK_FLAG_DATA
+        if self.sack_delay:
+            flag = ACK_FLAG_DATA_SACK
+
+        # Build data to send.
+        buf = bytearray().join([
+            pack("!Q", seq),
+            pack("!B", flag),
+            memoryview(data)
+        ])
+
+        # Record details for retransmits.
+        now = self.ack_timers.get_loop().time()
+        rto = self.get_rtt(dest_tup).rto
+        done = asyncio.Future()
+        self.ack_pending[seq] = {
+            "buf": buf,
+            "dest": dest_tup,
+            "transmits": 1,
+            "tries": tries,
+            "rto": rto,
+            "sent": now,
+            "deadline": now + sock_timeout if sock_timeout else None,
+            "done": done,
+            "timer": self.ack_timers.add(rto, self.ack_timeout, seq)
+        }
+
+        # Initial send.
+        await self.send(buf, dest_tup)
 
         # Wait for ACK.
-        return task, event
+        return done, event
 
 class BaseACKProto(asyncio.Protocol):
     def __init__(self, conf):
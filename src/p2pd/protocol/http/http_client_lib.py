@@ -11,7 +11,7 @@ HTTP_HEADERS = [
     [b"Accept", b"*/*"]
 ]
 
-def http_req_buf(af, host, path=b"/", method=b"GET", payload=b"", headers=None):
+def http_req_buf(af, host, path=b"/", method=b"GET", payload=b"", headers=None, version=b"1.0"):
     # Format headers.
     hdrs = {}
     if headers is None:
@@ -20,9 +20,9 @@ def http_req_buf(af, host, path=b"/", method=b"GET", payload=b"", headers=None):
         headers += HTTP_HEADERS
 
     # Raw http request.
-    # Very important: 1.0 is used to disable 'chunked encoding.'
-    # Chunked encoding overly complicates processing HTTP responses.
-    buf  = b"%s %s HTTP/1.0\r\n" % (to_b(method), to_b(path))
+    # 1.0 disables 'chunked encoding' and keep-alive.
+    # Pooled connections use 1.1 which needs both.
+    buf  = b"%s %s HTTP/%s\r\n" % (to_b(method), to_b(path), to_b(version))
     if af == IP4:
         host = to_b(host)
     else:
@@ -87,6 +87,339 @@ class ParseHTTPResponse(HTTPResponse):
     def out(self):
         return self.read(self.resp_len)
     
+# HTTP response parser states.
+HTTP_READ_HDRS = 1
+HTTP_READ_LEN = 2
+HTTP_READ_CHUNK_SIZE = 3
+HTTP_READ_CHUNK = 4
+HTTP_READ_CHUNK_END = 5
+HTTP_READ_TRAILERS = 6
+HTTP_READ_CLOSE = 7
+HTTP_DONE = 8
+
+# Secs an idle pooled connection is kept open.
+HTTP_POOL_IDLE = 5
+
+# Max idle connections kept per (route, addr).
+HTTP_POOL_MAX = 4
+
+"""
+Incremental HTTP/1.1 response parser. Data is fed in as
+it arrives and only new bytes are scanned. Supports bodies
+framed by Content-Length, chunked transfer encoding, or
+the connection closing. feed() returns the body pieces
+decoded from the new data so large bodies can be
+processed without holding them all in memory.
+"""
+class HTTPResponseParser():
+    def __init__(self, method=b"GET", keep_body=True):
+        self.method = to_b(method).upper()
+        self.keep_body = keep_body
+        self.buf = bytearray()
+        self.body = bytearray()
+        self.state = HTTP_READ_HDRS
+        self.version = self.reason = None
+        self.status = None
+        self.headers = []
+        self.hdrs = {}
+        self.remaining = 0
+        self.keep_alive = False
+
+    @property
+    def has_hdrs(self):
+        return self.state != HTTP_READ_HDRS
+
+    @property
+    def done(self):
+        return self.state == HTTP_DONE
+
+    # Return the next line without its line ending.
+    def read_line(self, pos):
+        end = self.buf.find(b"\n", pos)
+        if end == -1:
+            return None, pos
+
+        line = bytes(self.buf[pos:end])
+        if line[-1:] == b"\r":
+            line = line[:-1]
+
+        return line, end + 1
+
+    def parse_status(self, line):
+        parts = line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or parts[0][:5] != "HTTP/":
+            raise Exception("Invalid HTTP status line.")
+
+        self.version = parts[0]
+        self.status = int(parts[1])
+        self.reason = parts[2] if len(parts) == 3 else ""
+
+    def add_header(self, line):
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip(); value = value.strip()
+        self.headers.append([name, value])
+        self.hdrs[name] = value
+        self.hdrs[name.lower()] = value
+
+    # Choose how the body is framed once headers end.
+    def end_headers(self):
+        # Set origin.
+        if 'origin' not in self.hdrs:
+            self.hdrs['Origin'] = 'null'
+            self.hdrs['origin'] = 'null'
+
+        te = self.hdrs.get("transfer-encoding", "").lower()
+        con = self.hdrs.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            self.keep_alive = con == "keep-alive"
+        else:
+            self.keep_alive = con != "close"
+
+        # These never have a body.
+        no_body = self.method == b"HEAD"
+        no_body = no_body or self.status in (204, 304)
+        no_body = no_body or 100 <= self.status < 200
+        if no_body:
+            self.state = HTTP_DONE
+        elif "chunked" in te:
+            self.state = HTTP_READ_CHUNK_SIZE
+        elif "content-length" in self.hdrs:
+            self.remaining = int(self.hdrs["content-length"])
+            self.state = HTTP_READ_LEN if self.remaining else HTTP_DONE
+        else:
+            # Body ends when the server closes the con.
+            self.keep_alive = False
+            self.state = HTTP_READ_CLOSE
+
+    def take(self, pos, n, pieces):
+        end = min(len(self.buf), pos + n)
+        if end > pos:
+            piece = bytes(self.buf[pos:end])
+            pieces.append(piece)
+            if self.keep_body:
+                self.body += piece
+
+        return end
+
+    def feed(self, data):
+        self.buf += data
+        pieces = []
+        pos = 0
+        while self.state != HTTP_DONE:
+            if self.state == HTTP_READ_HDRS:
+                line, pos = self.read_line(pos)
+                if line is None:
+                    break
+
+                if self.status is None:
+                    self.parse_status(line)
+                elif len(line):
+                    self.add_header(line)
+                else:
+                    self.end_headers()
+
+                continue
+
+            if self.state in (HTTP_READ_LEN, HTTP_READ_CHUNK):
+                end = self.take(pos, self.remaining, pieces)
+                self.remaining -= end - pos
+                pos = end
+                if self.remaining:
+                    break
+
+                if self.state == HTTP_READ_LEN:
+                    self.state = HTTP_DONE
+                else:
+                    self.state = HTTP_READ_CHUNK_END
+
+                continue
+
+            if self.state == HTTP_READ_CLOSE:
+                pos = self.take(pos, len(self.buf), pieces)
+                break
+
+            # Chunk framing is line based.
+            line, pos = self.read_line(pos)
+            if line is None:
+                break
+
+            if self.state == HTTP_READ_CHUNK_SIZE:
+                # Ignore chunk extensions.
+                self.remaining = int(line.split(b";")[0].strip(), 16)
+                if self.remaining:
+                    self.state = HTTP_READ_CHUNK
+                else:
+                    self.state = HTTP_READ_TRAILERS
+            elif self.state == HTTP_READ_CHUNK_END:
+                if len(line):
+                    raise Exception("Invalid HTTP chunk end.")
+
+                self.state = HTTP_READ_CHUNK_SIZE
+            elif self.state == HTTP_READ_TRAILERS:
+                if not len(line):
+                    self.state = HTTP_DONE
+
+        # Only keep bytes not yet parsed.
+        del self.buf[:pos]
+
+        # Extra data means the con can't be reused.
+        if self.done and len(self.buf):
+            self.keep_alive = False
+
+        return pieces
+
+    # The server closed the connection.
+    def eof(self):
+        if self.state == HTTP_READ_CLOSE:
+            self.state = HTTP_DONE
+
+        return self.done
+
+    def out(self):
+        return bytes(self.body)
+
+def http_pipe_usable(pipe):
+    if not pipe.is_running:
+        return False
+
+    if pipe.transport is None:
+        return False
+
+    return not pipe.transport.is_closing()
+
+def http_pool_key(route, addr):
+    nic_id = None
+    if route.interface is not None:
+        nic_id = route.interface.id
+
+    return (route.af, nic_id, tuple(route.bind_tup()[:2]), tuple(addr[:2]))
+
+"""
+Idle keep-alive connections for reuse by later requests
+to the same (route, addr). Connections are closed if not
+used again within HTTP_POOL_IDLE secs.
+"""
+class HTTPPool():
+    def __init__(self, idle=HTTP_POOL_IDLE, max_idle=HTTP_POOL_MAX):
+        self.idle = idle
+        self.max_idle = max_idle
+        self.pipes = {}
+        self.tasks = []
+
+    def close_pipe(self, pipe):
+        self.tasks = rm_done_tasks(self.tasks)
+        self.tasks.append(create_task(pipe.close()))
+
+    def get(self, key):
+        pipes = self.pipes.get(key, [])
+        while len(pipes):
+            pipe, handle = pipes.pop()
+            handle.cancel()
+            if http_pipe_usable(pipe):
+                return pipe
+            
+            self.close_pipe(pipe)
+
+    def put(self, key, pipe):
+        pipes = self.pipes.setdefault(key, [])
+        if len(pipes) >= self.max_idle or not http_pipe_usable(pipe):
+            self.close_pipe(pipe)
+            return
+        
+        handle = asyncio.get_event_loop().call_later(
+            self.idle,
+            self.expire,
+            key,
+            pipe
+        )
+        pipes.append([pipe, handle])
+
+    def expire(self, key, pipe):
+        pipes = self.pipes.get(key, [])
+        for entry in pipes:
+            if entry[0] is pipe:
+                pipes.remove(entry)
+                self.close_pipe(pipe)
+                break
+
+    async def close(self):
+        for pipes in self.pipes.values():
+            for pipe, handle in pipes:
+                handle.cancel()
+                self.close_pipe(pipe)
+
+        self.pipes = {}
+        if len(self.tasks):
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.tasks = []
+
+"""
+Reads a response body from a pipe as it arrives.
+Use with 'async for' or read() for the whole body.
+When the body ends the con goes back to the pool
+if the server allows it.
+"""
+class HTTPBodyReader():
+    def __init__(self, pipe, parser, pool=None, key=None, do_close=1, conf=NET_CONF):
+        self.pipe = pipe
+        self.parser = parser
+        self.pool = pool
+        self.key = key
+        self.do_close = do_close
+        self.conf = conf
+        self.pieces = []
+        self.released = False
+
+    async def recv(self):
+        buf = await self.pipe.recv(SUB_ALL, timeout=self.conf['recv_timeout'])
+        if not buf:
+            self.parser.eof()
+            return False
+
+        self.pieces += self.parser.feed(buf)
+        return True
+
+    async def read_headers(self):
+        while not self.parser.has_hdrs:
+            if not await self.recv():
+                return False
+            
+        return True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not len(self.pieces):
+            if self.parser.done or not await self.recv():
+                await self.release()
+                raise StopAsyncIteration
+
+        return self.pieces.pop(0)
+
+    async def read(self):
+        async for _ in self:
+            pass
+
+        return self.parser.out()
+
+    async def release(self):
+        if self.released:
+            return
+        
+        # Left open for the caller.
+        self.released = True
+        if not self.do_close:
+            return
+        
+        # Reuse con for other requests.
+        if self.pool is not None and self.parser.done:
+            if self.parser.keep_alive:
+                self.pool.put(self.key, self.pipe)
+                return
+
+        await self.pipe.close()
+
 def get_hdr(name, hdrs):
     # Hdrs none probably.
     if not isinstance(hdrs, list):
@@ -141,77 +474,77 @@ def Payload(f, url={}, body=b""):
 
 # urllib.parse.urlencode(params)
 
-# Returns pipe, ParseHTTPResponse
-async def do_web_req(addr, http_buf, do_close, route, conf=NET_CONF):
+"""
+Sends a HTTP request and returns a HTTPBodyReader once
+the response headers are in. Pooled cons may have been
+closed by the server while idle so a failed request on
+one is retried once on a new con.
+"""
+async def http_open(addr, http_buf, route, conf=NET_CONF, pool=None, do_close=1, keep_body=True):
     log(fstr("{0}", (addr,)))
+    method = http_buf[:http_buf.find(b" ")]
+    key = None
+    if pool is not None:
+        key = http_pool_key(route, addr)
 
-    # Open TCP connection to HTTP server.
-    p = None
-    try:
-        p = await pipe_open(
-            route=route,
-            proto=TCP,
-            dest=addr,
-            conf=conf
-        )
-    except Exception:
-        log_exception()
+    for _ in range(0, 2):
+        # Open TCP connection to HTTP server.
+        p = None
+        if pool is not None:
+            p = pool.get(key)
+
+        reused = p is not None
+        if p is None:
+            try:
+                p = await pipe_open(
+                    route=route,
+                    proto=TCP,
+                    dest=addr,
+                    conf=conf
+                )
+            except Exception:
+                log_exception()
+
+            # Error return empty.
+            if p is None:
+                return None
+
+            p.subscribe(SUB_ALL)
+
+        parser = HTTPResponseParser(method, keep_body=keep_body)
+        reader = HTTPBodyReader(p, parser, pool, key, do_close, conf)
+        try:
+            await p.send(http_buf, addr)
+            if await reader.read_headers():
+                return reader
+        except Exception:
+            log_exception()
 
-    # Error return empty.
-    if p is None:
-        return None, None
-    try:
-        p.subscribe(SUB_ALL)
-        await p.send(http_buf, addr)
-    except Exception as e:
-        log_exception()
         await p.close()
-        return None, None
+        if not reused:
+            return None
+
+# Returns pipe, HTTPResponseParser
+async def do_web_req(addr, http_buf, do_close, route, conf=NET_CONF, pool=None):
+    reader = await http_open(
+        addr,
+        http_buf,
+        route,
+        conf=conf,
+        pool=pool,
+        do_close=do_close
+    )
 
+    # Error return empty.
+    if reader is None:
+        return None, None
 
-    # Read TCP stream until headers contain Content-Length
-    out = b""
-    content_len = 0
-    hdr_ended = False
-    while True:
-        buf = await p.recv(SUB_ALL, timeout=conf['recv_timeout'])
-        if not buf:
-            break
-        out += buf
-
-        # Check if headers end and find Content-Length
-        if b"\r\n\r\n" in out or b"\n\n" in out:
-            hdr_ended = True
-            content_len_search = re.search(b"[cC]ontent-[lL]ength: *([0-9]+)", out)
-            if content_len_search:
-                content_len = int(content_len_search.group(1))
-            break
-
-    # Extract headers and pre-existing content
-    content = b""
-    if hdr_ended:
-        parts = re.split(b"\r\n\r\n|\n\n", out, maxsplit=1)
-        headers, content = parts[0], parts[1] if len(parts) > 1 else b""
-
-    # Read remaining content if needed
-    if content_len:
-        while len(content) < content_len:
-            buf = await p.recv(SUB_ALL, timeout=conf['recv_timeout'])
-            if not buf:
-                break
-            content += buf
+    # Read the full body.
+    await reader.read()
 
     # Some connections may be left open.
-    if do_close:
-        await p.close()
-        p = None
-
-    # Parse HTTP response.
-    if out is not None:
-        log(out)
-        out = ParseHTTPResponse(out)
-        
-    return p, out
+    p = None if do_close else reader.pipe
+    return p, reader.parser
 
 """
 i = await Interface()
@@ -221,10 +554,19 @@ resp = await curl.vars(url_param, body_payload).get("/")
 resp.pipe # http con if open
 resp.out # http reply
 resp.info # parsed http reply
+
+Large bodies can be read as they arrive:
+resp = await curl.vars().stream("GET", "/")
+async for chunk in resp.reader:
+    ...
+
+With keep_alive=1 copies made by vars() share a keep-alive
+con pool. Call await curl.close() to close any idle cons.
+Otherwise each request uses its own con (HTTP/1.0.)
 """
 
 class WebCurl():
-    def __init__(self, addr, route, throttle=0, do_close=1, hdrs=[]):
+    def __init__(self, addr, route, throttle=0, do_close=1, hdrs=[], pool=None, keep_alive=0):
         self.addr = addr
         self.route = route
         self.url_params = {}
@@ -234,11 +576,17 @@ class WebCurl():
         self.path = self.info = None
         self.throttle = throttle
         self.do_close = do_close
+        self.pipe = self.reader = None
+
+        # Cons are only pooled when they'd otherwise be closed.
+        self.pool = pool
+        if self.pool is None and keep_alive:
+            self.pool = HTTPPool()
 
     # Figure out less brainlet way to do this.
     def copy(self):
         route = copy.deepcopy(self.route)
-        client = WebCurl(self.addr, route)
+        client = WebCurl(self.addr, route, keep_alive=0)
         client.url_params = self.url_params
         client.body = self.body
         client.path = self.path
@@ -248,6 +596,7 @@ class WebCurl():
         client.req_buf = self.req_buf
         client.throttle = self.throttle
         client.do_close = self.do_close
+        client.pool = self.pool
         return client
 
     def vars(self, url_params={}, body=b""):
@@ -264,7 +613,7 @@ class WebCurl():
         client.body = body
         return client
     
-    async def api(self, method, path, hdrs, conf):
+    async def api(self, method, path, hdrs, conf, stream=False):
         # New instance to avoid race conditions.
         client = self.copy()
         client.path = path
@@ -289,7 +638,8 @@ class WebCurl():
             path=path,
             method=method,
             payload=client.body,
-            headers=hdrs
+            headers=hdrs,
+            version=b"1.1" if client.pool is not None else b"1.0"
         )
 
 
@@ -302,15 +652,38 @@ class WebCurl():
             await asyncio.sleep(client.throttle)
 
         # Make the HTTP request to the server.
-        route = await client.route.bind()
+        await client.route.bind()
+        route = client.route
         addr = await resolv_dest(af, client.addr, nic)
+
+        # Return after the headers so the body can be streamed.
+        if stream:
+            reader = await async_wrap_errors(
+                http_open(
+                    route=route,
+                    addr=addr,
+                    http_buf=req_buf,
+                    conf=conf,
+                    pool=client.pool,
+                    do_close=client.do_close,
+                    keep_body=False
+                )
+            )
+
+            client.reader = reader
+            client.info = reader.parser if reader is not None else None
+            client.pipe = reader.pipe if reader is not None else None
+            client.out = None
+            return client
+
         ret = await async_wrap_errors(
             do_web_req(
                 route=route,
                 addr=addr, 
                 http_buf=req_buf,
                 do_close=client.do_close,
-                conf=conf
+                conf=conf,
+                pool=client.pool
             )
         )
 
@@ -337,4 +710,11 @@ class WebCurl():
         return await self.api("POST", path, hdrs, conf)
 
     async def delete(self, path, hdrs=[], conf=NET_CONF):
-        return await self.api("DELETE", path, hdrs, conf)
\ No newline at end of file
+        return await self.api("DELETE", path, hdrs, conf)
+
+    async def stream(self, method, path, hdrs=[], conf=NET_CONF):
+        return await self.api(method, path, hdrs, conf, stream=True)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
\ No newline at end of file
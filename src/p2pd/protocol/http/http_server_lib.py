@@ -15,6 +15,12 @@ P2PD_MIME = [
     [str, "text"]
 ]
 
+# Max bytes for a request line and headers.
+HTTP_MAX_HDRS = 64 * 1024
+
+# Max bytes for a request body.
+HTTP_MAX_BODY = 1024 * 1024
+
 # Support passing in GET params using path seperators.
 # Ex: /timeout/10/sub/all -> {'timeout': '10', 'sub': 'all'}
 def get_params(field_names, url_path):
@@ -109,9 +115,116 @@ class ParseHTTPRequest(BaseHTTPRequestHandler):
         self.error_code = code
         self.error_message = message
 
+"""
+A HTTP request read by HTTPRequestParser. It has the same
+fields the REST code uses from ParseHTTPRequest plus the
+request body and if the client wants the con kept open.
+"""
+class HTTPRequest():
+    def __init__(self, hdr_buf):
+        lines = hdr_buf.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or parts[2][:5] != "HTTP/":
+            raise Exception("Invalid HTTP request line.")
+
+        self.command, self.path, self.request_version = parts
+        self.error_code = self.error_message = None
+        self.headers = []
+        self.hdrs = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise Exception("Invalid HTTP header.")
+
+            name = name.strip(); value = value.strip()
+            self.headers.append([name, value])
+            self.hdrs[name] = value
+            self.hdrs[name.lower()] = value
+
+        # Set origin.
+        if 'Origin' not in self.hdrs:
+            self.hdrs['Origin'] = self.hdrs.get('origin', 'null')
+            self.hdrs['origin'] = self.hdrs['Origin']
+
+        # 1.1 cons stay open unless the client says otherwise.
+        con = self.hdrs.get("connection", "").lower()
+        if self.request_version == "HTTP/1.0":
+            self.keep_alive = con == "keep-alive"
+        else:
+            self.keep_alive = con != "close"
+
+        self.body_len = int(self.hdrs.get("content-length", 0))
+        if self.body_len < 0:
+            raise Exception("Invalid HTTP content length.")
+
+        self.body = b""
+
+"""
+Splits the byte stream of a HTTP con into requests.
+Requests may arrive over many reads or several may
+be sent at once (pipelining.) Only bytes not already
+checked are searched for the end of the headers.
+Bodies are buffered so a request with a content length
+above max_body sets too_large instead of being read.
+Requests before it are still returned and nothing
+after it is parsed.
+"""
+class HTTPRequestParser():
+    def __init__(self, max_hdrs=HTTP_MAX_HDRS, max_body=HTTP_MAX_BODY):
+        self.max_hdrs = max_hdrs
+        self.max_body = max_body
+        self.buf = bytearray()
+        self.scan = 0
+        self.req = None
+        self.too_large = False
+
+        # Requests on a con are answered in order.
+        self.lock = asyncio.Lock()
+
+    def feed(self, data):
+        if self.too_large:
+            return []
+
+        self.buf += data
+        reqs = []
+        pos = 0
+        while True:
+            # Read the request line and headers.
+            if self.req is None:
+                end = self.buf.find(b"\r\n\r\n", max(pos, self.scan))
+                if end == -1:
+                    if len(self.buf) - pos > self.max_hdrs:
+                        raise Exception("HTTP headers too large.")
+
+                    self.scan = max(pos, len(self.buf) - 3)
+                    break
+
+                self.req = HTTPRequest(bytes(self.buf[pos:end]))
+                pos = end + 4
+                if self.req.body_len > self.max_body:
+                    self.too_large = True
+                    self.buf = bytearray()
+                    self.req = None
+                    return reqs
+
+            # Wait for the full body.
+            body_end = pos + self.req.body_len
+            if len(self.buf) < body_end:
+                break
+
+            self.req.body = bytes(self.buf[pos:body_end])
+            reqs.append(self.req)
+            self.req = None
+            pos = body_end
+
+        # Only keep bytes not yet parsed.
+        del self.buf[:pos]
+        self.scan = max(0, self.scan - pos)
+        return reqs
+
 # Create a HTTP server response.
 # Supports JSON or binary.
-def http_res(payload, mime, req, client_tup=None):
+def http_res(payload, mime, req, client_tup=None, keep_alive=False):
     # Support JSON responses.
     if mime == "json":
         # Document content is a JSON string with good indenting.
@@ -144,12 +257,22 @@ def http_res(payload, mime, req, client_tup=None):
     else:
         res += b"x-client-tup: unknown\r\n"
     res += b"Content-Type: %s\r\n" % (content_type)
-    res += b"Connection: close\r\n"
+    if keep_alive:
+        res += b"Connection: keep-alive\r\n"
+    else:
+        res += b"Connection: close\r\n"
     res += b"Content-Length: %d\r\n\r\n" % (len(payload))
     res += payload
     
     return res
 
+# Reply for a request that won't be processed.
+def http_error_res(code, reason):
+    res  = b"HTTP/1.1 %d %s\r\n" % (code, to_b(reason))
+    res += b"Connection: close\r\n"
+    res += b"Content-Length: 0\r\n\r\n"
+    return res
+
 async def send_json(a_dict, req, client_tup, pipe):
     remote_client_tup = None
     if "client_tup" in a_dict:
@@ -172,7 +295,10 @@ async def send_text(out, req, client_tup, pipe):
 async def rest_service(msg, client_tup, pipe, api_closure=api_closure):
     # Parse http request.
     try:
-        req = ParseHTTPRequest(msg)
+        if isinstance(msg, HTTPRequest):
+            req = msg
+        else:
+            req = ParseHTTPRequest(msg)
     except Exception:
         log_exception()
         return None
@@ -297,6 +423,32 @@ def api_route_closure(url_path):
 
     return api
 
+"""
+API methods are stored in a trie per HTTP method keyed
+on the names in their schemes (in the order declared.)
+A URL is matched by walking its path once. Parts that
+aren't a name at the current node are values or
+positional params. The deepest node reached with a
+method is the best match.
+"""
+def route_trie_add(root, api):
+    node = root
+    for scheme in api.args:
+        node = node["next"].setdefault(scheme[0], {"apis": [], "next": {}})
+
+    node["apis"].append(api)
+
+def route_trie_match(root, url_path):
+    node = root
+    best = root["apis"][0] if len(root["apis"]) else None
+    for part in url_path.split("/"):
+        if part in node["next"]:
+            node = node["next"][part]
+            if len(node["apis"]):
+                best = node["apis"][0]
+
+    return best
+
 class RESTD(Daemon):
     def __init__(self):
         super().__init__()
@@ -312,6 +464,16 @@ class RESTD(Daemon):
             if "REST__" in f.__name__[:7]:
                 self.apis[f.http_method].append(f)
 
+        # Compile the routes once.
+        self.routes = {}
+        for http_method, apis in self.apis.items():
+            self.routes[http_method] = {"apis": [], "next": {}}
+            for api in apis:
+                route_trie_add(self.routes[http_method], api)
+
+        # Request parser for each con.
+        self.req_parsers = {}
+
     @staticmethod
     def rest_api_decorator(f, args):
         # Allow this method to be looked up.
@@ -357,82 +519,113 @@ class RESTD(Daemon):
 
         return decorate
 
+    def match_api(self, command, url_path):
+        apis = self.apis.get(command, [])
+        if not len(apis):
+            return None
+        
+        # Matches /.
+        if len(apis) == 1:
+            return apis[0]
+        
+        return route_trie_match(self.routes[command], url_path)
+
+    def get_req_parser(self, pipe):
+        if pipe not in self.req_parsers:
+            self.req_parsers[pipe] = HTTPRequestParser()
+
+            # Remove parser when the con closes.
+            def build_do_cleanup():
+                def do_cleanup(msg, client_tup, end_pipe):
+                    self.req_parsers.pop(pipe, None)
+                
+                return do_cleanup
+            
+            pipe.add_end_cb(build_do_cleanup())
+
+        return self.req_parsers[pipe]
+
     # Todo: $_GET from ?...
     async def msg_cb(self, msg, client_tup, pipe):
+        # Requests may be split or pipelined.
+        parser = self.get_req_parser(pipe)
+        try:
+            reqs = parser.feed(msg)
+        except Exception:
+            log_exception()
+            self.req_parsers.pop(pipe, None)
+            await pipe.close()
+            return
+
+        # Reply to requests in the order they were sent.
+        async with parser.lock:
+            for req in reqs:
+                keep_open = await self.handle_req(req, client_tup, pipe)
+                if not keep_open:
+                    return
+
+            # Body is over the limit so it's not read.
+            if parser.too_large and pipe.is_running:
+                buf = http_error_res(413, "Payload Too Large")
+                await pipe.send(buf, client_tup)
+                self.req_parsers.pop(pipe, None)
+                await pipe.close()
+
+    async def handle_req(self, req, client_tup, pipe):
         # Parse HTTP message and handle CORS.
-        req = await rest_service(msg, client_tup, pipe, api_route_closure)
-
-        # Receive any HTTP payload data.
-        body = b""; payload_len = 0
-        if "Content-Length" in req.hdrs:
-            # Content len must not exceed msg len.
-            payload_len = to_n(req.hdrs["Content-Length"])
-            if in_range(payload_len, [1, len(msg)]):
-                # Last content-len bytes == payload.
-                body = msg[-payload_len:]
-
+        req = await rest_service(req, client_tup, pipe, api_route_closure)
+        if req is None:
+            return pipe.is_running
+        
         # Convert body payload to json.
-        if "Content-Type" in req.hdrs:
-            if req.hdrs["Content-Type"] == "application/json":
-                if payload_len:
-                    body = json.loads(to_s(body))
-
-        # Call all matching API routes.
-        v = None
-        positional_no = 100
-        best_matching_api = None
-        for api in self.apis[req.command]:
-            named, positional = req.api(api.args)
-
-            # Matches /.
-            if len(self.apis[req.command]) == 1:
-                pass
-            else:
-                # Not a matching API method.
-                if len(named) != len(api.args):
-                    continue
-
-            # Find best matching API method.
-            if len(positional) < positional_no:
-                best_matching_api = api
-                positional_no = len(positional)
-
-                # HTTP request info for API methoiid.
-                v = {
-                    "req": req,
-                    "name": named,
-                    "pos": positional,
-                    "client": client_tup,
-                    "body": body
-                }
-
-        # Call matching API method.
-        if best_matching_api is not None:
-            # Get response from wrapped function.
-            # Capture any exceptions in the reply.
-            try:
-                resp = await best_matching_api(v, pipe)
-            except Exception as e:
-                resp = {
-                    "error": "Exception",
-                    "msg": str(e),
-                }
-
-            # Match output types to the write mime headers.
-            for out_info in P2PD_MIME:
-                if isinstance(resp, out_info[0]):
-                    # Full HTTP reply to client.
-                    buf = http_res(
-                        resp,
-                        out_info[1],
-                        req,
-                        client_tup
-                    )
-
-                    # Send it back to the client.
-                    await pipe.send(buf, client_tup)
-                    break
-                
-
+        body = req.body
+        if req.hdrs.get("content-type") == "application/json":
+            if len(body):
+                body = json.loads(to_s(body))
+
+        # Find the best matching API route.
+        api = self.match_api(req.command, req.url["path"])
+        if api is None:
+            return True
+
+        # HTTP request info for API method.
+        named, positional = req.api(api.args)
+        v = {
+            "req": req,
+            "name": named,
+            "pos": positional,
+            "client": client_tup,
+            "body": body
+        }
 
+        # Get response from wrapped function.
+        # Capture any exceptions in the reply.
+        try:
+            resp = await api(v, pipe)
+        except Exception as e:
+            resp = {
+                "error": "Exception",
+                "msg": str(e),
+            }
+
+        # Match output types to the write mime headers.
+        for out_info in P2PD_MIME:
+            if isinstance(resp, out_info[0]):
+                # Full HTTP reply to client.
+                buf = http_res(
+                    resp,
+                    out_info[1],
+                    req,
+                    client_tup,
+                    keep_alive=req.keep_alive
+                )
+
+                # Send it back to the client.
+                await pipe.send(buf, client_tup)
+                if not req.keep_alive:
+                    await pipe.close()
+                    return False
+                
+                break
 
+        return True
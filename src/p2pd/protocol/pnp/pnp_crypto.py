@@ -0,0 +1,104 @@
+"""
+The PNP server does ECIES decrypt + encrypt for every request and
+ECDSA verifies for every signed request. ecdsa is pure Python so
+each of these takes milliseconds and used to block the event loop.
+
+PNPCrypto runs these steps in an executor. Processes are used by
+default since the GIL means threads only keep the loop responsive
+without adding throughput. Each worker keeps parsed VerifyingKeys
+in an LRU keyed by compressed key bytes so popular owners aren't
+parsed (an expensive point decompression) per request.
+
+With workers = 0 everything runs inline on the event loop.
+"""
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ecdsa import VerifyingKey, SigningKey, SECP256k1
+from ...vendor.ecies import encrypt, decrypt
+from ...utility.utils import *
+from .pnp_utils import *
+
+# Crypto workers. 0 = run on the event loop.
+# start_pnp_server uses one per CPU.
+PNP_CRYPTO_WORKERS = 0
+
+# Max parsed verifying keys per worker.
+PNP_VK_CACHE_SIZE = 1024
+
+# Per process caches.
+VK_CACHE = OrderedDict()
+SK_CACHE = {}
+
+def load_vk(vkc):
+    vk = VK_CACHE.get(vkc)
+    if vk is None:
+        vk = VerifyingKey.from_string(vkc, curve=SECP256k1)
+        VK_CACHE[vkc] = vk
+        if len(VK_CACHE) > PNP_VK_CACHE_SIZE:
+            VK_CACHE.popitem(last=False)
+    else:
+        VK_CACHE.move_to_end(vkc)
+
+    return vk
+
+def load_sk(sk_buf):
+    if sk_buf not in SK_CACHE:
+        SK_CACHE[sk_buf] = SigningKey.from_string(sk_buf, curve=SECP256k1)
+
+    return SK_CACHE[sk_buf]
+
+# Decrypt and parse a request.
+def pnp_open_req(sk_buf, buf):
+    pkt = PNPPacket.unpack(decrypt(load_sk(sk_buf), buf))
+    return pkt, pkt.get_msg_to_sign()
+
+def pnp_verify(vkc, sig, msg):
+    try:
+        return load_vk(vkc).verify(sig, msg)
+    except Exception:
+        return False
+
+def pnp_encrypt(pk, buf):
+    return encrypt(pk, buf)
+
+class PNPCrypto():
+    def __init__(self, sk_buf, workers=PNP_CRYPTO_WORKERS, use_procs=True):
+        self.sk_buf = sk_buf
+        self.workers = workers
+        self.executor = None
+        if not workers:
+            return
+
+        if use_procs:
+            try:
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+                return
+            except Exception:
+                # Some platforms (Android) lack working semaphores.
+                log_exception()
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def run(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    # Returns (pkt, msg to sign.)
+    async def open_req(self, buf):
+        return await self.run(pnp_open_req, self.sk_buf, buf)
+
+    async def verify(self, vkc, sig, msg):
+        return await self.run(pnp_verify, vkc, sig, msg)
+
+    async def encrypt(self, pk, buf):
+        return await self.run(pnp_encrypt, pk, buf)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
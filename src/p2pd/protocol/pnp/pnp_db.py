@@ -0,0 +1,334 @@
+"""
+SQL used by the PNP server to store names and the IPs that own
+them. The functions take a DB connection and cursor so they work
+with any backend from pnp_storage that provides them. The SQL is
+written for MySQL -- other backends translate it.
+"""
+
+from .pnp_utils import *
+from ...net.net import *
+from ...net.ip_range import IPRange
+
+# Fixed SQL for the hot paths -- built once.
+SQL_FETCH_NAME = "SELECT * FROM names WHERE name=%s "
+SQL_FETCH_NAME_LOCK = SQL_FETCH_NAME + "FOR UPDATE"
+SQL_V4_SELECT = "SELECT id FROM ipv4s WHERE v4_val=%s FOR UPDATE"
+SQL_V4_INSERT = "INSERT INTO ipv4s (v4_val, timestamp) VALUES (%s, %s)"
+SQL_V6_SUBNETS_USED  = "SELECT COUNT(DISTINCT v6_lan_id) "
+SQL_V6_SUBNETS_USED += "FROM ipv6s WHERE v6_glob_main=%s AND v6_glob_extra=%s FOR UPDATE"
+SQL_V6_IFACES_USED  = "SELECT COUNT(id) FROM ipv6s "
+SQL_V6_IFACES_USED += "WHERE v6_glob_main=%s AND v6_glob_extra=%s "
+SQL_V6_IFACES_USED += "AND v6_lan_id=%s FOR UPDATE"
+SQL_V6_LAN  = "SELECT id FROM ipv6s WHERE v6_glob_main=%s "
+SQL_V6_LAN += "AND v6_glob_extra=%s AND v6_lan_id=%s "
+SQL_V6_LAN_EXISTS = SQL_V6_LAN + " FOR UPDATE"
+SQL_V6_RECORD = SQL_V6_LAN + "AND v6_iface_id=%s FOR UPDATE"
+
+async def v6_range_usage(cur, v6_glob_main, v6_glob_extra, v6_lan_id, _):
+    # Count number of subnets used.
+    sql_params = (int(v6_glob_main), int(v6_glob_extra),)
+    await cur.execute(SQL_V6_SUBNETS_USED, sql_params)
+    v6_subnets_used = (await cur.fetchone())[0]
+
+    # Count number of interfaces used.
+    sql_params = (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id),)
+    await cur.execute(SQL_V6_IFACES_USED, sql_params)
+    v6_ifaces_used = (await cur.fetchone())[0]
+
+    # Return results.
+    return v6_subnets_used, v6_ifaces_used
+
+async def v6_exists(cur, v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id):
+    # Check if v6 subnet component exists.
+    sql_params = (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id),)
+    await cur.execute(SQL_V6_LAN_EXISTS, sql_params)
+    v6_lan_exists = (await cur.fetchone()) is not None
+
+    # Check if IPv6 record exists.
+    await cur.execute(
+        SQL_V6_RECORD,
+        (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id), int(v6_iface_id),)
+    )
+    v6_record = await cur.fetchone()
+
+    # Return results.
+    return v6_lan_exists, v6_record
+
+async def v6_insert(cur, v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id, sys_clock):
+    # Insert a new IPv6 IP.
+    sql = """INSERT INTO ipv6s
+        (
+            v6_glob_main,
+            v6_glob_extra,
+            v6_lan_id,
+            v6_iface_id,
+            timestamp
+        )
+        VALUES (%s, %s, %s, %s, %s)
+    """
+    sql_params = (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id),)
+    sql_params += (int(v6_iface_id), int(sys_clock.time()),)
+    await cur.execute(sql, sql_params)
+
+    # Return the new row index.
+    return cur.lastrowid
+
+# Breaks down an IPv6 into fields for DB storage.
+def get_v6_parts(ipr):
+    ip_str = str(ipr) # Normalize IPv6.
+    v6_glob_main = int(ip_str[:9].replace(':', ''), 16) # :
+    v6_glob_extra = int(ip_str[10:14], 16)
+    v6_lan_id = int(ip_str[15:19], 16)
+    v6_iface_id = int(ip_str[20:].replace(':', ''), 16) # :
+    v6_parts = (v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id)
+
+    return v6_parts
+
+async def record_v6(params, serv, sys_clock):
+    # Replace ipr parameter with v6_parts.
+    params = (params[0],) + get_v6_parts(params[1])
+
+    # Get consumption numbers for the IPv6 range.
+    v6_subnets_used, v6_ifaces_used = await v6_range_usage(*params)
+
+    # Check whether the LAN ID already exists.
+    # If the whole IPv6 already exists the record is not None.
+    v6_lan_exists, v6_record = await v6_exists(*params)
+    
+    # Start logic to handle inserting the IPv6.
+    if v6_record is None:
+        # Are we within the subnet limitations?
+        if not (v6_lan_exists or (v6_subnets_used < serv.v6_subnet_limit)):
+            raise Exception("IPv6 subnet limit reached.")
+
+        # Are we within the iface limitations?
+        if not (v6_ifaces_used < serv.v6_iface_limit):
+            raise Exception("IPv6 iface limit reached.")
+        
+        # IP row ID.
+        ip_id = await v6_insert(*params, sys_clock)
+    else:
+        # IP row ID.
+        ip_id = v6_record[0]
+
+    return ip_id
+
+async def record_v4(params, serv, sys_clock):
+    # Main params.
+    cur, ipr = params
+
+    # Check if IPv4 exists.
+    await cur.execute(SQL_V4_SELECT, (int(ipr),))
+    row = await cur.fetchone()
+    if row is not None:
+        # If it does return the ID.
+        ip_id = row[0]
+    else:
+        # Otherwise insert the new IP and return its row ID.
+        sql_params = (int(ipr), int(sys_clock.time()),)
+        await cur.execute(SQL_V4_INSERT, sql_params)
+        ip_id = cur.lastrowid
+
+    return ip_id
+
+async def record_ip(af, params, serv, sys_clock):
+    if af == IP6:
+        ip_id = await record_v6(params, serv, sys_clock)
+    
+    # Load existing ip_id or create it - V4.
+    if af == IP4:
+        ip_id = await record_v4(params, serv, sys_clock)
+
+    return ip_id
+
+# Each IP can own X names.
+# Where X depends on the address family.
+def name_limit_by_af(af, serv):
+    if af == IP4:
+        return serv.v4_name_limit
+    if af == IP6:
+        return serv.v6_name_limit
+
+async def fetch_name(cur, name, lock=DB_WRITE_LOCK):
+    # Does name already exist.
+    sql = SQL_FETCH_NAME
+    if lock == DB_WRITE_LOCK:
+        sql = SQL_FETCH_NAME_LOCK
+
+    await cur.execute(sql, (name,))
+    row = await cur.fetchone()
+    return row
+
+async def record_name(cur, serv, af, ip_id, name, value, owner_pub, updated, sys_clock):
+    # Does name already exist.
+    row = await fetch_name(cur, name)
+    name_exists = row is not None
+
+    # Get names used and limit.
+    sql  = "SELECT COUNT(id) FROM names WHERE af=%s "
+    sql += "AND ip_id=%s FOR UPDATE"
+    await cur.execute(sql, (int(af), int(ip_id),))
+    names_used = (await cur.fetchone())[0]
+    name_limit = name_limit_by_af(af, serv)
+    if names_used:
+        penalty = ((names_used / name_limit) * MIN_NAME_DURATION) + 1
+        penalty = min(penalty, (MIN_NAME_DURATION - MIN_DURATION_PENALTY))
+    else:
+        penalty = 0
+
+    # Update an existing name.
+    if name_exists:
+        if row[6] >= updated:
+            raise Exception("Replay attack for name update.")
+        
+        # Apply penalty to updated.
+        updated = int(updated)
+        updated -= max(penalty, 0)
+
+        sql  = """
+        UPDATE names SET 
+        value=%s,
+        af=%s,
+        ip_id=%s,
+        timestamp=%s
+        WHERE name=%s 
+        AND timestamp=%s
+        """
+        ret = await cur.execute(sql, 
+            (
+                value,
+                int(af),
+                int(ip_id),
+                int(updated),
+                name,
+                int(row[6])
+            )
+        )
+        if not ret:
+            return None
+
+        row = (row[0], name, value, row[3], af, ip_id, updated)
+        return row
+
+    # Create a new name.
+    if not name_exists:
+        # Ensure name limit is respected.
+        # [ ... active names, ? ]
+        if names_used >= name_limit:
+            raise Exception("insert name limit reached.")
+
+        # Insert a brand new name.
+        sql = """
+        INSERT INTO names
+        (
+            name,
+            value,
+            owner_pub,
+            af,
+            ip_id,
+            timestamp
+        )
+        VALUES(%s, %s, %s, %s, %s, %s)
+        """
+        ret = await cur.execute(sql, 
+            (
+                name,
+                value, 
+                owner_pub,
+                int(af),
+                int(ip_id),
+                int(updated),
+            )
+        )
+
+        # Fetch the new row (so we know the ID.)
+        return await fetch_name(cur, name)
+
+# Deletes a name if a signed request is more recent.
+async def verified_delete_name(db_con, cur, name, updated):
+    row = await fetch_name(cur, name)
+    if row is None:
+        return
+    
+    if row[6] >= updated:
+        raise Exception("Replay attack for name update.")
+        
+    sql  = "DELETE FROM names WHERE "
+    sql += "name = %s AND timestamp = %s"
+    await cur.execute(sql, (name, int(row[6])))
+    await db_con.commit()
+
+# Prunes unneeded records from the DB.
+async def verified_pruning(db_con, cur, serv, updated):
+    # Delete all ipv6s that haven't been updated for X seconds.
+    sql = """
+    DELETE FROM ipv6s
+    WHERE ((%s - timestamp) >= %s)
+    """
+    ret = await cur.execute(sql, (
+        int(updated),
+        int(serv.v6_addr_expiry),
+    ))
+
+    # Delete all names that haven't been updated for X seconds.
+    sql = """
+    DELETE FROM names
+    WHERE ((%s - timestamp) >= %s)
+    """
+    ret = await cur.execute(sql, (
+        int(updated),
+        int(serv.min_name_duration),
+    ))
+
+    # Delete all IPs that don't have associated names.
+    """
+    This query uses a sub-query to select all names associated
+    with a specific IP address family. The parent query deletes
+    all records from the IP table if no names refer back to
+    an IP row. Since the name row uses a different column name
+    for the id field (ip_id) the field is given an alias (id.)
+    The parent query can now delete all rows that don't have
+    an ID in the sub query result set.
+
+    Note: this query could get slow with many names.
+    """
+    for table, af in [["ipv4s", "2"], ["ipv6s", "23"]]:
+        sql = fstr("""
+        DELETE FROM {0} WHERE id NOT IN (
+            SELECT ip_id as id
+            FROM (
+                SELECT ip_id
+                FROM names 
+                WHERE af=%s
+            ) AS results
+        );
+        """, (table, ))
+        ret = await cur.execute(sql, (
+            af,
+        ))
+
+    await db_con.commit()
+
+async def verified_write_name(db_con, cur, serv, behavior, updated, name, value, owner_pub, af, ip_str, sys_clock):
+    # Convert ip_str into an IPRange instance.
+    cidr = 32 if af == IP4 else 128
+    ipr = IPRange(ip_str, cidr=cidr)
+
+    # Unneeded records get deleted.
+    if behavior != BEHAVIOR_DONT_BUMP:
+        await verified_pruning(db_con, cur, serv, sys_clock.time())
+
+    # Record IP if needed and get its ID.
+    # If it's V6 allocation limits are enforced on subnets.
+    ip_id = await record_ip(af, (cur, ipr,), serv, sys_clock)
+    if ip_id is None:
+        return
+
+    # Record name if needed and get its ID.
+    # Also supports transferring a name to a new IP.
+    name_row = await record_name(cur, serv, af, ip_id, name, value, owner_pub, updated, sys_clock)
+    if name_row is None:
+        return
+
+    # Save current changes.
+    await db_con.commit()
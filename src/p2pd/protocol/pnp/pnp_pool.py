@@ -0,0 +1,174 @@
+"""
+The PNP server used to open a new DB connection for every packet.
+That's a TCP handshake + auth per request and connections were
+leaked when a request succeeded.
+
+DBPool keeps up to 'size' open connections. Each pooled connection
+keeps one cursor that's reused for every request that checks it
+out. Connections that have been idle for a while are pinged on
+checkout and replaced if the ping fails. A connection that errors
+during a request is closed rather than returned to the pool.
+
+The pool only needs an async function that returns a new
+connection so it isn't tied to a DB driver.
+"""
+
+import asyncio
+import time
+from collections import deque
+from ...utility.utils import *
+
+# Max open connections.
+PNP_DB_POOL_SIZE = 10
+
+# Ping connections idle for longer than this before use.
+PNP_DB_PING_IDLE = 30
+
+class DBPoolCon():
+    def __init__(self, con, cur):
+        self.con = con
+        self.cur = cur
+        self.last_used = time.time()
+
+class DBPool():
+    def __init__(self, connect, size=PNP_DB_POOL_SIZE, ping_idle=PNP_DB_PING_IDLE):
+        self.connect = connect
+        self.size = size
+        self.ping_idle = ping_idle
+        self.idle = deque()
+        self.slots = asyncio.Semaphore(size)
+
+        # Metrics.
+        self.in_use = 0
+        self.open_count = 0
+        self.checkouts = 0
+        self.failures = 0
+        self.wait_total = 0
+        self.wait_max = 0
+
+    def stats(self):
+        wait_avg = 0
+        if self.checkouts:
+            wait_avg = self.wait_total / self.checkouts
+
+        return {
+            "size": self.size,
+            "open": self.open_count,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "failures": self.failures,
+            "wait_avg": wait_avg,
+            "wait_max": self.wait_max,
+        }
+
+    # Open min_open connections up front.
+    async def start(self, min_open=1):
+        for _ in range(0, min(min_open, self.size)):
+            pool_con = await self.open()
+            self.idle.append(pool_con)
+
+        return self
+
+    async def open(self):
+        try:
+            con = await self.connect()
+            cur = await con.cursor()
+        except Exception:
+            self.failures += 1
+            raise
+
+        self.open_count += 1
+        return DBPoolCon(con, cur)
+
+    async def discard(self, pool_con):
+        self.open_count -= 1
+        try:
+            await pool_con.cur.close()
+        except Exception:
+            pass
+
+        try:
+            pool_con.con.close()
+        except Exception:
+            pass
+
+    async def is_healthy(self, pool_con):
+        if time.time() - pool_con.last_used < self.ping_idle:
+            return True
+
+        try:
+            await pool_con.con.ping(reconnect=False)
+            return True
+        except Exception:
+            self.failures += 1
+            return False
+
+    async def acquire(self):
+        # Bounded by pool size.
+        start = time.time()
+        await self.slots.acquire()
+        wait = time.time() - start
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+        try:
+            # Most recently used connections first.
+            while len(self.idle):
+                pool_con = self.idle.pop()
+                if await self.is_healthy(pool_con):
+                    break
+
+                await self.discard(pool_con)
+            else:
+                pool_con = await self.open()
+        except Exception:
+            self.slots.release()
+            raise
+
+        self.in_use += 1
+        return pool_con
+
+    async def release(self, pool_con, broken=False):
+        self.in_use -= 1
+        try:
+            if broken:
+                await self.discard(pool_con)
+            else:
+                pool_con.last_used = time.time()
+                self.idle.append(pool_con)
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        while len(self.idle):
+            await self.discard(self.idle.pop())
+
+"""
+Checkout a connection for a request:
+
+    async with DBCheckout(pool) as pool_con:
+        await pool_con.cur.execute(...)
+
+Anything not committed is rolled back on exit. This also ends
+read-only transactions so the next request doesn't see an old
+snapshot. If the rollback fails the connection is dropped.
+"""
+class DBCheckout():
+    def __init__(self, pool):
+        self.pool = pool
+        self.pool_con = None
+
+    async def __aenter__(self):
+        self.pool_con = await self.pool.acquire()
+        return self.pool_con
+
+    async def __aexit__(self, exc_type, exc, tb):
+        broken = False
+        try:
+            await self.pool_con.con.rollback()
+        except Exception:
+            log_exception()
+            broken = True
+
+        await self.pool.release(self.pool_con, broken)
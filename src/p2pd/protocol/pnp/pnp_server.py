@@ -19,339 +19,33 @@ that uses IP limits to reduce spam.
 
 from ...vendor.ecies import encrypt, decrypt
 import os
-import aiomysql
 from ecdsa import VerifyingKey, SECP256k1, SigningKey
 from .pnp_utils import *
 from ...net.net import *
 from ...net.ip_range import IPRange
 from ...net.daemon import *
 from ..ntp.clock_skew import SysClock
+from .pnp_storage import *
+from .pnp_crypto import *
 
-async def v6_range_usage(cur, v6_glob_main, v6_glob_extra, v6_lan_id, _):
-    # Count number of subnets used.
-    sql  = "SELECT COUNT(DISTINCT v6_lan_id) "
-    sql += "FROM ipv6s WHERE v6_glob_main=%s AND v6_glob_extra=%s FOR UPDATE"
-    await cur.execute(sql, (int(v6_glob_main), int(v6_glob_extra),))
-    v6_subnets_used = (await cur.fetchone())[0]
-
-    # Count number of interfaces used.
-    sql  = "SELECT COUNT(id) FROM ipv6s "
-    sql += "WHERE v6_glob_main=%s AND v6_glob_extra=%s "
-    sql += "AND v6_lan_id=%s FOR UPDATE"
-    sql_params = (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id),)
-    await cur.execute(sql, sql_params)
-    v6_ifaces_used = (await cur.fetchone())[0]
-
-    # Return results.
-    return v6_subnets_used, v6_ifaces_used
-
-async def v6_exists(cur, v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id):
-    # Check if v6 subnet component exists.
-    sql  = "SELECT id FROM ipv6s WHERE v6_glob_main=%s "
-    sql += "AND v6_glob_extra=%s AND v6_lan_id=%s "
-    sql_params = (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id),)
-    await cur.execute(sql + " FOR UPDATE", sql_params)
-    v6_lan_exists = (await cur.fetchone()) is not None
-
-    # Check if IPv6 record exists.
-    sql += "AND v6_iface_id=%s FOR UPDATE"
-    await cur.execute(
-        sql.replace(" COUNT(id) ", " id "), # Change count to select.
-        (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id), int(v6_iface_id),)
-    )
-    v6_record = await cur.fetchone()
-
-    # Return results.
-    return v6_lan_exists, v6_record
-
-async def v6_insert(cur, v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id, sys_clock):
-    # Insert a new IPv6 IP.
-    sql = """INSERT INTO ipv6s
-        (
-            v6_glob_main,
-            v6_glob_extra,
-            v6_lan_id,
-            v6_iface_id,
-            timestamp
-        )
-        VALUES (%s, %s, %s, %s, %s)
-    """
-    sql_params = (int(v6_glob_main), int(v6_glob_extra), int(v6_lan_id),)
-    sql_params += (int(v6_iface_id), int(sys_clock.time()),)
-    await cur.execute(sql, sql_params)
-
-    # Return the new row index.
-    return cur.lastrowid
-
-# Breaks down an IPv6 into fields for DB storage.
-def get_v6_parts(ipr):
-    ip_str = str(ipr) # Normalize IPv6.
-    v6_glob_main = int(ip_str[:9].replace(':', ''), 16) # :
-    v6_glob_extra = int(ip_str[10:14], 16)
-    v6_lan_id = int(ip_str[15:19], 16)
-    v6_iface_id = int(ip_str[20:].replace(':', ''), 16) # :
-    v6_parts = (v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id)
-
-    return v6_parts
-
-async def record_v6(params, serv, sys_clock):
-    # Replace ipr parameter with v6_parts.
-    params = (params[0],) + get_v6_parts(params[1])
-
-    # Get consumption numbers for the IPv6 range.
-    v6_subnets_used, v6_ifaces_used = await v6_range_usage(*params)
-
-    # Check whether the LAN ID already exists.
-    # If the whole IPv6 already exists the record is not None.
-    v6_lan_exists, v6_record = await v6_exists(*params)
-    
-    # Start logic to handle inserting the IPv6.
-    if v6_record is None:
-        # Are we within the subnet limitations?
-        if not (v6_lan_exists or (v6_subnets_used < serv.v6_subnet_limit)):
-            raise Exception("IPv6 subnet limit reached.")
-
-        # Are we within the iface limitations?
-        if not (v6_ifaces_used < serv.v6_iface_limit):
-            raise Exception("IPv6 iface limit reached.")
-        
-        # IP row ID.
-        ip_id = await v6_insert(*params, sys_clock)
-    else:
-        # IP row ID.
-        ip_id = v6_record[0]
-
-    return ip_id
-
-async def record_v4(params, serv, sys_clock):
-    # Main params.
-    cur, ipr = params
-
-    # Check if IPv4 exists.
-    sql = "SELECT id FROM ipv4s WHERE v4_val=%s FOR UPDATE"
-    await cur.execute(sql, (int(ipr),))
-    row = await cur.fetchone()
-    if row is not None:
-        # If it does return the ID.
-        ip_id = row[0]
-    else:
-        # Otherwise insert the new IP and return its row ID.
-        sql  = "INSERT INTO ipv4s (v4_val, timestamp) "
-        sql += "VALUES (%s, %s)"
-        await cur.execute(sql, (int(ipr), int(sys_clock.time()),))
-        ip_id = cur.lastrowid
-
-    return ip_id
-
-async def record_ip(af, params, serv, sys_clock):
-    if af == IP6:
-        ip_id = await record_v6(params, serv, sys_clock)
-    
-    # Load existing ip_id or create it - V4.
-    if af == IP4:
-        ip_id = await record_v4(params, serv, sys_clock)
-
-    return ip_id
-
-# Each IP can own X names.
-# Where X depends on the address family.
-def name_limit_by_af(af, serv):
-    if af == IP4:
-        return serv.v4_name_limit
-    if af == IP6:
-        return serv.v6_name_limit
-
-async def fetch_name(cur, name, lock=DB_WRITE_LOCK):
-    # Does name already exist.
-    sql = "SELECT * FROM names WHERE name=%s "
-    if lock == DB_WRITE_LOCK:
-        sql += "FOR UPDATE"
-
-    await cur.execute(sql, (name,))
-    row = await cur.fetchone()
-    return row
-
-async def record_name(cur, serv, af, ip_id, name, value, owner_pub, updated, sys_clock):
-    # Does name already exist.
-    row = await fetch_name(cur, name)
-    name_exists = row is not None
-
-    # Get names used and limit.
-    sql  = "SELECT COUNT(id) FROM names WHERE af=%s "
-    sql += "AND ip_id=%s FOR UPDATE"
-    await cur.execute(sql, (int(af), int(ip_id),))
-    names_used = (await cur.fetchone())[0]
-    name_limit = name_limit_by_af(af, serv)
-    if names_used:
-        penalty = ((names_used / name_limit) * MIN_NAME_DURATION) + 1
-        penalty = min(penalty, (MIN_NAME_DURATION - MIN_DURATION_PENALTY))
-    else:
-        penalty = 0
-
-    # Update an existing name.
-    if name_exists:
-        if row[6] >= updated:
-            raise Exception("Replay attack for name update.")
-        
-        # Apply penalty to updated.
-        updated = int(updated)
-        updated -= max(penalty, 0)
-
-        sql  = """
-        UPDATE names SET 
-        value=%s,
-        af=%s,
-        ip_id=%s,
-        timestamp=%s
-        WHERE name=%s 
-        AND timestamp=%s
-        """
-        ret = await cur.execute(sql, 
-            (
-                value,
-                int(af),
-                int(ip_id),
-                int(updated),
-                name,
-                int(row[6])
-            )
-        )
-        if not ret:
-            return None
-
-        row = (row[0], name, value, row[3], af, ip_id, updated)
-        return row
-
-    # Create a new name.
-    if not name_exists:
-        # Ensure name limit is respected.
-        # [ ... active names, ? ]
-        if names_used >= name_limit:
-            raise Exception("insert name limit reached.")
-
-        # Insert a brand new name.
-        sql = """
-        INSERT INTO names
-        (
-            name,
-            value,
-            owner_pub,
-            af,
-            ip_id,
-            timestamp
-        )
-        VALUES(%s, %s, %s, %s, %s, %s)
-        """
-        ret = await cur.execute(sql, 
-            (
-                name,
-                value, 
-                owner_pub,
-                int(af),
-                int(ip_id),
-                int(updated),
-            )
-        )
-
-        # Fetch the new row (so we know the ID.)
-        return await fetch_name(cur, name)
-
-# Deletes a name if a signed request is more recent.
-async def verified_delete_name(db_con, cur, name, updated):
-    row = await fetch_name(cur, name)
-    if row is None:
-        return
-    
-    if row[6] >= updated:
-        raise Exception("Replay attack for name update.")
-        
-    sql  = "DELETE FROM names WHERE "
-    sql += "name = %s AND timestamp = %s"
-    await cur.execute(sql, (name, int(row[6])))
-    await db_con.commit()
-
-# Prunes unneeded records from the DB.
-async def verified_pruning(db_con, cur, serv, updated):
-    # Delete all ipv6s that haven't been updated for X seconds.
-    sql = """
-    DELETE FROM ipv6s
-    WHERE ((%s - timestamp) >= %s)
-    """
-    ret = await cur.execute(sql, (
-        int(updated),
-        int(serv.v6_addr_expiry),
-    ))
-
-    # Delete all names that haven't been updated for X seconds.
-    sql = """
-    DELETE FROM names
-    WHERE ((%s - timestamp) >= %s)
-    """
-    ret = await cur.execute(sql, (
-        int(updated),
-        int(serv.min_name_duration),
-    ))
-
-    # Delete all IPs that don't have associated names.
-    """
-    This query uses a sub-query to select all names associated
-    with a specific IP address family. The parent query deletes
-    all records from the IP table if no names refer back to
-    an IP row. Since the name row uses a different column name
-    for the id field (ip_id) the field is given an alias (id.)
-    The parent query can now delete all rows that don't have
-    an ID in the sub query result set.
-
-    Note: this query could get slow with many names.
-    """
-    for table, af in [["ipv4s", "2"], ["ipv6s", "23"]]:
-        sql = fstr("""
-        DELETE FROM {0} WHERE id NOT IN (
-            SELECT ip_id as id
-            FROM (
-                SELECT ip_id
-                FROM names 
-                WHERE af=%s
-            ) AS results
-        );
-        """, (table, ))
-        ret = await cur.execute(sql, (
-            af,
-        ))
-
-    await db_con.commit()
-
-async def verified_write_name(db_con, cur, serv, behavior, updated, name, value, owner_pub, af, ip_str, sys_clock):
-    # Convert ip_str into an IPRange instance.
-    cidr = 32 if af == IP4 else 128
-    ipr = IPRange(ip_str, cidr=cidr)
-
-    # Unneeded records get deleted.
-    if behavior != BEHAVIOR_DONT_BUMP:
-        await verified_pruning(db_con, cur, serv, sys_clock.time())
-
-    # Record IP if needed and get its ID.
-    # If it's V6 allocation limits are enforced on subnets.
-    ip_id = await record_ip(af, (cur, ipr,), serv, sys_clock)
-    if ip_id is None:
-        return
-
-    # Record name if needed and get its ID.
-    # Also supports transferring a name to a new IP.
-    name_row = await record_name(cur, serv, af, ip_id, name, value, owner_pub, updated, sys_clock)
-    if name_row is None:
-        return
-
-    # Save current changes.
-    await db_con.commit()
+# Only needed for the MySQL backend.
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
 
 class PNPServer(Daemon):
-    def __init__(self, db_user, db_pass, db_name, reply_sk, reply_pk, sys_clock, v4_name_limit=V4_NAME_LIMIT, v6_name_limit=V6_NAME_LIMIT, min_name_duration=MIN_NAME_DURATION, v6_addr_expiry=V6_ADDR_EXPIRY):
+    def __init__(self, db_user, db_pass, db_name, reply_sk, reply_pk, sys_clock, v4_name_limit=V4_NAME_LIMIT, v6_name_limit=V6_NAME_LIMIT, min_name_duration=MIN_NAME_DURATION, v6_addr_expiry=V6_ADDR_EXPIRY, db_pool_size=PNP_DB_POOL_SIZE, storage=None, crypto_workers=PNP_CRYPTO_WORKERS):
         self.__name__ = "PNPServer"
         self.db_user = db_user
         self.db_pass = db_pass
         self.db_name = db_name
+        self.db_pool_size = db_pool_size
+        self.storage = storage
         self.reply_sk = SigningKey.from_string(reply_sk, curve=SECP256k1)
+        self.reply_sk_buf = reply_sk
+        self.crypto_workers = crypto_workers
+        self.crypto = None
         self.reply_pk = reply_pk
         self.sys_clock = sys_clock
         self.v4_name_limit = v4_name_limit
@@ -363,7 +57,46 @@ class PNPServer(Daemon):
         self.debug = False
         super().__init__()
 
-    def serv_resp(self, pkt):
+    async def db_connect(self):
+        return await aiomysql.connect(
+            user=self.db_user, 
+            password=self.db_pass,
+            db=self.db_name
+        )
+
+    # Defaults to MySQL if no storage was given.
+    def get_storage(self):
+        if self.storage is None:
+            if aiomysql is None:
+                raise Exception("aiomysql is needed for MySQL storage.")
+
+            self.storage = MySQLStorage(self.db_connect, self.db_pool_size)
+
+        return self.storage
+
+    # Decrypt, verify, and encrypt off the event loop.
+    def get_crypto(self):
+        if self.crypto is None:
+            self.crypto = PNPCrypto(self.reply_sk_buf, self.crypto_workers)
+
+        return self.crypto
+
+    # Open the DB before taking requests.
+    async def start(self):
+        self.get_crypto()
+        await self.get_storage().start()
+        return self
+
+    async def close(self):
+        await super().close()
+        if self.storage is not None:
+            await self.storage.close()
+
+        if self.crypto is not None:
+            self.crypto.close()
+            self.crypto = None
+
+    async def serv_resp(self, pkt):
         reply_pk = pkt.reply_pk
 
         # Replace received packet reply address with our own.
@@ -374,10 +107,35 @@ class PNPServer(Daemon):
 
         # Send encrypted if supported.
         if reply_pk is not None:
-            buf = encrypt(reply_pk, buf)
+            buf = await self.get_crypto().encrypt(reply_pk, buf)
 
         return buf
 
+    # Response to an unsigned fetch.
+    async def fetch_resp(self, pkt, row):
+        # A fetch failed.
+        if row is None:
+            log(fstr("Error: fetch {0} failed!", (pkt.name,)))
+            resp = PNPPacket(
+                name=pkt.name,
+                value=b"",
+                updated=0,
+                vkc=pkt.vkc,
+                pkid=pkt.pkid,
+                reply_pk=pkt.reply_pk,
+            )
+        else:
+            resp = PNPPacket(
+                name=pkt.name,
+                value=row[2],
+                updated=row[6],
+                vkc=row[3],
+                pkid=pkt.pkid,
+                reply_pk=pkt.reply_pk,
+            )
+
+        return await self.serv_resp(resp)
+
     def set_debug(self, val):
         self.debug = val
         
@@ -386,82 +144,60 @@ class PNPServer(Daemon):
         self.v6_iface_limit = v6_iface_limit
 
     async def msg_cb(self, msg, client_tup, pipe):
-        db_con = None
         try:
             pipe.stream.set_dest_tup(client_tup)
-            msg = decrypt(self.reply_sk, msg)
+            crypto = self.get_crypto()
             cidr = 32 if pipe.route.af == IP4 else 128
-            pkt = PNPPacket.unpack(msg)
-            pnp_msg = pkt.get_msg_to_sign()
-            db_con = await aiomysql.connect(
-                user=self.db_user, 
-                password=self.db_pass,
-                db=self.db_name
-            )
-
+            pkt, pnp_msg = await crypto.open_req(msg)
+
+            # Popular names are fetched without using the DB.
+            storage = self.get_storage()
+            if pkt.sig is None or not len(pkt.sig):
+                row = storage.cached_name(pkt.name, self.min_name_duration)
+                if row is not NAME_CACHE_MISS:
+                    await proto_send(pipe, await self.fetch_resp(pkt, row))
+                    return
 
-            async with db_con.cursor() as cur:
+            # Uncommitted changes are rolled back on exit.
+            async with storage.checkout() as db:
                 #await cur.execute("SET SESSION TRANSACTION ISOLATION LEVEL SERIALIZABLE")
 
-                row = await fetch_name(cur, pkt.name, DB_READ_LOCK)
+                row = await storage.fetch_name(db, pkt.name, DB_READ_LOCK)
                 if row is not None:
                     # If no sig fetch name value.
                     if pkt.sig is None or not len(pkt.sig):
-                        resp = PNPPacket(
-                            name=pkt.name,
-                            value=row[2],
-                            updated=row[6],
-                            vkc=row[3],
-                            pkid=pkt.pkid,
-                            reply_pk=pkt.reply_pk,
-                        )
-
-                        buf = self.serv_resp(resp)
+                        buf = await self.fetch_resp(pkt, row)
                         await proto_send(pipe, buf)
                         return
 
                     # Ensure valid sig for next delete op.
-                    vk = VerifyingKey.from_string(
-                        row[3],
-                        curve=SECP256k1
-                    )
-                    vk.verify(pkt.sig, pnp_msg)
+                    if not await crypto.verify(row[3], pkt.sig, pnp_msg):
+                        raise Exception("pkt sig is invalid.")
 
                     # Delete pre-existing value.
                     if not len(pkt.value):
-                        await verified_delete_name(
-                            db_con,
-                            cur,
+                        await storage.verified_delete_name(
+                            db,
                             pkt.name,
                             pkt.updated
                         )
-                        buf = self.serv_resp(pkt)
+                        buf = await self.serv_resp(pkt)
                         await proto_send(pipe, buf)
                         return
 
                 # A fetch failed.
                 if pkt.sig is None or not len(pkt.sig):
-                    log(fstr("Error: fetch {0} failed!", (pkt.name,)))
-                    resp = PNPPacket(
-                        name=pkt.name,
-                        value=b"",
-                        updated=0,
-                        vkc=pkt.vkc,
-                        pkid=pkt.pkid,
-                        reply_pk=pkt.reply_pk,
-                    )
-                    buf = self.serv_resp(resp)
+                    buf = await self.fetch_resp(pkt, row)
                     await proto_send(pipe, buf)
                     return
 
                 # Check signature is valid.
-                if not pkt.is_valid_sig():
+                if not await crypto.verify(pkt.vkc, pkt.sig, pnp_msg):
                     raise Exception("pkt sig is invalid.")
 
                 # Create a new name entry.
-                await verified_write_name(
-                    db_con,
-                    cur,
+                await storage.verified_write_name(
+                    db,
                     self,
                     pkt.behavior,
                     pkt.updated,
@@ -473,20 +209,30 @@ class PNPServer(Daemon):
                     self.sys_clock
                 )
 
-                buf = self.serv_resp(pkt)
+                buf = await self.serv_resp(pkt)
                 await proto_send(pipe, buf)
         except:
-            await db_con.rollback()
             log_exception()
-        finally:
-            if db_con is not None:
-                db_con.close()
 
 async def start_pnp_server(bind_port):
     i = await Interface()
 
+    # Use an embedded SQLite DB instead of MySQL.
+    storage = None
+    if "PNP_SQLITE_PATH" in os.environ:
+        # Batching commits trades durability for throughput.
+        commit_delay = SQLITE_COMMIT_DELAY
+        if "PNP_SQLITE_COMMIT_DELAY" in os.environ:
+            commit_delay = float(os.environ["PNP_SQLITE_COMMIT_DELAY"])
+
+        storage = SQLiteStorage(
+            os.environ["PNP_SQLITE_PATH"],
+            commit_delay=commit_delay
+        )
+        db_pass = None
+
     # Load mysql root password details.
-    if "PNP_DB_PW" in os.environ:
+    elif "PNP_DB_PW" in os.environ:
         db_pass = os.environ["PNP_DB_PW"]
     else:
         db_pass = input("db pass: ")
@@ -503,6 +249,12 @@ async def start_pnp_server(bind_port):
     else:
         reply_sk_hex = input("reply sk: ")
 
+    # Run crypto in a process per CPU unless overridden.
+    if "PNP_CRYPTO_WORKERS" in os.environ:
+        crypto_workers = int(os.environ["PNP_CRYPTO_WORKERS"])
+    else:
+        crypto_workers = os.cpu_count() or 1
+
     # Load PNP server class with DB details.
     sys_clock = await SysClock(i).start()
     serv = PNPServer(
@@ -512,8 +264,13 @@ async def start_pnp_server(bind_port):
         h_to_b(reply_sk_hex),
         h_to_b(reply_pk_hex),
         sys_clock,
+        storage=storage,
+        crypto_workers=crypto_workers,
     )
 
+    # Open DB connections before taking requests.
+    await serv.start()
+
     # Start the server listening on public routes.
     print("Now starting PNP serv on ...")
     print(reply_pk_hex)
@@ -0,0 +1,450 @@
+"""
+Storage backends for the PNP server.
+
+A backend hands out a connection for each request:
+
+    async with storage.checkout() as db:
+        row = await storage.fetch_name(db, name)
+
+'db' has a .con with async commit() / rollback() and a .cur with
+async execute() / fetchone() and .lastrowid -- the same interface
+as aiomysql. The name operations run the SQL from pnp_db against
+it. Anything not committed is rolled back when the checkout ends.
+
+    - MySQLStorage: a DBPool of aiomysql connections.
+    - SQLiteStorage: an embedded SQLite DB in WAL mode. All queries
+    run on one dedicated thread. Requests are serialized and each
+    one runs in a savepoint. By default every request is committed
+    before its reply is sent. Setting commit_delay > 0 commits
+    released savepoints together every commit_batch requests or
+    commit_delay seconds which saves an fsync per request, but a
+    crash may then lose the last batch of commits (which clients
+    will have seen as done.)
+
+Reads of names are cached in an LRU with a TTL. Writes, deletes,
+and pruning through the storage invalidate the cache.
+"""
+
+import asyncio
+import re
+from abc import ABC, abstractmethod
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ...utility.utils import *
+from .pnp_pool import *
+from .pnp_db import *
+
+# Commit after this many request transactions.
+SQLITE_COMMIT_BATCH = 32
+
+# Or after this many seconds. 0 = commit every request.
+SQLITE_COMMIT_DELAY = 0
+
+# SQLite INTEGER is a signed 64 bit int.
+SQLITE_INT_MAX = 2 ** 63 - 1
+SQLITE_UINT_RANGE = 2 ** 64
+
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS ipv4s (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        v4_val INTEGER NOT NULL UNIQUE,
+        timestamp INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ipv6s (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        v6_glob_main INTEGER NOT NULL,
+        v6_glob_extra INTEGER NOT NULL,
+        v6_lan_id INTEGER NOT NULL,
+        v6_iface_id INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,
+        UNIQUE (v6_glob_main, v6_glob_extra, v6_lan_id, v6_iface_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS names (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name BLOB NOT NULL UNIQUE,
+        value BLOB NOT NULL,
+        owner_pub BLOB NOT NULL,
+        af INTEGER NOT NULL,
+        ip_id INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS names_ip ON names (af, ip_id)",
+]
+
+# Max name rows to cache.
+PNP_NAME_CACHE_SIZE = 10000
+
+# Seconds a cached name row is used for.
+PNP_NAME_CACHE_TTL = 60
+
+# Returned by the name cache when a name isn't cached.
+NAME_CACHE_MISS = object()
+
+# Row locks aren't needed when requests are serialized.
+SQLITE_FOR_UPDATE_P = re.compile(r"\s*FOR UPDATE", re.IGNORECASE)
+
+# Convert MySQL placeholders + locks for SQLite.
+def sqlite_sql(sql):
+    return SQLITE_FOR_UPDATE_P.sub("", sql).replace("%s", "?")
+
+# Unsigned 64 bit ints (like the IPv6 iface ID) don't fit in an
+# SQLite INTEGER so they're stored as their two's complement.
+# The iface ID is only compared in queries so it's never converted back.
+def sqlite_int(x):
+    if isinstance(x, int) and x > SQLITE_INT_MAX:
+        return x - SQLITE_UINT_RANGE
+
+    return x
+
+def sqlite_params(params):
+    return tuple([sqlite_int(param) for param in params])
+
+"""
+Rows for names that don't exist (None) are cached too. Any
+invalidation bumps 'gen'. A read only caches its row if gen hasn't
+changed since the read started so a write that commits while a
+read is in progress can't leave an old row in the cache.
+"""
+class NameCache():
+    def __init__(self, size=PNP_NAME_CACHE_SIZE, ttl=PNP_NAME_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.rows = OrderedDict()
+        self.gen = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    # max_age = treat names not updated for this long as expired.
+    def get(self, name, max_age=None):
+        entry = self.rows.get(name)
+        if entry is None:
+            self.misses += 1
+            return NAME_CACHE_MISS
+
+        row, cached_at = entry
+        now = time.time()
+        expired = now - cached_at >= self.ttl
+        if row is not None and max_age is not None:
+            expired = expired or (now - row[6] >= max_age)
+
+        if expired:
+            del self.rows[name]
+            self.misses += 1
+            return NAME_CACHE_MISS
+
+        self.rows.move_to_end(name)
+        self.hits += 1
+        return row
+
+    def put(self, name, row, gen):
+        if gen != self.gen or not self.size:
+            return
+
+        self.rows[name] = [row, time.time()]
+        self.rows.move_to_end(name)
+        if len(self.rows) > self.size:
+            self.rows.popitem(last=False)
+
+    def invalidate(self, name):
+        self.gen += 1
+        self.rows.pop(name, None)
+
+    def clear(self):
+        self.gen += 1
+        self.rows = OrderedDict()
+
+    def stats(self):
+        return {
+            "size": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+class PNPStorage(ABC):
+    def __init__(self, cache_size=PNP_NAME_CACHE_SIZE, cache_ttl=PNP_NAME_CACHE_TTL):
+        self.name_cache = NameCache(cache_size, cache_ttl)
+
+    async def start(self):
+        return self
+
+    async def close(self):
+        pass
+
+    # Returns an async context manager that yields a DBPoolCon.
+    @abstractmethod
+    def checkout(self):
+        pass
+
+    # Returns NAME_CACHE_MISS if the name isn't cached.
+    def cached_name(self, name, max_age=None):
+        return self.name_cache.get(name, max_age)
+
+    async def fetch_name(self, db, name, lock=DB_WRITE_LOCK):
+        # Locking reads are part of a write.
+        if lock == DB_WRITE_LOCK:
+            return await fetch_name(db.cur, name, lock)
+
+        gen = self.name_cache.gen
+        row = await fetch_name(db.cur, name, lock)
+        self.name_cache.put(name, row, gen)
+        return row
+
+    async def record_name(self, db, serv, af, ip_id, name, value, owner_pub, updated, sys_clock):
+        self.name_cache.invalidate(name)
+        return await record_name(
+            db.cur,
+            serv,
+            af,
+            ip_id,
+            name,
+            value,
+            owner_pub,
+            updated,
+            sys_clock
+        )
+
+    async def verified_write_name(self, db, serv, behavior, updated, name, value, owner_pub, af, ip_str, sys_clock):
+        """
+        Names expired by the pruning this may do are skipped by
+        cached_name when it's given the name duration so the
+        whole cache isn't cleared on every write.
+        """
+        try:
+            return await verified_write_name(
+                db.con,
+                db.cur,
+                serv,
+                behavior,
+                updated,
+                name,
+                value,
+                owner_pub,
+                af,
+                ip_str,
+                sys_clock
+            )
+        finally:
+            self.name_cache.invalidate(name)
+
+    async def verified_delete_name(self, db, name, updated):
+        try:
+            return await verified_delete_name(db.con, db.cur, name, updated)
+        finally:
+            self.name_cache.invalidate(name)
+
+    async def verified_pruning(self, db, serv, updated):
+        try:
+            return await verified_pruning(db.con, db.cur, serv, updated)
+        finally:
+            self.name_cache.clear()
+
+class MySQLStorage(PNPStorage):
+    def __init__(self, connect, pool_size=PNP_DB_POOL_SIZE):
+        super().__init__()
+        self.pool = DBPool(connect, pool_size)
+
+    async def start(self, min_open=1):
+        await self.pool.start(min_open)
+        return self
+
+    async def close(self):
+        await self.pool.close()
+
+    def checkout(self):
+        return DBCheckout(self.pool)
+
+    def stats(self):
+        return self.pool.stats()
+
+class SQLiteCursor():
+    def __init__(self, storage):
+        self.storage = storage
+        self.rows = []
+        self.lastrowid = None
+        self.rowcount = 0
+
+    async def execute(self, sql, params=()):
+        self.rows, self.rowcount, self.lastrowid = await self.storage.run(
+            self.storage.db_execute,
+            sqlite_sql(sql),
+            sqlite_params(params)
+        )
+
+        return self.rowcount
+
+    async def fetchone(self):
+        if not len(self.rows):
+            return None
+
+        return self.rows.pop(0)
+
+    async def fetchall(self):
+        rows = self.rows
+        self.rows = []
+        return rows
+
+class SQLiteCon():
+    def __init__(self, storage):
+        self.storage = storage
+
+    # Keep changes so far. They're written with the next batch.
+    async def commit(self):
+        await self.storage.run(self.storage.db_savepoint_release)
+        self.storage.commit_pending += 1
+        await self.storage.run(self.storage.db_savepoint)
+
+    # Undo changes since the last commit.
+    async def rollback(self):
+        await self.storage.run(self.storage.db_savepoint_rollback)
+
+class SQLiteCheckout():
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def __aenter__(self):
+        # One request transaction at a time.
+        await self.storage.lock.acquire()
+        try:
+            await self.storage.run(self.storage.db_savepoint)
+        except Exception:
+            self.storage.lock.release()
+            raise
+
+        return self.storage.checked_out
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self.storage.run(self.storage.db_savepoint_rollback)
+            await self.storage.run(self.storage.db_savepoint_release)
+            await self.storage.commit_batch_maybe()
+        finally:
+            self.storage.lock.release()
+
+class SQLiteStorage(PNPStorage):
+    def __init__(self, path, commit_batch=SQLITE_COMMIT_BATCH, commit_delay=SQLITE_COMMIT_DELAY):
+        super().__init__()
+        self.path = path
+        self.commit_batch = commit_batch
+        self.commit_delay = commit_delay
+        self.db = None
+        self.lock = asyncio.Lock()
+        self.commit_pending = 0
+        self.commit_handle = None
+        self.commit_tasks = []
+
+        # Dedicated DB thread.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        # Handed out by checkout.
+        self.checked_out = DBPoolCon(SQLiteCon(self), SQLiteCursor(self))
+
+    async def run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    ######################################################
+    # Ran in the DB thread.
+    ######################################################
+    def db_open(self):
+        # Transactions are managed manually.
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for sql in SQLITE_SCHEMA:
+            self.db.execute(sql)
+
+    def db_execute(self, sql, params):
+        # Request savepoints live inside a batch transaction.
+        if not self.db.in_transaction:
+            self.db.execute("BEGIN")
+
+        cur = self.db.execute(sql, params)
+        return cur.fetchall(), cur.rowcount, cur.lastrowid
+
+    def db_savepoint(self):
+        if not self.db.in_transaction:
+            self.db.execute("BEGIN")
+
+        self.db.execute("SAVEPOINT pnp_req")
+
+    def db_savepoint_release(self):
+        self.db.execute("RELEASE SAVEPOINT pnp_req")
+
+    def db_savepoint_rollback(self):
+        self.db.execute("ROLLBACK TO SAVEPOINT pnp_req")
+
+    def db_commit(self):
+        if self.db.in_transaction:
+            self.db.execute("COMMIT")
+
+    def db_close(self):
+        if self.db is not None:
+            self.db_commit()
+            self.db.close()
+            self.db = None
+
+    ######################################################
+    # Batched commits.
+    ######################################################
+    async def commit_batch_maybe(self):
+        # End read-only transactions so WAL checkpoints can run.
+        if not self.commit_pending:
+            await self.run(self.db_commit)
+            return
+
+        if self.commit_pending >= self.commit_batch or not self.commit_delay:
+            await self.flush_locked()
+            return
+
+        if self.commit_handle is None:
+            self.commit_handle = asyncio.get_event_loop().call_later(
+                self.commit_delay,
+                self.on_commit_timer
+            )
+
+    def on_commit_timer(self):
+        self.commit_handle = None
+        self.commit_tasks = rm_done_tasks(self.commit_tasks)
+        self.commit_tasks.append(
+            create_task(
+                async_wrap_errors(
+                    self.flush()
+                )
+            )
+        )
+
+    async def flush_locked(self):
+        if self.commit_handle is not None:
+            self.commit_handle.cancel()
+            self.commit_handle = None
+
+        await self.run(self.db_commit)
+        self.commit_pending = 0
+
+    # Write committed requests to disk.
+    async def flush(self):
+        async with self.lock:
+            await self.flush_locked()
+
+    async def start(self):
+        await self.run(self.db_open)
+        return self
+
+    async def close(self):
+        await self.flush()
+        await self.run(self.db_close)
+        self.executor.shutdown(wait=True)
+
+    def checkout(self):
+        return SQLiteCheckout(self)
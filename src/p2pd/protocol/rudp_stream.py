@@ -0,0 +1,495 @@
+"""
+The ACK UDP code only gives best-effort delivery of single messages
+without any ordering. That's fine for signaling but bulk transfers
+need something closer to TCP. Especially over TURN relays which
+only support UDP.
+
+This module implements a byte stream on top of a UDP pipe:
+
+    - Data is split into segments with sequential seq numbers.
+    - Up to a window of segments may be in flight at once.
+    - The receiver puts segments back in order and tells the
+    sender how much buffer space it has left (flow control.)
+    - ACKs are cumulative with SACK ranges for segments that
+    arrived out of order.
+    - The congestion window grows by one segment per ACK in slow
+    start and by 1 / cwnd per ACK after that. Loss halves it
+    (fast retransmit after 3 duplicate ACKs) or resets it to one
+    segment on a timeout (AIMD.)
+    - Retransmit timeouts use the same RTT estimator and timer
+    wheel as ACK UDP. Timed out segments are marked lost and
+    resent as the congestion window allows.
+
+Both sides open a stream to the other (like a P2P con) and use
+send / recv like a TCP stream. recv returns b"" once the other
+side has closed and all its data has been read.
+"""
+
+import asyncio
+import struct
+from collections import deque
+from ..utility.utils import *
+from ..utility.timer_wheel import *
+from ..net.net import *
+from ..net.pipe.pipe_utils import *
+from .ack_udp import *
+
+# Frame types.
+RUDP_DATA = 0x10
+RUDP_ACK = 0x11
+RUDP_FIN = 0x12
+
+# type, seq + payload.
+RUDP_DATA_HDR = struct.Struct("!BQ")
+
+# type, cumulative ack, window + SACK ranges.
+RUDP_ACK_HDR = struct.Struct("!BQI")
+RUDP_RANGE = struct.Struct("!QI")
+RUDP_MAX_RANGES = 32
+
+# Duplicate ACKs before a fast retransmit.
+RUDP_DUP_ACKS = 3
+
+class RUDPStream():
+    def __init__(self, pipe, dest_tup, conf=NET_CONF, own_pipe=False):
+        self.pipe = pipe
+
+        # Close the pipe with the stream if it was opened for it.
+        self.own_pipe = own_pipe
+        self.dest_tup = client_tup_norm(dest_tup)
+        self.conf = conf
+        self.mss = conf["rudp_mss"]
+        self.sub = (b"", self.dest_tup)
+        self.timers = TimerWheel()
+        self.rtt = RTTEstimator()
+        self.tasks = []
+        self.transport = None
+        self.is_running = False
+
+        # Sender state.
+        self.snd_next = 1
+        self.snd_una = 1
+        self.recover_seq = 1
+        self.send_queue = deque()
+        self.send_buffered = 0
+        self.inflight = {}
+        self.inflight_bytes = 0
+
+        # [seq] = None for segments waiting to be resent.
+        self.lost = {}
+        self.cwnd = conf["rudp_init_cwnd"]
+        self.ssthresh = conf["rudp_max_cwnd"]
+        self.peer_wnd = self.mss * self.cwnd
+        self.dup_acks = 0
+        self.persist_timer = None
+        self.fin_sent = False
+        self.send_space = asyncio.Event()
+        self.send_space.set()
+        self.all_acked = asyncio.Event()
+        self.all_acked.set()
+
+        # Receiver state.
+        self.rcv_next = 1
+        self.ooo = {}
+        self.ooo_bytes = 0
+        self.recv_buf = bytearray()
+        self.recv_event = asyncio.Event()
+        self.eof = False
+        self.error = None
+
+    # Start processing frames from the peer.
+    def start(self):
+        # Send UDP directly instead of via a task per frame.
+        stream = getattr(self.pipe, "stream", None)
+        if type(self.pipe).send is PipeEvents.send and stream is not None:
+            if isinstance(stream.handle, DATAGRAM_TYPES):
+                self.transport = stream.handle
+
+        self.pipe.subscribe(self.sub, self.on_frame)
+        self.is_running = True
+        return self
+
+    def send_frame(self, buf):
+        if self.transport is not None:
+            batch = self.pipe.stream.batch
+            if batch is not None:
+                batch.sendto(buf, self.dest_tup)
+            else:
+                self.transport.sendto(buf, self.dest_tup)
+
+            return
+
+        self.tasks = rm_done_tasks(self.tasks)
+        task = asyncio.ensure_future(
+            async_wrap_errors(
+                self.pipe.send(buf, self.dest_tup)
+            )
+        )
+        self.tasks.append(task)
+
+    def on_frame(self, data, client_tup, pipe):
+        if not self.is_running or len(data) < 1:
+            return
+
+        frame_type = data[0]
+        if frame_type in (RUDP_DATA, RUDP_FIN):
+            if len(data) < RUDP_DATA_HDR.size:
+                return
+
+            _, seq = RUDP_DATA_HDR.unpack_from(data, 0)
+            payload = bytes(data[RUDP_DATA_HDR.size:])
+            self.on_data(frame_type, seq, payload)
+            return
+
+        if frame_type == RUDP_ACK:
+            if len(data) < RUDP_ACK_HDR.size:
+                return
+
+            _, cum_ack, wnd = RUDP_ACK_HDR.unpack_from(data, 0)
+            ranges = []
+            range_no = (len(data) - RUDP_ACK_HDR.size) // RUDP_RANGE.size
+            for i in range(0, min(range_no, RUDP_MAX_RANGES)):
+                offset = RUDP_ACK_HDR.size + (i * RUDP_RANGE.size)
+                ranges.append(RUDP_RANGE.unpack_from(data, offset))
+
+            self.on_ack(cum_ack, wnd, ranges)
+
+    ######################################################
+    # Receiver.
+    ######################################################
+    def recv_window(self):
+        used = len(self.recv_buf) + self.ooo_bytes
+        return max(self.conf["rudp_recv_buf"] - used, 0)
+
+    def deliver(self, frame_type, payload):
+        if frame_type == RUDP_FIN:
+            self.eof = True
+        else:
+            self.recv_buf += payload
+
+        self.recv_event.set()
+
+    def on_data(self, frame_type, seq, payload):
+        if seq == self.rcv_next:
+            # In order segments are always accepted.
+            # This also handles window probes.
+            self.deliver(frame_type, payload)
+            self.rcv_next += 1
+            while self.rcv_next in self.ooo:
+                frame_type, payload = self.ooo.pop(self.rcv_next)
+                self.ooo_bytes -= len(payload)
+                self.deliver(frame_type, payload)
+                self.rcv_next += 1
+        elif seq > self.rcv_next and seq not in self.ooo:
+            # Only buffer out of order segments within the window.
+            if len(payload) <= self.recv_window():
+                self.ooo[seq] = [frame_type, payload]
+                self.ooo_bytes += len(payload)
+
+        self.send_ack()
+
+    def send_ack(self):
+        buf = bytearray(RUDP_ACK_HDR.pack(
+            RUDP_ACK,
+            self.rcv_next,
+            self.recv_window()
+        ))
+
+        # Out of order segments are selectively ACKed.
+        if len(self.ooo):
+            ranges = []
+            for seq in sorted(self.ooo):
+                if len(ranges) and sum(ranges[-1]) == seq:
+                    ranges[-1][1] += 1
+                else:
+                    ranges.append([seq, 1])
+
+            for start, run in ranges[:RUDP_MAX_RANGES]:
+                buf += RUDP_RANGE.pack(start, run)
+
+        self.send_frame(buf)
+
+    # Returns up to n bytes. b"" = closed. None = timeout.
+    async def recv(self, n=None, timeout=2):
+        while not len(self.recv_buf) and not self.eof:
+            if self.error is not None:
+                raise self.error
+
+            self.recv_event.clear()
+            try:
+                await asyncio.wait_for(self.recv_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        if not len(self.recv_buf):
+            return b""
+
+        # Remember if the sender may be stuck on a small window.
+        was_small = self.recv_window() < self.mss
+        size = len(self.recv_buf) if n is None else min(n, len(self.recv_buf))
+        out = bytes(self.recv_buf[:size])
+        del self.recv_buf[:size]
+
+        # Tell the sender the window opened.
+        if was_small and self.recv_window() >= self.mss:
+            self.send_ack()
+
+        return out
+
+    # Read exactly n bytes (or less if the stream ended.)
+    async def recv_all(self, n, timeout=2):
+        out = bytearray()
+        while len(out) < n:
+            buf = await self.recv(n - len(out), timeout)
+            if not buf:
+                break
+
+            out += buf
+
+        return bytes(out)
+
+    ######################################################
+    # Sender.
+    ######################################################
+    def queue_segment(self, frame_type, payload):
+        self.send_queue.append([frame_type, payload])
+        self.send_buffered += len(payload)
+        self.all_acked.clear()
+
+    async def send(self, data, dest_tup=None):
+        if self.error is not None:
+            raise self.error
+
+        if self.fin_sent or not self.is_running:
+            raise Exception("RUDP stream is closed.")
+
+        view = memoryview(data)
+        for offset in range(0, len(view), self.mss):
+            # Wait for space in the send buffer.
+            while self.send_buffered >= self.conf["rudp_send_buf"]:
+                self.send_space.clear()
+                await self.send_space.wait()
+                if self.error is not None:
+                    raise self.error
+
+            self.queue_segment(RUDP_DATA, bytes(view[offset:offset + self.mss]))
+            self.pump()
+
+        return len(data)
+
+    # Segments sent and not yet ACKed or timed out.
+    def outstanding(self):
+        return len(self.inflight) - len(self.lost)
+
+    def can_send(self, payload):
+        if self.outstanding() >= int(self.cwnd):
+            return False
+
+        # Peer window is in bytes.
+        if self.inflight_bytes + len(payload) > self.peer_wnd:
+            return False
+
+        return True
+
+    # Send queued segments while the windows allow it.
+    def pump(self):
+        # Lost segments go first and only as cwnd allows.
+        while len(self.lost):
+            if self.outstanding() >= int(self.cwnd):
+                return
+
+            seq = min(self.lost)
+            del self.lost[seq]
+            self.transmit(seq)
+
+        while len(self.send_queue):
+            frame_type, payload = self.send_queue[0]
+            if not self.can_send(payload):
+                break
+
+            self.send_queue.popleft()
+            self.send_segment(frame_type, payload)
+
+        # Probe a zero window so an update isn't missed.
+        if len(self.send_queue) and not len(self.inflight):
+            if self.persist_timer is None:
+                self.persist_timer = self.timers.add(
+                    self.rtt.rto,
+                    self.on_persist
+                )
+
+    def send_segment(self, frame_type, payload):
+        seq = self.snd_next
+        self.snd_next += 1
+        self.inflight[seq] = {
+            "type": frame_type,
+            "payload": payload,
+            "sent": self.timers.get_loop().time(),
+            "transmits": 0,
+            "timer": None
+        }
+        self.inflight_bytes += len(payload)
+        self.transmit(seq)
+
+    def transmit(self, seq):
+        segment = self.inflight[seq]
+        segment["transmits"] += 1
+        rto = self.rtt.rto * (2 ** (segment["transmits"] - 1))
+        segment["timer"] = self.timers.add(
+            min(rto, ACK_MAX_RTO),
+            self.on_timeout,
+            seq
+        )
+
+        hdr = RUDP_DATA_HDR.pack(segment["type"], seq)
+        self.send_frame(hdr + segment["payload"])
+
+    def on_persist(self):
+        self.persist_timer = None
+        if len(self.send_queue) and not len(self.inflight):
+            self.rtt.backoff()
+            frame_type, payload = self.send_queue.popleft()
+            self.send_segment(frame_type, payload)
+
+    # Multiplicative decrease once per window of data.
+    def on_loss(self, timeout):
+        if self.snd_una < self.recover_seq:
+            return
+
+        self.recover_seq = self.snd_next
+        self.ssthresh = max(len(self.inflight) / 2, 2)
+        if timeout:
+            self.cwnd = 1
+        else:
+            self.cwnd = self.ssthresh
+
+    def on_timeout(self, seq):
+        segment = self.inflight.get(seq)
+        if segment is None:
+            return
+
+        if segment["transmits"] >= self.conf["rudp_max_tries"]:
+            self.fail(Exception("RUDP stream peer not responding."))
+            return
+
+        # Backoff is per segment so a burst of timeouts
+        # doesn't inflate the shared RTO.
+        self.on_loss(timeout=True)
+        segment["timer"] = None
+        self.lost[seq] = None
+        self.pump()
+
+    def ack_segment(self, seq, now):
+        segment = self.inflight.pop(seq)
+        self.lost.pop(seq, None)
+        if segment["timer"] is not None:
+            self.timers.cancel(segment["timer"])
+        self.inflight_bytes -= len(segment["payload"])
+        self.send_buffered -= len(segment["payload"])
+
+        # Karn's algorithm -- skip retransmitted segments.
+        if segment["transmits"] == 1:
+            self.rtt.update(now - segment["sent"])
+
+        # Slow start then congestion avoidance.
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+        else:
+            self.cwnd += 1 / self.cwnd
+
+        self.cwnd = min(self.cwnd, self.conf["rudp_max_cwnd"])
+
+    def on_ack(self, cum_ack, wnd, ranges):
+        now = self.timers.get_loop().time()
+        self.peer_wnd = wnd
+        cum_ack = min(cum_ack, self.snd_next)
+
+        # Cumulative ACK.
+        for seq in range(self.snd_una, cum_ack):
+            if seq in self.inflight:
+                self.ack_segment(seq, now)
+
+        # Selective ACKs.
+        for start, run in ranges:
+            end = min(start + run, self.snd_next)
+            for seq in range(max(start, cum_ack), end):
+                if seq in self.inflight:
+                    self.ack_segment(seq, now)
+
+        # Detect loss from duplicate ACKs.
+        if cum_ack > self.snd_una:
+            self.snd_una = cum_ack
+            self.dup_acks = 0
+        elif cum_ack in self.inflight:
+            self.dup_acks += 1
+            if self.dup_acks == RUDP_DUP_ACKS:
+                self.on_loss(timeout=False)
+                if cum_ack not in self.lost:
+                    self.timers.cancel(self.inflight[cum_ack]["timer"])
+                    self.transmit(cum_ack)
+
+        if self.send_buffered < self.conf["rudp_send_buf"]:
+            self.send_space.set()
+
+        if not len(self.inflight) and not len(self.send_queue):
+            self.all_acked.set()
+
+        self.pump()
+
+    ######################################################
+    # Cleanup.
+    ######################################################
+    def fail(self, error):
+        self.error = error
+        self.stop()
+        self.send_space.set()
+        self.all_acked.set()
+        self.recv_event.set()
+
+    def stop(self):
+        self.is_running = False
+        for segment in self.inflight.values():
+            if segment["timer"] is not None:
+                self.timers.cancel(segment["timer"])
+
+        if self.persist_timer is not None:
+            self.timers.cancel(self.persist_timer)
+            self.persist_timer = None
+
+        self.timers.stop()
+        self.pipe.unsubscribe(self.sub)
+
+    # Send a FIN after queued data and wait for it to be ACKed.
+    async def close(self, timeout=4):
+        if not self.is_running:
+            await self.close_pipe()
+            return
+
+        if not self.fin_sent:
+            self.fin_sent = True
+            self.queue_segment(RUDP_FIN, b"")
+            self.pump()
+
+        try:
+            await asyncio.wait_for(self.all_acked.wait(), timeout)
+        except asyncio.TimeoutError:
+            log("RUDP stream close timed out waiting for ACKs.")
+
+        self.stop()
+        if len(self.tasks):
+            await gather_or_cancel(self.tasks, timeout)
+
+        await self.close_pipe()
+
+    async def close_pipe(self):
+        if self.own_pipe:
+            self.own_pipe = False
+            await self.pipe.close()
+
+# Open a stream to dest over a (new) UDP pipe.
+async def rudp_open(dest_tup, route=None, pipe=None, conf=NET_CONF):
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = await pipe_open(UDP, route=route, conf=conf)
+
+    return RUDPStream(pipe, dest_tup, conf, own_pipe).start()
@@ -150,15 +150,31 @@ class STUNClient():
 
     # Return only your remote IP.
     async def get_wan_ip(self, pipe=None):
-        pipe = await self._get_dest_pipe(pipe)
-        reply = await get_stun_reply(
-            self.mode,
-            self.dest,
-            self.dest,
-            pipe
-        )
+        # Lookups over UDP without a pipe share a socket.
+        if self.proto == UDP and not isinstance(pipe, PipeEvents):
+            route = pipe or self.interface.route(self.af)
+            self.dest = await resolv_dest(self.af, self.dest, self.interface)
+            mux = await stun_mux_open(route, conf=self.conf)
+            try:
+                reply = await get_stun_reply(
+                    self.mode,
+                    self.dest,
+                    self.dest,
+                    mux.pipe
+                )
+            finally:
+                stun_mux_close(mux)
+        else:
+            pipe = await self._get_dest_pipe(pipe)
+            reply = await get_stun_reply(
+                self.mode,
+                self.dest,
+                self.dest,
+                pipe
+            )
+
+            await reply.pipe.close()
 
-        await reply.pipe.close()
         if hasattr(reply, "rtup"):
             return ip_norm(reply.rtup[0])
 
@@ -190,7 +206,8 @@ async def get_stun_clients(af, max_agree, interface, proto=UDP, servs=None, conf
         else:
             stun_servs = STUN_MAP_SERVERS[proto][af]
         
-        serv_list = list_clone_rand(stun_servs, max_agree)
+        # Fast, working servers first.
+        serv_list = STUN_POOL.pick(stun_servs, max_agree, af, proto)
     else:
         serv_list = servs
 
@@ -0,0 +1,255 @@
+"""
+STUNMsg builds messages with bytes joins and parses them by slicing
+out new buffers for every field. That's fine for a handful of STUN
+requests but the TURN client decodes a whole message for every
+packet relayed to it, so codec cost is directly throughput.
+
+This module is the fast path:
+    - stun_decode reads the header and attribute headers with
+    struct.unpack_from over one memoryview. Attributes are kept as
+    (code, offset, len) in a __slots__ STUNView. Values are only
+    sliced out (as views) when asked for.
+    - stun_addr decodes (XOR) address attributes with int math
+    instead of building XOR masks.
+    - stun_pack_into / stun_encode write a message into one
+    preallocated bytearray. STUNMsg.pack writes its header with
+    stun_pack_hdr_into too.
+
+STUNMsg is still used to build and sign TURN control messages.
+"""
+
+import socket
+from struct import Struct
+from ...net.net import *
+from .stun_defs import *
+
+# Type, len, cookie, TXID.
+STUN_HDR = Struct("!HH4s12s")
+
+# Code, len.
+STUN_ATTR_HDR = Struct("!HH")
+STUN_U16 = Struct("!H")
+STUN_PADS = [b"", b"\0", b"\0\0", b"\0\0\0"]
+
+# Attribute codes as ints.
+STUN_MAPPED_ADDR = b_to_i(STUNAttrs.MappedAddress, "big")
+STUN_CHANGED_ADDR = b_to_i(STUNAttrs.ChangedAddress, "big")
+STUN_XOR_MAPPED_ADDR = b_to_i(STUNAttrs.XorMappedAddress, "big")
+STUN_XOR_MAPPED_ADDR_X = b_to_i(STUNAttrs.XorMappedAddressX, "big")
+STUN_XOR_PEER_ADDR = b_to_i(STUNAttrs.XorPeerAddress, "big")
+STUN_XOR_RELAYED_ADDR = b_to_i(STUNAttrs.XorRelayedAddress, "big")
+STUN_DATA = b_to_i(STUNAttrs.Data, "big")
+
+# Port XORed with 0x2112 and the IP with the cookie + TXID.
+STUN_XOR_ATTRS = (
+    STUN_XOR_MAPPED_ADDR,
+    STUN_XOR_PEER_ADDR,
+    STUN_XOR_RELAYED_ADDR,
+)
+
+# Used to set rtup in a reply.
+STUN_RTUP_ATTRS = (
+    STUN_XOR_MAPPED_ADDR_X,
+    STUN_XOR_MAPPED_ADDR,
+    STUN_MAPPED_ADDR,
+)
+
+class STUNView():
+    # rtup, ctup, stup, and pipe are only set if known.
+    __slots__ = (
+        "buf",
+        "msg_type",
+        "msg_len",
+        "magic_cookie",
+        "txn_id",
+        "attrs",
+        "af",
+        "rtup",
+        "ctup",
+        "stup",
+        "pipe",
+    )
+
+    def __init__(self, buf, msg_type, msg_len, magic_cookie, txn_id, attrs):
+        self.buf = buf
+        self.msg_type = msg_type
+        self.msg_len = msg_len
+        self.magic_cookie = magic_cookie
+        self.txn_id = txn_id
+        self.attrs = attrs
+        self.af = None
+
+    # Returns a view of the first attribute with this code.
+    def get(self, code):
+        for attr_code, offset, attr_len in self.attrs:
+            if attr_code == code:
+                return self.buf[offset:offset + attr_len]
+
+        return None
+
+    # Returns (ip, port) for the first attribute with this code.
+    def addr(self, code, af=None):
+        for attr_code, offset, attr_len in self.attrs:
+            if attr_code == code:
+                return stun_addr(self, code, offset, attr_len, af)
+
+        return None
+
+"""
+Returns (STUNView, bytes left over.) Raises on messages that
+are too short or have lengths past the end of the buffer.
+"""
+def stun_decode(buf):
+    buf = memoryview(buf)
+    buf_len = len(buf)
+    if buf_len < 20:
+        raise Exception("STUN msg too short.")
+
+    msg_type, msg_len, magic_cookie, txn_id = STUN_HDR.unpack_from(buf, 0)
+    end = 20 + msg_len
+    if end > buf_len:
+        raise Exception("Invalid length for STUN msg.")
+
+    # Attribute offsets. Values aren't copied.
+    attrs = []
+    offset = 20
+    while offset + 4 <= end:
+        attr_code, attr_len = STUN_ATTR_HDR.unpack_from(buf, offset)
+        offset += 4
+        if offset + attr_len > end:
+            raise Exception("STUN attribute len invalid.")
+
+        attrs.append((attr_code, offset, attr_len))
+
+        # Rule of 4:
+        # https://tools.ietf.org/html/rfc5766#section-14
+        offset += (attr_len + 3) & ~3
+
+    msg = STUNView(buf, msg_type, msg_len, magic_cookie, txn_id, attrs)
+    return msg, buf[end:]
+
+# Decode an address attribute to (ip, port.)
+def stun_addr(msg, code, offset, attr_len, af=None):
+    buf = msg.buf
+    if attr_len < 8:
+        raise Exception("STUN address attribute too short.")
+
+    # Use the family field over the route AF.
+    family = buf[offset + 1]
+    if family == 1:
+        af = IP4
+        ip_len = 4
+    elif family == 2:
+        af = IP6
+        ip_len = 16
+    else:
+        af = af or IP4
+        ip_len = 4 if af == IP4 else 16
+
+    if attr_len < 4 + ip_len:
+        raise Exception("STUN address attribute too short.")
+
+    port, = STUN_U16.unpack_from(buf, offset + 2)
+    ip_start = offset + 4
+    if code in STUN_XOR_ATTRS:
+        mask = msg.magic_cookie + msg.txn_id
+        port ^= 0x2112
+    elif code == STUN_XOR_MAPPED_ADDR_X:
+        mask = msg.magic_cookie + msg.txn_id
+        port ^= b_to_i(msg.magic_cookie[0:2], "big")
+    else:
+        mask = None
+
+    ip_buf = buf[ip_start:ip_start + ip_len]
+    if mask is not None:
+        ip_int = b_to_i(ip_buf, "big") ^ b_to_i(mask[:ip_len], "big")
+        ip_buf = ip_int.to_bytes(ip_len, "big")
+
+    return (socket.inet_ntop(af, ip_buf), port)
+
+# Encode an address attribute value (XORed for XOR codes.)
+def stun_addr_value(code, ip, port, txn_id=b"", magic_cookie=STUN_MAGIC_COOKIE):
+    if ":" in ip:
+        af = IP6
+        family = 2
+    else:
+        af = IP4
+        family = 1
+
+    ip_buf = socket.inet_pton(af, ip)
+    if code in STUN_XOR_ATTRS:
+        port ^= 0x2112
+        mask = magic_cookie + txn_id
+        ip_int = b_to_i(ip_buf, "big") ^ b_to_i(mask[:len(ip_buf)], "big")
+        ip_buf = ip_int.to_bytes(len(ip_buf), "big")
+
+    out = bytearray(4 + len(ip_buf))
+    STUN_ATTR_HDR.pack_into(out, 0, family, port)
+    out[4:] = ip_buf
+    return out
+
+# Size of an encoded message with these attributes.
+def stun_msg_size(attrs):
+    size = 20
+    for _, attr_data in attrs:
+        size += 4 + ((len(attr_data) + 3) & ~3)
+
+    return size
+
+"""
+Write a STUN message into out at offset. Attrs is a list of
+[code, value] where codes are ints or 2 byte bufs. Returns
+the offset after the message.
+"""
+def stun_pack_into(out, offset, msg_type, txn_id, attrs, magic_cookie=STUN_MAGIC_COOKIE):
+    if not isinstance(msg_type, int):
+        msg_type = b_to_i(msg_type, "big")
+
+    start = offset
+    offset += 20
+    for attr_code, attr_data in attrs:
+        if not isinstance(attr_code, int):
+            attr_code = b_to_i(attr_code, "big")
+
+        attr_len = len(attr_data)
+        STUN_ATTR_HDR.pack_into(out, offset, attr_code, attr_len)
+        offset += 4
+        out[offset:offset + attr_len] = attr_data
+        offset += attr_len
+
+        # Padding.
+        pad = (4 - attr_len % 4) % 4
+        if pad:
+            out[offset:offset + pad] = STUN_PADS[pad]
+            offset += pad
+
+    stun_pack_hdr_into(
+        out,
+        start,
+        msg_type,
+        offset - start - 20,
+        txn_id,
+        magic_cookie
+    )
+
+    return offset
+
+# Write the 20 byte STUN header into out at offset.
+def stun_pack_hdr_into(out, offset, msg_type, msg_len, txn_id, magic_cookie=STUN_MAGIC_COOKIE):
+    if not isinstance(msg_type, int):
+        msg_type = b_to_i(msg_type, "big")
+
+    STUN_HDR.pack_into(
+        out,
+        offset,
+        msg_type,
+        msg_len,
+        bytes(magic_cookie),
+        bytes(txn_id)
+    )
+
+# Returns a new STUN message as a bytearray.
+def stun_encode(msg_type, txn_id, attrs, magic_cookie=STUN_MAGIC_COOKIE):
+    out = bytearray(stun_msg_size(attrs))
+    stun_pack_into(out, 0, msg_type, txn_id, attrs, magic_cookie)
+    return out
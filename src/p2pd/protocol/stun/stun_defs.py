@@ -258,15 +258,13 @@ class STUNMsg:
         if len(data) % 4 != 0:
             padding = b'\x00' * (4 - len(data) % 4)
 
-        buf = bytearray().join([
-            memoryview(attr),
-            memoryview(pack("!H", len(data))),
-            memoryview(data),
-            memoryview(padding)
-        ])
-
-        self.msg_len += len(buf)
-        self.msg += buf
+        # Appended in place to avoid building a temp buf.
+        start = len(self.msg)
+        self.msg += attr
+        self.msg += pack("!H", len(data))
+        self.msg += data
+        self.msg += padding
+        self.msg_len += len(self.msg) - start
 
     def write_credential(self, username: str, realm: str, nonce: bytes = b''):
         self.write_attr(STUNAttrs.Username, username)
@@ -321,7 +319,7 @@ class STUNMsg:
     def __bytes__(self):
         return b''
 
-    def pack(self) -> bytes:
+    def pack(self) -> bytearray:
         # Starting with RFC 5389 and on a more complex
         # bit scheme is used for the message type.
         if self.mode != RFC3489:
@@ -330,13 +328,21 @@ class STUNMsg:
             #print("rfc34553")
             msg_type = self.msg_type
 
-        return bytes().join([
+        # stun_codec imports this module.
+        from .stun_codec import stun_pack_hdr_into
+
+        # Header + attributes written into one buffer.
+        out = bytearray(20 + len(self.msg))
+        stun_pack_hdr_into(
+            out,
+            0,
             msg_type,
-            pack("!H", self.msg_len),
-            self.magic_cookie,
+            self.msg_len,
             self.txn_id,
-            self.msg
-        ])
+            self.magic_cookie
+        )
+        out[20:] = self.msg
+        return out
 
     def decode(self, msg: memoryview) -> memoryview:
         # Unpack data from buffer using memory views.
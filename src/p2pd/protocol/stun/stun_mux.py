@@ -0,0 +1,290 @@
+"""
+STUN requests used to subscribe to their TXID on the pipe and
+retry with send_recv_loop. Any STUNClient call without a pipe
+opened a new socket for one request and closed it again. Route
+resolution and NAT tests make dozens of these at once.
+
+STUNMux runs every STUN transaction for a UDP pipe:
+    - One handler on the pipe sees all STUN messages (first two
+    bits are 0.) Replies are matched to transactions with a dict
+    lookup on the TXID and checked against the expected sender.
+    - Retransmissions follow RFC 5389 (7.2.1): the request is
+    sent up to 'rc' times starting with an RTO of 'rto' that
+    doubles each time. After the last send it waits 'rm' * rto.
+    All timers for the pipe live in one TimerWheel.
+
+Requests that don't need a particular socket share one pipe per
+(route, local port) from stun_mux_open. Pipes are closed after
+they haven't been used for STUN_MUX_LINGER seconds.
+
+A mux's subscription sees every datagram whose first byte is
+below 0x40. So a pipe given by the caller only gets a mux while
+it has STUN requests in progress (stun_mux_acquire / release.)
+"""
+
+import asyncio
+from ...utility.utils import *
+from ...utility.timer_wheel import *
+from ...net.net import *
+from ...net.pipe.pipe_utils import *
+
+# Initial retransmission timeout.
+STUN_RTO = 0.5
+
+# Max sends per request.
+STUN_RC = 4
+
+# Wait for this many RTOs after the last send.
+STUN_RM = 4
+
+# Seconds to keep unused shared pipes open.
+STUN_MUX_LINGER = 2
+
+# Matches any STUN message.
+STUN_MUX_SUB = (rb"\A[\x00-\x3f]", None)
+
+# [(af, nic, bind ip, bind port)] = STUNMux (or Future while opening.)
+STUN_MUXES = {}
+
+class STUNTxn():
+    def __init__(self, txid, buf, dest, reply_tup, future):
+        self.txid = txid
+        self.buf = buf
+        self.dest = dest
+        self.reply_tup = reply_tup
+        self.future = future
+        self.sends = 0
+        self.timer = None
+
+class STUNMux():
+    def __init__(self, pipe, rto=STUN_RTO, rc=STUN_RC, rm=STUN_RM):
+        self.pipe = pipe
+        self.rto = rto
+        self.rc = rc
+        self.rm = rm
+        self.txns = {}
+        self.timers = TimerWheel()
+        self.tasks = []
+
+        # Requests using the mux. Temp muxes end when this is 0.
+        self.users = 0
+        self.temp = False
+
+        # Used for shared pipes.
+        self.loop = None
+        self.key = None
+        self.refs = 0
+        self.linger = None
+
+        # Metrics.
+        self.sends = 0
+        self.replies = 0
+        self.timeouts = 0
+        pipe.subscribe(STUN_MUX_SUB, self.on_msg)
+
+    def on_msg(self, data, client_tup, pipe):
+        if len(data) < 20:
+            return
+
+        # TXID is at the same place for RFC 3489 and 5389.
+        txid = bytes(data[8:20])
+        txn = self.txns.get(txid)
+        if txn is None:
+            return
+
+        # Change requests expect replies from a different address.
+        if txn.reply_tup[1]:
+            if client_tup != txn.reply_tup:
+                return
+        else:
+            if client_tup[0] != txn.reply_tup[0]:
+                return
+
+        self.replies += 1
+        self.end_txn(txn, own_data(data))
+
+    def end_txn(self, txn, result):
+        self.txns.pop(txn.txid, None)
+        if txn.timer is not None:
+            self.timers.cancel(txn.timer)
+            txn.timer = None
+
+        if not txn.future.done():
+            txn.future.set_result(result)
+
+    # Returns the send coroutine.
+    def send_txn(self, txn):
+        txn.sends += 1
+        self.sends += 1
+
+        # RTO doubles after each send.
+        if txn.sends < self.rc:
+            delay = self.rto * (2 ** (txn.sends - 1))
+            txn.timer = self.timers.add(delay, self.on_timer, txn)
+        else:
+            txn.timer = self.timers.add(
+                self.rm * self.rto,
+                self.on_timer,
+                txn
+            )
+
+        return self.pipe.send(txn.buf, txn.dest)
+
+    def on_timer(self, txn):
+        txn.timer = None
+        if txn.txid not in self.txns:
+            return
+
+        # Give up.
+        if txn.sends >= self.rc:
+            self.timeouts += 1
+            self.end_txn(txn, None)
+            return
+
+        self.tasks = rm_done_tasks(self.tasks)
+        self.tasks.append(
+            create_task(
+                async_wrap_errors(
+                    self.send_txn(txn)
+                )
+            )
+        )
+
+    # Returns the reply buf or None.
+    async def request(self, txid, buf, dest, reply_tup=None):
+        dest = norm_client_tup(dest[:2])
+        reply_tup = norm_client_tup((reply_tup or dest)[:2])
+        future = asyncio.get_event_loop().create_future()
+        txn = STUNTxn(bytes(txid), buf, dest, reply_tup, future)
+        self.txns[txn.txid] = txn
+        try:
+            await self.send_txn(txn)
+            return await future
+        finally:
+            self.end_txn(txn, None)
+
+    def stats(self):
+        return {
+            "pending": len(self.txns),
+            "sends": self.sends,
+            "replies": self.replies,
+            "timeouts": self.timeouts,
+        }
+
+    async def close(self):
+        for txn in list(self.txns.values()):
+            self.end_txn(txn, None)
+
+        self.timers.stop()
+        for task in self.tasks:
+            task.cancel()
+
+        self.pipe.unsubscribe(STUN_MUX_SUB)
+
+# The mux for a UDP pipe. Made on first use.
+def stun_mux(pipe):
+    if getattr(pipe, "stun_mux", None) is None:
+        pipe.stun_mux = STUNMux(pipe)
+
+    return pipe.stun_mux
+
+# Muxes made here are removed from the pipe after the last request.
+def stun_mux_acquire(pipe):
+    if getattr(pipe, "stun_mux", None) is None:
+        stun_mux(pipe).temp = True
+
+    pipe.stun_mux.users += 1
+    return pipe.stun_mux
+
+async def stun_mux_release(mux):
+    mux.users = max(0, mux.users - 1)
+    if mux.users or not mux.temp:
+        return
+
+    if getattr(mux.pipe, "stun_mux", None) is mux:
+        mux.pipe.stun_mux = None
+
+    await mux.close()
+
+def stun_mux_key(route):
+    nic_id = None
+    if route.interface is not None:
+        nic_id = route.interface.id
+
+    bind_tup = route.bind_tup()
+    return (int(route.af), nic_id, bind_tup[0], bind_tup[1])
+
+def stun_mux_usable(mux, loop):
+    if mux is None or mux.loop is not loop:
+        return False
+
+    transport = mux.pipe.transport
+    return transport is not None and not transport.is_closing()
+
+"""
+Returns a shared mux for a bound route. Call stun_mux_close
+when done with it. Routes bound to port 0 share one socket.
+"""
+async def stun_mux_open(route, conf=NET_CONF):
+    if not route.resolved:
+        await route.bind()
+
+    loop = asyncio.get_event_loop()
+    key = stun_mux_key(route)
+    mux = STUN_MUXES.get(key)
+
+    # Another request is opening the pipe.
+    if isinstance(mux, asyncio.Future):
+        mux = await asyncio.shield(mux)
+
+    if not stun_mux_usable(mux, loop):
+        opening = loop.create_future()
+        STUN_MUXES[key] = opening
+        mux = None
+        try:
+            pipe = await pipe_open(UDP, route=route, conf=conf)
+            if pipe is None:
+                raise Exception("Could not open STUN pipe.")
+
+            mux = stun_mux(pipe)
+            mux.key = key
+            mux.loop = loop
+            STUN_MUXES[key] = mux
+        finally:
+            if mux is None:
+                STUN_MUXES.pop(key, None)
+
+            opening.set_result(mux)
+
+    if mux.linger is not None:
+        mux.linger.cancel()
+        mux.linger = None
+
+    mux.refs += 1
+    return mux
+
+def stun_mux_close(mux):
+    mux.refs = max(0, mux.refs - 1)
+    if mux.refs or mux.linger is not None:
+        return
+
+    # Kept open for a while so bursts of requests share it.
+    mux.linger = asyncio.get_event_loop().call_later(
+        STUN_MUX_LINGER,
+        stun_mux_expire,
+        mux
+    )
+
+def stun_mux_expire(mux):
+    mux.linger = None
+    if mux.refs:
+        return
+
+    if STUN_MUXES.get(mux.key) is mux:
+        del STUN_MUXES[mux.key]
+
+    async def close():
+        await mux.close()
+        await mux.pipe.close()
+
+    create_task(async_wrap_errors(close()))
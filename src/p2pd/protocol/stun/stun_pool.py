@@ -0,0 +1,214 @@
+"""
+STUN servers used to be picked at random from the server lists.
+A dead or slow server in the sample stalls NAT tests and route
+resolution until its timeout fires.
+
+STUNPool records how every server does in get_stun_reply:
+    - rtt: EWMA of reply times.
+    - fail_rate: EWMA of timeouts (1) vs replies (0.)
+    - fails: timeouts in a row.
+
+Servers are ordered with a weighted random shuffle where the
+weight is 1 / (rtt * (1 + STUN_FAIL_PENALTY * fail_rate)) so fast,
+healthy servers are usually first but others still get tried.
+Servers with no history use STUN_DEFAULT_RTT.
+
+After STUN_BREAK_FAILS timeouts in a row a server is 'broken' for
+STUN_BREAK_SECS (doubling with more timeouts up to STUN_BREAK_MAX.)
+Broken servers go to the end of the order. One reply resets it.
+
+The stats can be saved to disk to keep them across restarts.
+"""
+
+import os
+import json
+import time
+import random
+import pathlib
+from ...utility.utils import *
+from ...net.net import *
+from ...install import get_p2pd_install_root
+
+# Weight of new samples in the EWMAs.
+STUN_RTT_ALPHA = 0.125
+
+# RTT assumed for servers with no replies.
+STUN_DEFAULT_RTT = 0.5
+
+# How much timeouts count against a server.
+STUN_FAIL_PENALTY = 4
+
+# Timeouts in a row before a server is skipped.
+STUN_BREAK_FAILS = 3
+
+# Seconds a broken server is skipped for.
+STUN_BREAK_SECS = 60
+STUN_BREAK_MAX = 60 * 60
+
+# Home dir / p2pd / stun_pool.json.
+def get_stun_pool_path(install_root=None):
+    return os.path.realpath(
+        os.path.join(
+            install_root or get_p2pd_install_root(),
+            "stun_pool.json"
+        )
+    )
+
+def stun_serv_key(af, proto, ip, port):
+    # Host names are kept as is.
+    try:
+        ip = ip_norm(ip)
+    except ValueError:
+        pass
+
+    return fstr("{0} {1} {2} {3}", (int(af), int(proto), ip, port,))
+
+class STUNServStats():
+    def __init__(self):
+        self.rtt = None
+        self.fail_rate = 0
+        self.fails = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.last_fail = 0
+        self.broken_until = 0
+
+    def to_dict(self):
+        return {
+            "rtt": self.rtt,
+            "fail_rate": self.fail_rate,
+            "fails": self.fails,
+            "replies": self.replies,
+            "timeouts": self.timeouts,
+            "last_fail": self.last_fail,
+            "broken_until": self.broken_until,
+        }
+
+    @staticmethod
+    def from_dict(d):
+        stats = STUNServStats()
+        for field in d:
+            setattr(stats, field, d[field])
+
+        return stats
+
+class STUNPool():
+    def __init__(self, alpha=STUN_RTT_ALPHA, break_fails=STUN_BREAK_FAILS, break_secs=STUN_BREAK_SECS, break_max=STUN_BREAK_MAX):
+        self.alpha = alpha
+        self.break_fails = break_fails
+        self.break_secs = break_secs
+        self.break_max = break_max
+        self.servs = {}
+
+    def stats(self, key):
+        if key not in self.servs:
+            self.servs[key] = STUNServStats()
+
+        return self.servs[key]
+
+    def record_reply(self, af, proto, dest, rtt):
+        stats = self.stats(stun_serv_key(af, proto, *dest[:2]))
+        if stats.rtt is None:
+            stats.rtt = rtt
+        else:
+            stats.rtt += self.alpha * (rtt - stats.rtt)
+
+        stats.fail_rate -= self.alpha * stats.fail_rate
+        stats.replies += 1
+        stats.fails = 0
+        stats.broken_until = 0
+
+    def record_timeout(self, af, proto, dest):
+        stats = self.stats(stun_serv_key(af, proto, *dest[:2]))
+        stats.fail_rate += self.alpha * (1 - stats.fail_rate)
+        stats.timeouts += 1
+        stats.fails += 1
+        stats.last_fail = time.time()
+
+        # Skip the server for longer the more it fails.
+        if stats.fails >= self.break_fails:
+            n = stats.fails - self.break_fails
+            secs = min(self.break_secs * (2 ** min(n, 16)), self.break_max)
+            stats.broken_until = stats.last_fail + secs
+
+    def is_broken(self, key, now=None):
+        if key not in self.servs:
+            return False
+
+        now = now or time.time()
+        return self.servs[key].broken_until > now
+
+    def weight(self, key):
+        if key not in self.servs:
+            return 1 / STUN_DEFAULT_RTT
+
+        stats = self.servs[key]
+        rtt = STUN_DEFAULT_RTT if stats.rtt is None else stats.rtt
+        rtt = max(rtt, 0.001)
+        return 1 / (rtt * (1 + STUN_FAIL_PENALTY * stats.fail_rate))
+
+    # Server lists are in the format used in settings.
+    def order(self, servs, af, proto=UDP):
+        now = time.time()
+        healthy = []
+        broken = []
+        for serv in servs:
+            key = stun_serv_key(
+                af,
+                proto,
+                serv["primary"]["ip"],
+                serv["primary"]["port"]
+            )
+
+            if self.is_broken(key, now):
+                broken.append([self.servs[key].broken_until, serv])
+                continue
+
+            # Weighted shuffle (Efraimidis-Spirakis.)
+            sort_key = random.random() ** (1 / self.weight(key))
+            healthy.append([sort_key, serv])
+
+        healthy = sorted(healthy, key=lambda x: x[0], reverse=True)
+        broken = sorted(broken, key=lambda x: x[0])
+        return [x[1] for x in healthy + broken]
+
+    # Replaces list_clone_rand for STUN servers.
+    def pick(self, servs, n, af, proto=UDP):
+        return self.order(servs, af, proto)[:n]
+
+    def to_dict(self):
+        return {key: self.servs[key].to_dict() for key in self.servs}
+
+    def from_dict(self, d):
+        self.servs = {key: STUNServStats.from_dict(d[key]) for key in d}
+        return self
+
+    def load(self, path=None):
+        path = path or get_stun_pool_path()
+        try:
+            if os.path.exists(path):
+                with open(path, mode="r") as fp:
+                    self.from_dict(json.load(fp))
+        except Exception:
+            log_exception()
+
+        return self
+
+    def save(self, path=None):
+        path = path or get_stun_pool_path()
+        try:
+            pathlib.Path(os.path.dirname(path)).mkdir(
+                parents=True,
+                exist_ok=True
+            )
+
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                json.dump(self.to_dict(), fp)
+
+            os.replace(tmp_path, path)
+        except Exception:
+            log_exception()
+
+# Shared by all STUN clients.
+STUN_POOL = STUNPool()
@@ -19,8 +19,11 @@ create a pointer function for memory views.
 
 from ...utility.utils import *
 from .stun_defs import *
+from .stun_codec import *
 from ...net.net import *
 from ...net.ip_range import *
+from .stun_pool import *
+from .stun_mux import *
 
 def stun_proc_attrs(af, attr_code, attr_data, msg):
     # Set our remote IP and port.
@@ -49,22 +52,19 @@ def stun_proc_attrs(af, attr_code, attr_data, msg):
             msg.ctup = stun_addr_field.tup
 
 def stun_proto(buf, af):
-    msg, buf = STUNMsg.unpack(buf)
+    msg, buf = stun_decode(buf)
     msg.af = af
-    while not msg.eof():
-        attr_code, _, attr_data = msg.read_attr()
-        attr_name = buf_in_class(STUNAttrs, bytes(attr_code))
-        """
-        print(attr_name)
-        print(bytes(attr_code))
-        print(bytes(attr_data))
-        print()
-        """
-
-        stun_proc_attrs(af, attr_code, attr_data, msg)
-        
-
-        
+    for attr_code, offset, attr_len in msg.attrs:
+        # Set our remote IP and port.
+        if attr_code in STUN_RTUP_ATTRS:
+            if not hasattr(msg, "rtup"):
+                msg.rtup = stun_addr(msg, attr_code, offset, attr_len, af)
+
+        # Set the additional IP and port for this server.
+        if attr_code == STUN_CHANGED_ADDR:
+            if not hasattr(msg, "ctup"):
+                msg.ctup = stun_addr(msg, attr_code, offset, attr_len, af)
+
     return msg, buf
 
 # Handles making a STUN request to a server.
@@ -83,13 +83,38 @@ async def get_stun_reply(mode, dest_addr, reply_addr, pipe, attrs=[]):
         attr_code, attr_data = attr
         msg.write_attr(attr_code, attr_data)
 
-    # Subscribe to replies that match the req tran ID.
-    sub = (re.escape(msg.txn_id), reply_addr)
-    pipe.subscribe(sub)
-
     # Send the req and get a matching reply.
     send_buf = msg.pack()
-    recv_buf = await send_recv_loop(dest_addr, pipe, send_buf, sub)
+    start = time.time()
+    if pipe.sock.type == UDP:
+        # Retransmits + TXID matching for all requests on the pipe.
+        mux = stun_mux_acquire(pipe)
+        try:
+            recv_buf = await mux.request(
+                msg.txn_id,
+                send_buf,
+                dest_addr,
+                reply_addr
+            )
+        finally:
+            await stun_mux_release(mux)
+    else:
+        # Subscribe to replies that match the req tran ID.
+        sub = (re.escape(msg.txn_id), reply_addr)
+        pipe.subscribe(sub)
+        recv_buf = await send_recv_loop(dest_addr, pipe, send_buf, sub)
+        pipe.unsubscribe(sub)
+
+    # Change requests may not get replies due to NATs.
+    # So only plain requests count towards server health.
+    if reply_addr == dest_addr:
+        af = pipe.route.af
+        proto = pipe.sock.type
+        if recv_buf is None:
+            STUN_POOL.record_timeout(af, proto, dest_addr)
+        else:
+            STUN_POOL.record_reply(af, proto, dest_addr, time.time() - start)
+
     if recv_buf is None:
         raise ErrorNoReply("STUN recv loop got no reply.")
 
@@ -49,13 +49,16 @@ class ToxiToxic():
         return toxic
     
     # Limit a connection to a maximum number of kilobytes per second.
-    def add_bandwidth_limit(self, KBs=100):
+    # Burst is the most KB sent at once (default = 100 ms of data.)
+    def add_bandwidth_limit(self, KBs=100, burst=None):
         toxic = self.copy()
+        attrs = {"rate": KBs}
+        if burst is not None:
+            attrs["burst"] = burst
+
         toxic.body = self.api({
             "type": "bandwidth",
-            "attributes": {
-                "rate": KBs,
-            }
+            "attributes": attrs
         })
 
         return toxic
@@ -259,8 +262,9 @@ class ToxiClient():
         self.tunnels = []
 
     async def start(self):
+        # All API calls reuse the same con.
         hdrs = [[b"user-agent", b"toxiproxy-cli"]]
-        self.curl = WebCurl(self.addr, self.route, hdrs=hdrs)
+        self.curl = WebCurl(self.addr, self.route, hdrs=hdrs, keep_alive=1)
         try:
             await self.version()
         except:
@@ -271,6 +275,10 @@ class ToxiClient():
     def __await__(self):
         return self.start().__await__()
 
+    # Close the idle API con.
+    async def close(self):
+        await self.curl.close()
+
     async def version(self):
         resp = await self.curl.vars().get("/version")
         assert(resp.info is not None)
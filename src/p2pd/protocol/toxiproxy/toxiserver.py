@@ -77,65 +77,86 @@ class ToxicLatency(ToxicBase):
 
         return msg, dest_pipe
     
+"""
+Rate limiting used to poll every 100 ms for bandwidth and copied
+the unsent part of a message for every chunk. The overhead of the
+proxy itself then skewed throughput measurements.
+
+TokenBucket adds 'rate' tokens (bytes) per second up to 'burst.'
+Callers take tokens before sending and may go into debt. The
+debt tells them exactly how long to sleep so concurrent senders
+queue up in order without polling.
+"""
+class TokenBucket():
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        # Bytes per second. 0 = no limit.
+        self.rate = rate
+
+        # Default burst is 100 ms of data.
+        self.burst = int(burst or max(rate / 10, 1))
+        self.clock = clock
+        self.last = clock()
+
+        # Starts empty so the rate is never exceeded from the start.
+        self.tokens = 0
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.burst,
+            self.tokens + ((now - self.last) * self.rate)
+        )
+        self.last = now
+
+    # Take n tokens. Returns secs to wait before using them.
+    def reserve(self, n):
+        self.refill()
+        self.tokens -= n
+        if self.tokens >= 0:
+            return 0
+
+        return -self.tokens / self.rate
+
+    # Returns how many bytes may be sent (up to burst.)
+    async def take(self, n):
+        if not self.rate:
+            return n
+
+        n = min(n, self.burst)
+        delay = self.reserve(n)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        return n
+
 class ToxicBandwidthLimit(ToxicBase):
-    def set_params(self, rate):
+    def set_params(self, rate, burst=None):
         self.rate = rate # KB/s
+        self.burst = burst # KB
 
-        # Track amount of bw used across coroutines.
-        # This prevents exceeding the bw allocation.
-        self.used = 0
+        """
+        Toxics are added per stream so each direction has its
+        own bucket. It's shared by all clients of the tunnel.
+        """
+        if burst is not None:
+            burst = burst * 1024
 
-        # Convert rate to bytes per 100 ms.
-        # If rate is 0 then there's no limit.
-        self.rate_ms = int((self.rate * 1024) / 10)
+        self.bucket = TokenBucket(self.rate * 1024, burst)
         return self
-    
-    async def get_bandwidth(self, n):
-        # Wait for some positive amount of bw to become available.
-        # Other coroutines may be using all the bw.
-        bw = 0
-        while bw <= 0 and self.rate_ms:
-            bw = self.rate_ms - self.used
-
-            """
-            Allocations are recorded before doing a sleep since this
-            allows other coroutines to run which may then get their
-            own allocations and end up going over the limit. Doing
-            the change immediately after ensures the bandwidth limit
-            is respected between coroutines.
-            """
-            if bw > 0:
-                # Use only as much as needed.
-                bw = min(n, bw)
-                self.used += bw
-
-            """
-            Give other coroutines a chance to use their bw.
-            Sleeping is always done to start with even if
-            there was initial bw available because otherwise
-            multiple coroutines could accidentally exceed the limit.
-            """
-            await asyncio.sleep(0.1)
-
-        # Return the allocated amount.
-        return bw
-
-    # Could be improved with memoryview.
-    async def run(self, msg, dest_pipe):
-        unsent = len(msg)
-        while unsent > 0:
-            # Block for an allocation of bandwidth.
-            # Checks every 100 ms.
-            bw = await self.get_bandwidth(unsent)
 
-            # Once an allocation is given use that amount.
-            await dest_pipe.send(msg[:bw])
-            msg = msg[bw:]
+    async def run(self, msg, dest_pipe):
+        # No limit.
+        if not self.rate:
+            return msg, dest_pipe
 
-            # Adjust counters after await operations.
-            # This is for safety to maintain integrity of self.used.
-            unsent -= bw
-            self.used -= bw
+        # Chunks are slices of the same view (no copying.)
+        msg = memoryview(msg)
+        msg_len = len(msg)
+        offset = 0
+        while offset < msg_len:
+            n = await self.bucket.take(msg_len - offset)
+            await dest_pipe.send(msg[offset:offset + n])
+            offset += n
 
         # Message sent so return.
         return None, dest_pipe
@@ -555,7 +576,8 @@ class ToxiMainServer(RESTD):
 
         if j["type"] == "bandwidth":
             toxic = ToxicBandwidthLimit().set_params(
-                rate=attrs["rate"]
+                rate=attrs["rate"],
+                burst=attrs.get("burst")
             ).setup(base)
 
         if j["type"] == "timeout":
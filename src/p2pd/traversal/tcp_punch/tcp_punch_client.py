@@ -110,6 +110,7 @@ class TCPPuncher():
         self.send_mappings = []
         self.preloaded_mappings = []
         self.listen_pipe = None
+        self.fd_server = None
         self.ping_pong_task = None
         self.active_punchers = 0
 
@@ -188,6 +189,9 @@ class TCPPuncher():
             route=route,
             msg_cb=self.node.msg_cb,
         )
+
+        # Set when the punching process connects back.
+        accept_future = self.listen_pipe.client_futures[0]
         
         # Might not be necessary since the get addr infos does this.
         """
@@ -199,13 +203,30 @@ class TCPPuncher():
         """
         interface = self.interface
 
+        # The punched socket is passed back if supported.
+        fd_info = fd_task = None
+        if PUNCH_FD_PASSING:
+            try:
+                self.fd_server = punch_fd_server()
+                fd_info = self.fd_server[1:]
+                fd_task = create_task(
+                    recv_punched_sock(
+                        self.fd_server[0],
+                        self.fd_server[2]
+                    )
+                )
+            except Exception:
+                log_exception()
+                self.close_fd_server()
+
         # Passed on to a new process.
         listen_tup = self.listen_pipe.sock.getsockname()[:2]
         args = (
             listen_tup,
             self.to_dict(),
             interface,
-            self.node.node_id[:8]
+            self.node.node_id[:8],
+            fd_info
         )
 
         try:
@@ -216,15 +237,45 @@ class TCPPuncher():
                 proc_do_punching,
                 args
             )
-            
-            # Check every 100 ms for 5 seconds.
+
+            # Wait for whichever happens first.
+            waits = [accept_future, puncher_future]
+            if fd_task is not None:
+                waits.append(fd_task)
+
+            # Stop if the pipe is made another way.
+            pipe_future = self.node.pipes.get(self.pipe_id)
+            if pipe_future is not None:
+                waits.append(pipe_future)
+
+            deadline = loop.time() + self.get_punch_deadline()
             while 1:
+                remaining = deadline - loop.time()
+                if remaining <= 0 or not len(waits):
+                    log("> tcp punch deadline reached.")
+                    break
+
+                done, _ = await asyncio.wait(
+                    waits,
+                    timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
                 try:
-                    # Check if reverse connect server has a client yet.
-                    if len(self.listen_pipe.tcp_clients):
-                        # Reverse connect from punching process to
-                        # server in the main thread.
-                        self.pipe = self.listen_pipe.tcp_clients[0]
+                    # Punched sock passed from the punching process.
+                    if fd_task in done:
+                        waits.remove(fd_task)
+                        task, fd_task = fd_task, None
+                        sock = task.result()
+                        self.close_fd_server()
+                        self.pipe = await self.pipe_from_sock(sock)
+                        self.node.pipe_ready(self.pipe_id, self.pipe)
+                        return self.pipe
+
+                    # Reverse connect from punching process to
+                    # server in the main thread.
+                    if accept_future in done:
+                        self.pipe = accept_future.result()
 
                         # Patch close to send close message.
                         pipe_close = self.pipe.close
@@ -238,20 +289,56 @@ class TCPPuncher():
                         return self.pipe
                 except:
                     log_exception()
-                
-                # Check every 100 ms.
-                await asyncio.sleep(0.1)
+
+                if pipe_future in done:
+                    break
 
                 # Puncher ended.
-                if puncher_future.done():
-                    self.active_punchers = max(
-                        0,
-                        self.active_punchers - 1
+                # The sock may still be on its way.
+                if puncher_future in done:
+                    waits.remove(puncher_future)
+                    deadline = min(
+                        deadline,
+                        loop.time() + PUNCH_HANDOFF_SECS
                     )
 
-                    return
+            self.active_punchers = max(
+                0,
+                self.active_punchers - 1
+            )
         except:
             log_exception()
+        finally:
+            # Let the accept end before the server is closed.
+            if fd_task is not None:
+                fd_task.cancel()
+                await asyncio.gather(fd_task, return_exceptions=True)
+
+            self.close_fd_server()
+
+    # Secs until punching should be over.
+    def get_punch_deadline(self):
+        wait = max(Dec(0), self.start_time - self.sys_clock.time())
+        return float(wait) + PUNCH_DEADLINE
+
+    # Wrap a punched sock passed from the punching process.
+    async def pipe_from_sock(self, sock):
+        route = await self.interface.route(self.af).bind(
+            sock.getsockname()[1]
+        )
+
+        return await pipe_open(
+            route=route,
+            proto=TCP,
+            dest=sock.getpeername()[:2],
+            sock=sock,
+            msg_cb=self.node.msg_cb
+        )
+
+    def close_fd_server(self):
+        if self.fd_server is not None:
+            punch_fd_server_close(*self.fd_server[:2])
+            self.fd_server = None
 
     def set_punch_mode(self):
         self.punch_mode = get_punch_mode(
@@ -286,6 +373,8 @@ class TCPPuncher():
         if self.listen_pipe is not None:
             await self.listen_pipe.close()
 
+        self.close_fd_server()
+
 # Started in a new process.
 def proc_do_punching(args):
     try:
@@ -303,6 +392,7 @@ def proc_do_punching(args):
         d = args[1]
         interface = args[2]
         node_id = args[3]
+        fd_info = args[4]
         puncher = TCPPuncher.from_dict(d)
 
         # Allow more recent Pythons to do punching.
@@ -318,7 +408,8 @@ def proc_do_punching(args):
                     puncher.punch_mode,
                     interface,
                     reverse_tup,
-                    node_id
+                    node_id,
+                    fd_info
                 )
             )
 
@@ -339,7 +430,8 @@ def proc_do_punching(args):
                         puncher.punch_mode,
                         interface,
                         reverse_tup,
-                        node_id
+                        node_id,
+                        fd_info
                     )
                 ),
                 loop=loop
@@ -1,5 +1,9 @@
 import warnings
 import sys
+import os
+import socket
+import errno
+import tempfile
 from ...net.ip_range import *
 from ...nic.nat.nat_utils import *
 from ...nic.interface import *
@@ -15,10 +19,38 @@ UPDATED_PREDICTIONS = 3
 INITIATOR = 1
 RECIPIENT = 2
 
+"""
+Punched sockets are sent back to the node process over a Unix
+socket (SCM_RIGHTS) so the punching process can return to the
+pool. Where that's not supported the process relays messages
+between the punched socket and a loopback con to the node.
+"""
+PUNCH_FD_PASSING = hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
 # Number of seconds in the future from an NTP time
 # for hole punching to occur.
 NTP_MEET_STEP = 6
 
+# Secs after the meeting time a punch may take.
+# Punching processes give up after 30 secs.
+PUNCH_DEADLINE = 35
+
+# Secs to wait for a sock after the punching process ends.
+PUNCH_HANDOFF_SECS = 1
+
+# Connect attempts are sent every PUNCH_SPACING_MS for PUNCH_SECS.
+PUNCH_SECS = 10
+PUNCH_SPACING_MS = 5
+
+# Socks to create ahead of time for each mapping.
+PUNCH_PREALLOC = 16
+
+# Secs to wait for replies after the last attempt.
+PUNCH_TAIL_SECS = 10
+
+# connect_ex() codes for a connect that's still in progress.
+PUNCH_CONNECT_PENDING = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
 # Fine tune various network settings.
 PUNCH_CONF = dict_child({
     # Reuse address tuple for bind() socket call.
@@ -83,160 +115,232 @@ We can keep trying until success without the mappings
 changing. However, unpredictable nats that use
 delta N will be timing sensitive. If timing info
 is available the protocol should try use that.
+
+All connect attempts are fired from a single timer
+that is re-armed with loop.call_at() at exact offsets
+from the meeting time. Sockets are created ahead of
+each send so the only work done on time is connect().
 """
-async def delayed_punch(af, ms_delay, mapping, dest, loop, interface, conf=PUNCH_CONF):
-    try:
-        """
-        Schedule connection to run across time.
+class PunchScheduler():
+    def __init__(self, targets, offsets, loop=None, prealloc=PUNCH_PREALLOC, conf=PUNCH_CONF):
+        # [[mapping, bound route, dest addr], ...]
+        self.targets = targets
+
+        # Secs from the start time for each send.
+        self.offsets = offsets
+        self.loop = loop or asyncio.get_event_loop()
+        self.prealloc = prealloc
+        self.conf = conf
+
+        # Spare socks for each target.
+        self.pools = [[] for _ in targets]
+
+        # fd -> [target, sock] for in-progress connects.
+        self.pending = {}
+
+        # [intended, actual] loop times for each send.
+        self.sends = []
+        self.start_at = None
+        self.handle = None
+        self.done = None
+
+    def new_sock(self, target):
+        mapping, route, dest = target
+        return socket_factory_sync(
+            route=route,
+            dest_addr=dest,
+            conf=self.conf
+        )
 
-        How long it takes the event loop to start a
-        routine is outside of our control. This
-        code adjusts the delay based on any amount
-        of time already passed.
-        """
-        if ms_delay:
-            await asyncio.sleep(ms_delay / 1000)
+    def fill_pools(self):
+        for n, target in enumerate(self.targets):
+            pool = self.pools[n]
+            while len(pool) < self.prealloc:
+                sock = self.new_sock(target)
+                if sock is None:
+                    break
 
-        # Bind to a specific port and interface.
-        #print(dest.tup)
-        if "fe80" == dest.tup[0][:4]:
-            route = interface.route(af)
-            await route.bind(
-                ips=str(route.link_locals[0]),
-                port=mapping.local
-            )
-        else:
-            route = await interface.route(af).bind(
-                mapping.local
+                pool.append(sock)
+
+    def fire(self, n):
+        self.handle = None
+        if self.done.done():
+            return
+
+        # Note how late the event loop ran us.
+        intended = self.start_at + self.offsets[n]
+        self.sends.append([intended, self.loop.time()])
+        for i, target in enumerate(self.targets):
+            pool = self.pools[i]
+            sock = pool.pop() if len(pool) else self.new_sock(target)
+            if sock is None:
+                continue
+
+            # Sends the SYN without waiting.
+            try:
+                err = sock.connect_ex(target[2].tup)
+            except Exception:
+                log_exception()
+                sock.close()
+                continue
+
+            if not err:
+                self.connected(target, sock)
+                return
+            
+            if err in PUNCH_CONNECT_PENDING:
+                fd = sock.fileno()
+                self.pending[fd] = [target, sock]
+                self.loop.add_writer(fd, self.writable, fd)
+            else:
+                sock.close()
+
+        # Arm the timer for the next send.
+        if n + 1 < len(self.offsets):
+            self.handle = self.loop.call_at(
+                self.start_at + self.offsets[n + 1],
+                self.fire,
+                n + 1
             )
 
-        # Open connection -- return only sock.
-        sock = await socket_factory(
-            route=route,
-            dest_addr=dest, 
-            conf=conf
-        )
+        # Replace the socks used outside of the send.
+        self.fill_pools()
 
-        # Requires this special sock option:
-        reuse_set = sock.getsockopt(
-            socket.SOL_SOCKET,
-            socket.SO_REUSEADDR
-        )
+    def writable(self, fd):
+        self.loop.remove_writer(fd)
+        target, sock = self.pending.pop(fd)
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            sock.close()
+        else:
+            self.connected(target, sock)
 
-        # Sanity check for the sock option.
-        if not reuse_set:
-            log("Punch socket missing reuse addr opt.")
+    def connected(self, target, sock):
+        if self.done.done():
+            sock.close()
             return
 
-        # Async connect that sends SYN.
-        await loop.sock_connect(
-            sock,
-            dest.tup
-        )
-
-        # Failure.
-        # We strip None responses out.
-        if sock is None:
-            return None
-        
         # Add pings in the background.
         # This helps the process pool stay clean.
         set_keep_alive(sock)
-
-        """
-        At some point I expect errors to be made if a
-        local IP + local port is reused for the same
-        dest IP + dest port and it successfully gets
-        connected. So successive calls might fail.
-        """
+        mapping = target[0]
         mapping.sock = sock
-        return mapping
-    except:
-        #log_exception()
-        return None
-    
+        self.done.set_result([mapping])
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+        # Stop any in-progress connects.
+        for fd in list(self.pending):
+            self.loop.remove_writer(fd)
+            self.pending.pop(fd)[1].close()
+
+        # Close the spare socks.
+        for pool in self.pools:
+            while len(pool):
+                pool.pop().close()
+
+    async def run(self, start_at=None, tail=PUNCH_TAIL_SECS):
+        self.done = self.loop.create_future()
+        self.start_at = start_at or self.loop.time()
+        self.fill_pools()
+        self.handle = self.loop.call_at(
+            self.start_at + self.offsets[0],
+            self.fire,
+            0
+        )
+
+        # Give the last SYNs time to get replies.
+        end = self.start_at + self.offsets[-1] + tail
+        try:
+            timeout = max(0, end - self.loop.time())
+            return await asyncio.wait_for(
+                asyncio.shield(self.done),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            return []
+        finally:
+            self.cancel()
+
+    def timing_report(self):
+        lags = [actual - intended for intended, actual in self.sends]
+        if not len(lags):
+            return {"sent": 0, "intended": len(self.offsets)}
+
+        lags_ms = sorted([lag * 1000 for lag in lags])
+        return {
+            "sent": len(lags),
+            "intended": len(self.offsets),
+            "mean_ms": sum(lags_ms) / len(lags_ms),
+            "p95_ms": lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.95))],
+            "max_ms": lags_ms[-1],
+        }
+
 """
-Smarter code that is less spammy used for remote
-punching. Won't overwhelm the event loop like the
-above code will. Takes advantage of the massive timeouts
+Attempts are spaced out over time to increase the chance
+of hitting the window where the remote NAT has opened
+its mapping. Takes advantage of the massive timeouts
 in the Internet as packets travel across routers.
-Optimized and tested for remote connections.
 """
-async def schedule_delayed_punching(af, dest_addr, send_mappings, recv_mappings, interface):
+async def schedule_delayed_punching(af, dest_addr, send_mappings, recv_mappings, interface, start_at=None):
     try:
-        # Config.
-        secs = 10
-        ms_spacing = 5
-
-        # Create punching async task list.
-        tasks = []
-        if sys.version_info.minor >= 13:
-            # Recent python versions are more efficient with less tasks.
-            steps = 50
-        else:
-            steps = int((secs * 1000) / ms_spacing)
-
-
+        steps = int((PUNCH_SECS * 1000) / PUNCH_SPACING_MS)
         assert(steps > 1)
-        assert(steps)
         assert(len(send_mappings))
         loop = asyncio.get_event_loop()
+        targets = []
         for i in range(0, 1):
             # Validate IP address.
             dest = Address(dest_addr, recv_mappings[i].remote)
-            interface.route(af)
             await dest.res(interface.route(af))
             dest = dest.select_ip(af)
-            for sleep_time in range(0, steps):
-                task = async_wrap_errors(
-                    delayed_punch(
-                        # Address family for the con.
-                        af,
-
-                        # Wait until ms to do punching.
-                        # Punches are split up over time
-                        # to increase chances of success.
-                        sleep_time * ms_spacing,
 
-                        # Local mapping.
-                        send_mappings[i],
-
-                        # Destination addr to connect to.
-                        dest,
+            # Bind to a specific port and interface.
+            route = interface.route(af)
+            if "fe80" == dest.tup[0][:4]:
+                await route.bind(
+                    ips=str(route.link_locals[0]),
+                    port=send_mappings[i].local
+                )
+            else:
+                await route.bind(send_mappings[i].local)
 
-                        # Event loop for this process.
-                        loop,
+            targets.append([send_mappings[i], route, dest])
 
-                        # Punch from this interface.
-                        interface
-                    )
-                )
-                tasks.append(task)
-                
+        # Send times relative to the meeting.
+        offsets = [
+            (n * PUNCH_SPACING_MS) / 1000
+            for n in range(0, steps)
+        ]
 
-        # Start running tasks.
-        outs = await asyncio.gather(*tasks)
-        outs = strip_none(outs)
+        scheduler = PunchScheduler(targets, offsets, loop)
+        outs = await scheduler.run(start_at)
+        log(fstr("> punch timing = {0}", (scheduler.timing_report(),)))
         return outs
     except:
         #what_exception()
         log_exception()
 
-async def wait_for_punch_time(current_ntp, ntp_meet):
-    # Sleep until the ntp timeframe.
+"""
+Converts the NTP meeting time to an event loop time
+so punching can be scheduled with loop.call_at().
+"""
+def get_punch_start(current_ntp, ntp_meet, loop):
     assert(current_ntp)
-    if current_ntp < ntp_meet:
-        remaining_time = float(ntp_meet - current_ntp)
-        if remaining_time:
-            log(
-                "> punch waiting for meeting = %s" %
-                (str(remaining_time))
-            )
-
-            await asyncio.sleep(remaining_time)
+    remaining_time = float(ntp_meet - current_ntp)
+    if remaining_time > 0:
+        log(
+            "> punch waiting for meeting = %s" %
+            (str(remaining_time))
+        )
     else:
         log("TCP punch behind current meeting time!")
 
+    return loop.time() + max(0, remaining_time)
+
 def choose_same_punch_sock(our_wan, outs):
     chosen_sock = None
     try:
@@ -302,6 +406,68 @@ def punching_sanity_check(mode, our_wan, dest_addr, send_mappings, recv_mappings
             fstr("as our ext {0}", (our_wan,))
             log(error)
             
+"""
+Returns [server sock, path, token] for receiving a punched sock.
+The token stops other local processes from handing us sockets.
+"""
+def punch_fd_server():
+    token = to_h(rand_b(16))
+    path = os.path.join(
+        tempfile.gettempdir(),
+        fstr("p2pd_punch_{0}.sock", (token[:16],))
+    )
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(5)
+    server.setblocking(False)
+    return [server, path, to_b(token)]
+
+def punch_fd_server_close(server, path):
+    server.close()
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+# Used in the punching process.
+def send_punched_sock(path, token, sock):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(2)
+        client.connect(path)
+        socket.send_fds(client, [token], [sock.fileno()])
+
+# Returns the punched sock from the punching process.
+async def recv_punched_sock(server, token):
+    loop = asyncio.get_event_loop()
+    while 1:
+        con, _ = await loop.sock_accept(server)
+        try:
+            # Wait for the message with the fd.
+            readable = loop.create_future()
+            loop.add_reader(con.fileno(), readable.set_result, None)
+            try:
+                await readable
+            finally:
+                loop.remove_reader(con.fileno())
+
+            msg, fds, _, _ = socket.recv_fds(con, len(token), 1)
+            if msg != token:
+                for fd in fds:
+                    os.close(fd)
+
+                log("Punch fd server got an invalid token.")
+                continue
+
+            if not len(fds):
+                continue
+
+            sock = socket.socket(fileno=fds[0])
+            sock.setblocking(False)
+            return sock
+        finally:
+            con.close()
+
 # Not really the best approach but process communication is a pain.
 async def punch_close_msg(msg, client_tup, pipe):
     if msg in PUNCH_END:
@@ -309,7 +475,7 @@ async def punch_close_msg(msg, client_tup, pipe):
         await asyncio.sleep(2)
         await pipe.close()
 
-async def do_punching(af, dest_addr, send_mappings, recv_mappings, current_ntp, ntp_meet, mode, interface, reverse_tup, has_success, node_id):
+async def do_punching(af, dest_addr, send_mappings, recv_mappings, current_ntp, ntp_meet, mode, interface, reverse_tup, has_success, node_id, fd_info=None):
     try:
         """
         Punching is done in its own process.
@@ -323,10 +489,11 @@ async def do_punching(af, dest_addr, send_mappings, recv_mappings, current_ntp,
         # Set our WAN address from default route.
         our_wan = interface.route(af).ext()
 
-        # Wait for NTP punching time.
+        # Punching starts at the NTP meeting time.
+        loop = asyncio.get_event_loop()
+        start_at = None
         if ntp_meet:
-            assert(current_ntp)
-            await wait_for_punch_time(current_ntp, ntp_meet)
+            start_at = get_punch_start(current_ntp, ntp_meet, loop)
         else:
             log_exception("ntp meet time is 0!")
 
@@ -360,6 +527,7 @@ async def do_punching(af, dest_addr, send_mappings, recv_mappings, current_ntp,
             send_mappings=send_mappings,
             recv_mappings=recv_mappings,
             interface=interface,
+            start_at=start_at,
         )
 
         # Make both sides choose the same socket.
@@ -375,6 +543,16 @@ async def do_punching(af, dest_addr, send_mappings, recv_mappings, current_ntp,
         msg += fstr(" on '{0}'", (interface.name,))
         Log.log_p2p(msg, node_id)
 
+        # Hand the socket to the node and free this process.
+        if fd_info is not None:
+            try:
+                send_punched_sock(fd_info[0], fd_info[1], sock)
+                sock.close()
+                has_success.set()
+                return
+            except Exception:
+                log_exception()
+
         # Punched hole to the remote node.
         route = await interface.route(af).bind(sock.getsockname()[1])
         upstream_dest = sock.getpeername()[:2]
@@ -424,7 +602,7 @@ async def do_punching(af, dest_addr, send_mappings, recv_mappings, current_ntp,
         log_exception()
 
 
-async def do_punching_wrapper(af, dest_addr, send_mappings, recv_mappings, current_ntp, ntp_meet, mode, interface, reverse_tup, node_id):
+async def do_punching_wrapper(af, dest_addr, send_mappings, recv_mappings, current_ntp, ntp_meet, mode, interface, reverse_tup, node_id, fd_info=None):
     has_success = asyncio.Event()
     task = create_task(
         async_wrap_errors(
@@ -440,6 +618,7 @@ async def do_punching_wrapper(af, dest_addr, send_mappings, recv_mappings, curre
                 reverse_tup,
                 has_success,
                 node_id,
+                fd_info,
             )
         )
     )
@@ -448,15 +627,15 @@ async def do_punching_wrapper(af, dest_addr, send_mappings, recv_mappings, curre
     The punching func has 30 seconds to set this.
     If it doesn't a timeout error is thrown to end the process.
     So a hung punching process doesn't take up a process.
-    On the other hand -- if it succeeds and sets it block forever.
+    On success it returns once the socket is handed over or
+    when the relayed pipes close.
     """
     await asyncio.wait_for(
         has_success.wait(),
         30
     )
 
-    while 1:
-        await asyncio.sleep(1)
+    await task
 
 
 def puncher_to_dict(self):
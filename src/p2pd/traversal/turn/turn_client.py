@@ -98,6 +98,14 @@ class TURNClient(PipeEvents):
         self.msgs = {}
         self.tasks = []
 
+        # Channels confirmed by the server [chan] = peer_tup.
+        self.chans = {}
+
+        # [peer_tup] = chan and pending binds [txid] = [chan, peer_tup].
+        self.peer_chans = {}
+        self.chan_binds = {}
+        self.next_chan = TURN_CHAN_RANGE[0]
+
         # Event loop reference.
         loop = asyncio.get_event_loop()
         if self.conf["loop"] is not None:
@@ -415,12 +423,18 @@ class TURNClient(PipeEvents):
 
         # Refresh permissions.
         f = lambda: handler(peer_tup, peer_relay_tup)
+        bind = lambda: self.bind_channel(peer_tup)
         async def refresher():
             while self.state != TURN_ERROR_STOPPED:
                 await asyncio.sleep(TURN_REFRESH_EXPIRY - 60)
                 await async_retry(f, count=5, timeout=5)
                 log("Refresh permission.")
 
+                # Channels also expire after 10 mins.
+                await async_wrap_errors(
+                    async_retry(bind, count=5, timeout=5)
+                )
+
         # Prevent garbage collection.
         if not already_accepted:
             # Allow messages to be queued.
@@ -430,6 +444,14 @@ class TURNClient(PipeEvents):
             # White list the peer if needed.
             await async_retry(f, count=5, timeout=5)
 
+            # Data indications are used until the channel is bound.
+            task = asyncio.create_task(
+                async_wrap_errors(
+                    async_retry(bind, count=5, timeout=5)
+                )
+            )
+            self.tasks.append(task)
+
             # Start the loop to refresh the permission.
             task = asyncio.create_task(
                 async_wrap_errors(
@@ -440,6 +462,22 @@ class TURNClient(PipeEvents):
 
         return already_accepted
 
+    # Bind a channel to a white listed peer.
+    # Their data is then sent to us as ChannelData.
+    async def bind_channel(self, peer_tup):
+        chan = self.peer_chans.get(peer_tup)
+        if chan is None:
+            if self.next_chan > TURN_CHAN_RANGE[1]:
+                raise Exception("No TURN channels left.")
+
+            chan = self.next_chan
+            self.next_chan += 1
+            self.peer_chans[peer_tup] = chan
+
+        msg = await self.chan_bind_msg(peer_tup, chan)
+        self.chan_binds[msg.txn_id] = [chan, peer_tup]
+        return self.record_msg(msg)
+
     # Relay addresses are only valid for a certain 'life time.'
     # This creates and sends a message to refresh the lifetime.
     async def refresh_allocation(self):
@@ -496,6 +534,32 @@ class TURNClient(PipeEvents):
 
         return reply
 
+    # Bind a channel number to a peer address.
+    # Refreshing a binding uses the same message.
+    async def chan_bind_msg(self, peer_tup, chan):
+        reply = STUNMsg(
+            msg_type=STUNMsgTypes.ChannelBind,
+            mode=RFC5389
+        )
+        reply.write_attr(
+            STUNAttrs.ChannelNumber,
+            turn_chan_bind_value(chan)
+        )
+
+        af = af_from_ip_s(peer_tup[0])
+        reply.write_attr(
+            STUNAttrs.XorPeerAddress,
+            STUNAddrTup(
+                ip=peer_tup[0],
+                port=peer_tup[1],
+                af=af,
+                txid=reply.txn_id,
+                magic_cookie=reply.magic_cookie,
+            )
+        )
+
+        return reply
+
     # Step 3 - refresh allocation to avoid lifetime timeouts.
     async def refresh_msg(self):
         # 32 bit unsigned int
@@ -1,11 +1,12 @@
 import asyncio
 import io
-from struct import unpack
+from struct import unpack, Struct
 from hashlib import md5
 from ...utility.utils import *
 from ...net.address import *
 from .turn_defs import *
 from ...protocol.stun.stun_utils import *
+from ...protocol.stun.stun_codec import *
 from ...net.pipe.pipe_client import *
 
 # Parse a TURN message.
@@ -28,44 +29,106 @@ B) Peer Address attribute (the sender)
 Return this information to the caller.
 """
 def turn_get_data_attr(msg, af, client):
-    # Step through all attributes.
-    data = peer_tup = None
-    while not msg.eof():
-        attr_code, _, attr_data = msg.read_attr()
-
-        # The message segment.
-        if attr_code == STUNAttrs.Data:
-            if isinstance(attr_data, memoryview):
-                data = attr_data.tobytes()
-            else:
-                data = attr_data
-
-        # The sender of the message.
-        if attr_code == STUNAttrs.XorPeerAddress:
-            stun_addr = STUNAddrTup(
-                af=af,
-                txid=msg.txn_id,
-                magic_cookie=msg.magic_cookie,
-            )
-            stun_addr.decode(attr_code, attr_data)
-            peer_tup = stun_addr.tup
-
-            # Validate the peer addr.
-            ext = client.turn_pipe.route.ext()
-            if peer_tup[0] == ext:
-                error = fstr("""
-                We received a TURN message from ourselves
-                this might indicate bad logic
-                msg peer_tup 0 == {0}
-                """, (ext,))
-                log(error)
-
-    # Reset attribute pointer to start.
-    msg.attr_cursor = 0
+    # Uses the fast codec as this runs for every relayed packet.
+    data = msg.get(STUN_DATA)
+    if data is not None:
+        data = data.tobytes()
+
+    # The sender of the message.
+    peer_tup = msg.addr(STUN_XOR_PEER_ADDR, af)
+    if peer_tup is not None:
+        # Validate the peer addr.
+        ext = client.turn_pipe.route.ext()
+        if peer_tup[0] == ext:
+            error = fstr("""
+            We received a TURN message from ourselves
+            this might indicate bad logic
+            msg peer_tup 0 == {0}
+            """, (ext,))
+            log(error)
 
     # Return results (if any.)
     return data, peer_tup
 
+"""
+Once a channel is bound to a peer the server sends its data as
+ChannelData (RFC 5766 11.4) instead of Data indications:
+    channel number (0x4000 - 0x7FFE) | len | data
+That's a 4 byte header to check instead of a STUN message to
+decode and a peer address to unXOR for every packet.
+"""
+TURN_CHAN_HDR = Struct("!HH")
+
+# First two bits are 01 for ChannelData and 00 for STUN.
+def is_turn_chan_data(buf):
+    return len(buf) >= 4 and (buf[0] & 0xC0) == 0x40
+
+def turn_chan_data_encode(chan, data):
+    out = bytearray(4 + len(data))
+    TURN_CHAN_HDR.pack_into(out, 0, chan, len(data))
+    out[4:] = data
+    return out
+
+# Returns (channel, data view) or (None, None) if invalid.
+def turn_chan_data_decode(buf):
+    buf = memoryview(buf)
+    chan, data_len = TURN_CHAN_HDR.unpack_from(buf, 0)
+    if 4 + data_len > len(buf):
+        return None, None
+
+    return chan, buf[4:4 + data_len]
+
+def turn_chan_bind_value(chan):
+    # Channel number + RFFU.
+    return TURN_CHAN_HDR.pack(chan, 0)
+
+# Pass a message from a white listed peer to the pipe.
+def turn_proc_peer_data(self, msg_data, peer_tup):
+    # Not a peer we white listed.
+    peer_tup = norm_client_tup(peer_tup)
+    if peer_tup not in self.peers:
+        error = fstr("""
+        Got a TURN data message from an 
+        unknown peer = {0} which 
+        may indicate a decoding error.
+        """, (peer_tup,))
+        log(error)
+        return
+
+    # Get relay address to route to sender of the message.
+    peer_relay_tup = self.peers[peer_tup]
+
+    # Tell the sender that we got the message.
+    _, payload = self.stream.handle_ack(
+        msg_data,
+        self.stream.is_ack,
+        self.stream.is_ackable,
+        lambda buf: self.stream.send(buf, peer_relay_tup),
+        ack_key=peer_relay_tup
+    )
+
+    """
+    A simple ACK-based protocol is transparently applied to the
+    relay messages behind the scenes to add reliability.
+    If the header can't be found then the original message
+    will be unknown so we skip it.
+    """
+    if payload is None:
+        log(fstr("Payload from turn was None but msg data = {0}", (msg_data,)))
+        if self.blank_rudp_headers:
+            self.handle_data(msg_data, peer_tup)
+
+        return
+
+    """
+    The senders message has been stripped of the ACK header.
+    It is then routed to this object (pipe-like object)
+    where it will be handled and/or queued. The sender's
+    relay address is listed as the sender to make it
+    easy to route replies transparently.
+    """
+    self.handle_data(payload, peer_tup)
+
 # True when all the fields in the client needed for auth are set.
 def is_auth_ready(self):
     key_con = self.key is not None
@@ -183,9 +246,19 @@ async def process_replies(self):
             await asyncio.sleep(1)
             continue
 
-        # Option B) Parse TURN messages from the server.
-        turn_msg, turn_method, turn_status = turn_parse_msg(memoryview(out))
-        if turn_msg is None:
+        # Option A) ChannelData from a bound peer (fastest path.)
+        if is_turn_chan_data(out):
+            chan, msg_data = turn_chan_data_decode(out)
+            peer_tup = self.chans.get(chan)
+            if peer_tup is not None:
+                turn_proc_peer_data(self, msg_data.tobytes(), peer_tup)
+
+            continue
+
+        # Option B) Data indication relayed from a peer.
+        try:
+            view, _ = stun_decode(out)
+        except Exception:
             continue
 
         """
@@ -193,55 +266,17 @@ async def process_replies(self):
         These indicate a peer who sent data to our relay address.
         Attempt to look for these attributes and process them if found.
         """
-        msg_data, peer_tup = turn_get_data_attr(turn_msg, self.turn_pipe.route.af, self)
+        msg_data, peer_tup = turn_get_data_attr(view, self.turn_pipe.route.af, self)
 
         if msg_data is not None and peer_tup is not None:
-            # Not a peer we white listed.
-            peer_tup = norm_client_tup(peer_tup)
-            if peer_tup not in self.peers:
-                error = fstr("""
-                Got a TURN data message from an 
-                unknown peer = {0} which 
-                may indicate a decoding error.
-                """, (peer_tup,))
-                log(error)
-                continue
-
-            # Get relay address to route to sender of the message.
-            peer_relay_tup = self.peers[peer_tup]
-
-            # Tell the sender that we got the message.
-            _, payload = self.stream.handle_ack(
-                msg_data,
-                self.stream.is_ack,
-                self.stream.is_ackable,
-                lambda buf: self.stream.send(buf, peer_relay_tup)
-            )
-
-            """
-            A simple ACK-based protocol is transparently applied to the
-            relay messages behind the scenes to add reliability.
-            If the header can't be found then the original message
-            will be unknown so we skip it.
-            """
-            if payload is None:
-                log(fstr("Payload from turn was None but msg data = {0}", (msg_data,)))
-                if not self.blank_rudp_headers:
-                    continue
-                else:
-                    self.handle_data(msg_data, peer_tup)
-                    continue
-
-            """
-            The senders message has been stripped of the ACK header.
-            It is then routed to this object (pipe-like object)
-            where it will be handled and/or queued. The sender's
-            relay address is listed as the sender to make it
-            easy to route replies transparently.
-            """
-            self.handle_data(payload, peer_tup)
+            turn_proc_peer_data(self, msg_data, peer_tup)
             continue
     
+        # Option C) Parse TURN messages from the server.
+        turn_msg, turn_method, turn_status = turn_parse_msg(memoryview(out))
+        if turn_msg is None:
+            continue
+
         """
         When a TURN message is sent it has a unique TXID.
         Replies in response to these messages use the same TXID.
@@ -319,6 +354,20 @@ async def process_replies(self):
 
             continue
 
+        # Peer data uses ChannelData once the server confirms.
+        if turn_method == STUNMsgTypes.ChannelBind:
+            bind = self.chan_binds.pop(txid, None)
+            if turn_status == STUNMsgCodes.SuccessResp:
+                if bind is not None:
+                    chan, peer_tup = bind
+                    self.chans[chan] = peer_tup
+                    log(fstr("> Turn channel {0} bound to {1}", (chan, peer_tup,)))
+            else:
+                log(fstr("Error in TURN channel bind = {0}", (error_code,)))
+
+            self.msgs[txid]["status"].set_result(STATUS_SUCCESS)
+            continue
+
         if turn_method == STUNMsgTypes.Refresh:
             self.msgs[txid]["status"].set_result(STATUS_SUCCESS)
             continue
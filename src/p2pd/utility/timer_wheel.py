@@ -0,0 +1,190 @@
+"""
+A hierarchical timer wheel that runs callbacks after a delay.
+
+Scheduling thousands of timeouts with one coroutine each (sleep,
+check, repeat) puts a lot of load on the event loop. A timer
+wheel keeps all timeouts in buckets ('slots') indexed by the tick
+they expire on. Adding or cancelling a timer is a dict insert or
+delete. Only one event loop callback is scheduled per wheel.
+
+Level 0 has one slot per tick. Each higher level has slots that
+cover a whole revolution of the level below. When a lower level
+wraps around the matching slot from the level above is 'cascaded'
+-- its timers are placed into the lower levels again. With the
+default sizes timers can be up to ~7 days out at 10 ms precision.
+Anything further is kept in an overflow list.
+"""
+
+import asyncio
+import math
+from .utils import *
+
+# Seconds per tick.
+TIMER_TICK = 0.01
+
+# Slots per level = 2 ** bits.
+TIMER_LEVEL_BITS = [8, 6, 6, 6]
+
+class Timer():
+    def __init__(self, timer_id, expiry, callback, args):
+        self.timer_id = timer_id
+        self.expiry = expiry
+        self.callback = callback
+        self.args = args
+        self.slot = None
+
+class TimerWheel():
+    def __init__(self, tick=TIMER_TICK, loop=None):
+        self.tick = tick
+        self.loop = loop
+        self.cur_tick = None
+        self.timer_no = 0
+        self.count = 0
+
+        # Levels of slots + shift to get a slot index.
+        self.levels = []
+        self.shifts = []
+        shift = 0
+        for bits in TIMER_LEVEL_BITS:
+            self.levels.append([{} for _ in range(0, 2 ** bits)])
+            self.shifts.append(shift)
+            shift += bits
+
+        # Timers past the last level.
+        self.max_ticks = 2 ** shift
+        self.overflow = {}
+
+        # Single loop callback used to run the wheel.
+        self.handle = None
+        self.wake_tick = None
+
+    def __len__(self):
+        return self.count
+
+    def get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+
+        return self.loop
+
+    def now_tick(self):
+        return int(self.get_loop().time() / self.tick)
+
+    def place(self, timer):
+        delta = timer.expiry - self.cur_tick
+        slot = self.overflow
+        for level, shift in enumerate(self.shifts):
+            slot_no = len(self.levels[level])
+            if delta < (slot_no << shift):
+                index = (timer.expiry >> shift) & (slot_no - 1)
+                slot = self.levels[level][index]
+                break
+
+        slot[timer.timer_id] = timer
+        timer.slot = slot
+
+    # Run callback(*args) after delay seconds.
+    def add(self, delay, callback, *args):
+        if self.cur_tick is None or not self.count:
+            self.cur_tick = self.now_tick()
+
+        # Round up so timers never fire early.
+        expiry = math.ceil((self.get_loop().time() + delay) / self.tick)
+        expiry = max(expiry, self.cur_tick + 1)
+
+        self.timer_no += 1
+        timer = Timer(self.timer_no, expiry, callback, args)
+        self.place(timer)
+        self.count += 1
+
+        # Wake up sooner if needed.
+        if self.wake_tick is None or expiry < self.wake_tick:
+            self.schedule(expiry)
+
+        return timer
+
+    def cancel(self, timer):
+        if timer.slot is None:
+            return
+
+        if timer.slot.pop(timer.timer_id, None) is not None:
+            self.count -= 1
+
+        timer.slot = None
+        if not self.count:
+            self.stop()
+
+    def stop(self):
+        if self.handle is not None:
+            self.handle.cancel()
+
+        self.handle = None
+        self.wake_tick = None
+
+    def schedule(self, wake_tick):
+        self.stop()
+        self.wake_tick = wake_tick
+        self.handle = self.get_loop().call_at(
+            wake_tick * self.tick,
+            self.run
+        )
+
+    # Move timers from a slot down to lower levels.
+    def cascade(self, slot):
+        timers = list(slot.values())
+        slot.clear()
+        for timer in timers:
+            self.place(timer)
+
+    def do_tick(self):
+        self.cur_tick += 1
+
+        # Cascade higher levels when the level below wraps.
+        for level in range(1, len(self.levels)):
+            shift = self.shifts[level]
+            if self.cur_tick & ((1 << shift) - 1):
+                break
+
+            slot_no = len(self.levels[level])
+            index = (self.cur_tick >> shift) & (slot_no - 1)
+            self.cascade(self.levels[level][index])
+
+            # Re-check far away timers on a full revolution.
+            if level == len(self.levels) - 1 and not index:
+                self.cascade(self.overflow)
+
+        # Run expired timers.
+        slot = self.levels[0][self.cur_tick & (len(self.levels[0]) - 1)]
+        if not len(slot):
+            return
+
+        timers = list(slot.values())
+        slot.clear()
+        for timer in timers:
+            timer.slot = None
+            self.count -= 1
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                log_exception()
+
+    # Tick until the next level 0 timer or next cascade.
+    def next_wake(self):
+        slot_no = len(self.levels[0])
+        for offset in range(1, slot_no + 1):
+            wake_tick = self.cur_tick + offset
+            if len(self.levels[0][wake_tick & (slot_no - 1)]):
+                return wake_tick
+
+            if not (wake_tick & (slot_no - 1)):
+                return wake_tick
+
+    def run(self):
+        self.handle = None
+        self.wake_tick = None
+        now_tick = self.now_tick()
+        while self.count and self.cur_tick < now_tick:
+            self.do_tick()
+
+        if self.count:
+            self.schedule(self.next_wake())
@@ -0,0 +1,18 @@
+from p2pd import *
+
+# Only used for tests.
+# UDP pipe bound to a random loopback port.
+async def loopback_udp_pipe(conf=NET_CONF):
+    loop = asyncio.get_event_loop()
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    pipe = PipeEvents(sock=s, loop=loop, conf=conf)
+    transport, _ = await create_datagram_endpoint(
+        loop,
+        lambda: pipe,
+        sock=s
+    )
+
+    await pipe.stream_ready.wait()
+    pipe.stream.set_handle(transport, client_tup=None)
+    return pipe
@@ -0,0 +1,26 @@
+from p2pd import *
+from ecdsa import SigningKey, SECP256k1
+
+# Only used for tests.
+# Fakes for calling PNPServer.msg_cb without sockets.
+class FakeClock():
+    def time(self):
+        return time.time()
+
+class FakePipe():
+    def __init__(self, af=IP4):
+        self.sock = type("Sock", (), {"type": TCP})()
+        self.route = type("Route", (), {"af": af})()
+        self.stream = self
+        self.sent = []
+
+    def set_dest_tup(self, dest_tup):
+        self.dest_tup = dest_tup
+
+    async def send(self, buf, dest_tup=None):
+        self.sent.append(buf)
+        return len(buf)
+
+def gen_keys():
+    sk = SigningKey.generate(curve=SECP256k1)
+    return sk, sk.get_verifying_key().to_string("compressed")
@@ -1,6 +1,35 @@
 import uuid
 from p2pd import *
 
+CHUNKED_RESP = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n4;x=y\r\nmeow\r\n5\r\n meow\r\n0\r\nX-Trailer: 1\r\n\r\n"
+
+async def http_test_server(cons):
+    async def handler(reader, writer):
+        cons.append(writer)
+        while True:
+            req = await reader.readuntil(b"\r\n\r\n")
+            path = req.split(b" ")[1]
+            if path == b"/len":
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\nmeow")
+            if path == b"/chunked":
+                # Split over writes.
+                for n in range(0, len(CHUNKED_RESP), 7):
+                    writer.write(CHUNKED_RESP[n:n + 7])
+                    await writer.drain()
+                    await asyncio.sleep(0)
+            if path == b"/big":
+                body = b"x" * 100000
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body))
+                writer.write(body)
+            if path == b"/close":
+                writer.write(b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 4\r\n\r\nmeow")
+                await writer.drain()
+                writer.close()
+                return
+
+            await writer.drain()
+
+    return await asyncio.start_server(handler, "127.0.0.1", 0)
 
 class TestHTTPClientLib(unittest.IsolatedAsyncioTestCase):
     # Should break as chunked is not supported.
@@ -14,6 +43,103 @@ class TestHTTPClientLib(unittest.IsolatedAsyncioTestCase):
             has_thrown = True
 
         assert(has_thrown)
-        
+
+    async def test_http_parser(self):
+        # Fed one byte at a time.
+        parser = HTTPResponseParser()
+        pieces = []
+        for n in range(0, len(CHUNKED_RESP)):
+            self.assertFalse(parser.done)
+            pieces += parser.feed(CHUNKED_RESP[n:n + 1])
+
+        self.assertTrue(parser.done)
+        self.assertTrue(parser.keep_alive)
+        self.assertEqual(parser.status, 200)
+        self.assertEqual(b"".join(pieces), b"meow meow")
+        self.assertEqual(parser.out(), b"meow meow")
+        self.assertEqual(parser.hdrs["transfer-encoding"], "chunked")
+
+        # Content-Length with HTTP/1.0 defaults.
+        parser = HTTPResponseParser()
+        parser.feed(b"HTTP/1.0 404 Not Found\nContent-Length: 3\n\nabcdef")
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.status, 404)
+        self.assertEqual(parser.reason, "Not Found")
+        self.assertEqual(parser.out(), b"abc")
+        self.assertFalse(parser.keep_alive)
+
+        # Body ends when the con closes.
+        parser = HTTPResponseParser(keep_body=False)
+        self.assertEqual(parser.feed(b"HTTP/1.1 200 OK\r\n\r\nab"), [b"ab"])
+        self.assertEqual(parser.feed(b"cd"), [b"cd"])
+        self.assertFalse(parser.done)
+        self.assertTrue(parser.eof())
+        self.assertEqual(parser.out(), b"")
+        self.assertFalse(parser.keep_alive)
+
+        # No body for HEAD.
+        parser = HTTPResponseParser(b"HEAD")
+        parser.feed(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n")
+        self.assertTrue(parser.done)
+
+        with self.assertRaises(Exception):
+            HTTPResponseParser().feed(b"meow\r\n")
+
+    async def test_http_pool(self):
+        cons = []
+        server = await http_test_server(cons)
+        port = server.sockets[0].getsockname()[1]
+        route = Route(
+            af=IP4,
+            nic_ips=[IPRange("127.0.0.1")],
+            ext_ips=[IPRange(BLACK_HOLE_IPS[IP4])],
+            interface=Interface("lo")
+        )
+        await route.bind(ips="127.0.0.1")
+        curl = WebCurl(("127.0.0.1", port), route, keep_alive=1)
+        try:
+            # Keep-alive cons are reused.
+            for path in ["/len", "/chunked", "/len"]:
+                resp = await curl.vars().get(path)
+                self.assertEqual(resp.info.status, 200)
+                self.assertTrue(resp.pipe is None)
+            
+            self.assertEqual(resp.out, b"meow")
+            self.assertEqual(len(cons), 1)
+
+            # Stream a large body.
+            resp = await curl.vars().stream("GET", "/big")
+            got = bytearray()
+            async for chunk in resp.reader:
+                got += chunk
+            self.assertEqual(got, b"x" * 100000)
+            self.assertTrue(resp.out is None)
+            self.assertEqual(len(cons), 1)
+
+            # Con isn't pooled if the server closes it.
+            resp = await curl.vars().get("/close")
+            self.assertEqual(resp.out, b"meow")
+            resp = await curl.vars().get("/len")
+            self.assertEqual(resp.out, b"meow")
+            self.assertEqual(len(cons), 2)
+
+            # Stale pooled cons are retried on a new con.
+            cons[-1].close()
+            await asyncio.sleep(0.1)
+            resp = await curl.vars().get("/len")
+            self.assertEqual(resp.out, b"meow")
+            self.assertEqual(len(cons), 3)
+
+            # Pooling is opt-in.
+            once = WebCurl(("127.0.0.1", port), route)
+            resp = await once.vars().get("/len")
+            self.assertEqual(resp.out, b"meow")
+            self.assertEqual(once.pool, None)
+            self.assertEqual(len(cons), 4)
+        finally:
+            await curl.close()
+            server.close()
+            await server.wait_closed()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
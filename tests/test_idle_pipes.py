@@ -0,0 +1,37 @@
+from p2pd import *
+
+class TestIdlePipes(unittest.IsolatedAsyncioTestCase):
+    async def test_idle_pipes(self):
+        idle = IdlePipes()
+        a, b, c = [PipeEvents(sock=None) for _ in range(0, 3)]
+        idle.watch(a, now=100)
+        idle.watch(b, now=200)
+        idle.watch(c, now=300)
+
+        # Unwatched pipes aren't added by recvs.
+        d = PipeEvents(sock=None)
+        idle.touch(d, now=400)
+        self.assertFalse(d in idle)
+
+        # A recv moves the pipe to the back.
+        idle.touch(a, now=350)
+        self.assertEqual(idle.pop_expired(150, now=400), [b])
+        self.assertEqual(idle.pop_expired(10, now=400), [c, a])
+        self.assertEqual(len(idle), 0)
+
+    async def test_idle_closed_pipe(self):
+        idle = IdlePipes()
+        pipe = PipeEvents(sock=None)
+        pipe.connection_made(None)
+        idle.watch(pipe)
+        pipe.connection_lost(None)
+        self.assertFalse(pipe in idle)
+
+    async def test_idle_timeout(self):
+        self.assertEqual(idle_timeout(0, 0), 7200)
+        self.assertEqual(idle_timeout(0, 10), 7200)
+        self.assertEqual(idle_timeout(10, 10), 300)
+        self.assertEqual(idle_timeout(5, 10), 3750)
+
+if __name__ == '__main__':
+    main()
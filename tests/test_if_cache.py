@@ -0,0 +1,105 @@
+from p2pd import *
+import tempfile
+
+class FakeNetifaces():
+    AF_LINK = 17
+    AF_INET = 2
+    AF_INET6 = 10
+
+    def __init__(self, nic_ip="192.168.0.2"):
+        self.nic_ip = nic_ip
+
+    def interfaces(self):
+        return ["eth0"]
+
+    def ifaddresses(self, name):
+        return {
+            self.AF_LINK: [{"addr": "aa:bb:cc:dd:ee:ff"}],
+            self.AF_INET: [{"addr": self.nic_ip, "netmask": "255.255.255.0"}],
+        }
+
+def if_dict(ext_ip, nat_type=RESTRICT_PORT_NAT):
+    ipr = lambda ip: {"ip": ip, "cidr": 32, "af": int(IP4)}
+    return {
+        "netiface_index": 0,
+        "name": "eth0",
+        "nic_no": 0,
+        "id": "eth0",
+        "mac": "aa:bb:cc:dd:ee:ff",
+        "is_default": {int(IP4): True, int(IP6): False},
+        "nat": {
+            "type": nat_type,
+            "delta": delta_info(RANDOM_DELTA, 0),
+        },
+        "rp": {
+            int(IP4): [{
+                "af": int(IP4),
+                "nic_ips": [ipr("192.168.0.2")],
+                "ext_ips": [ipr(ext_ip)],
+                "link_local_ips": [],
+            }],
+            int(IP6): [],
+        }
+    }
+
+class TestIFCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "if_cache.json")
+        self.netifaces = FakeNetifaces()
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_if_cache(self):
+        cache = IFCache(self.path)
+        cache.put(Interface.from_dict(if_dict("1.2.3.4")), self.netifaces)
+        cache.save()
+
+        # Loaded from disk.
+        cache = IFCache(self.path).load()
+        nic = cache.get("eth0", self.netifaces)
+        self.assertEqual(nic.route(IP4).ext(), "1.2.3.4")
+        self.assertEqual(nic.nat["type"], RESTRICT_PORT_NAT)
+        self.assertTrue(nic.is_default(IP4))
+        self.assertTrue(nic.resolved)
+
+        # Moving network = different key.
+        self.assertEqual(cache.get("eth0", FakeNetifaces("10.0.0.2")), None)
+
+        # Old entries are ignored.
+        cache.ttl = 0
+        self.assertEqual(cache.get("eth0", self.netifaces), None)
+
+        # Corrupt caches are empty.
+        with open(self.path, "w") as fp:
+            fp.write("{")
+        self.assertEqual(IFCache(self.path).load().entries, {})
+
+    async def test_if_cache_start(self):
+        cache = IFCache(self.path)
+        cache.put(Interface.from_dict(if_dict("1.2.3.4")), self.netifaces)
+
+        # No network tests needed.
+        nics, cached = await load_interfaces_cached(
+            ["eth0"],
+            self.netifaces,
+            cache
+        )
+        self.assertEqual(len(nics), 1)
+        self.assertEqual(nics, cached)
+
+    async def test_if_swap_resolved(self):
+        nic = Interface.from_dict(if_dict("1.2.3.4"))
+        fresh = Interface.from_dict(if_dict("5.6.7.8", OPEN_INTERNET))
+        self.assertNotEqual(if_resolved_info(nic), if_resolved_info(fresh))
+
+        # Existing refs to the interface see the new details.
+        if_swap_resolved(nic, fresh)
+        self.assertEqual(if_resolved_info(nic), if_resolved_info(fresh))
+        self.assertEqual(nic.route(IP4).ext(), "5.6.7.8")
+        self.assertTrue(nic.route(IP4).interface is nic)
+        self.assertEqual(nic.nat["type"], OPEN_INTERNET)
+
+if __name__ == '__main__':
+    main()
@@ -112,5 +112,44 @@ class TestPipe(unittest.IsolatedAsyncioTestCase):
         server.close()
         await server.wait_closed()
 
+    # Tests TCP cons can read into a reused buffer.
+    async def test_fast_recv(self):
+        loop = asyncio.get_event_loop()
+        lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        lsock.bind(('127.0.0.1', 0))
+        lsock.listen(1)
+        lsock.setblocking(False)
+        dest = ("127.0.0.1", lsock.getsockname()[1])
+
+        # Record what type of data handlers are passed.
+        views = []
+        def msg_cb(msg, client_tup, pipe):
+            views.append(isinstance(msg, memoryview))
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(False)
+        await loop.sock_connect(s, dest)
+
+        conf = dict_child({"fast_recv": True}, NET_CONF)
+        pipe_class = get_pipe_events_class(TCP, dest, conf)
+        pipe = pipe_class(sock=s, loop=loop, conf=conf)
+        pipe.add_msg_cb(msg_cb)
+        await loop.create_connection(lambda: pipe, sock=s)
+        pipe.subscribe(SUB_ALL)
+        cs, _ = await loop.sock_accept(lsock)
+
+        # Queued messages are copied from the buffer.
+        for msg in [b"first", b"second"]:
+            await loop.sock_sendall(cs, msg)
+            self.assertEqual(await pipe.recv(SUB_ALL, 2), msg)
+
+        self.assertEqual(views, [True, True])
+        self.assertEqual(len(pipe.addr_cache.tups), 1)
+
+        # Cleanup.
+        await pipe.close()
+        cs.close()
+        lsock.close()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+from p2pd import *
+try:
+    from .loopback_pipes import *
+except:
+    from loopback_pipes import *
+
+async def batch_pipe(conf):
+    pipe = await loopback_udp_pipe(conf)
+    pipe.stream.batch = pipe_batch_setup(
+        pipe,
+        pipe.stream.handle,
+        asyncio.get_event_loop(),
+        conf
+    )
+    pipe.subscribe(SUB_ALL)
+    return pipe
+
+class TestPipeBatch(unittest.IsolatedAsyncioTestCase):
+    async def test_sockaddr_tups(self):
+        tups = [
+            [AF_INET, ("127.0.0.1", 1337)],
+            [AF_INET6, ("::1", 1337, 0, 0)]
+        ]
+
+        for af, tup in tups:
+            sockaddr = tup_to_sockaddr(af, tup)
+            self.assertEqual(sockaddr_to_tup(sockaddr), tup)
+
+    async def test_udp_batch(self):
+        for fast_recv in [False, True]:
+            conf = dict_child({
+                "udp_batch": 8,
+                "fast_recv": fast_recv
+            }, NET_CONF)
+
+            pipe = await batch_pipe(conf)
+            if sys.platform.startswith("linux"):
+                self.assertTrue(pipe.stream.batch.use_mmsg)
+
+            # More msgs than fit in one batch.
+            c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            c.bind(("127.0.0.1", 0))
+            c.setblocking(False)
+            msgs = [to_b(str(n)) for n in range(0, 20)]
+            for msg in msgs:
+                c.sendto(msg, pipe.sock.getsockname())
+
+            out = []
+            for _ in msgs:
+                out.append(await pipe.recv(SUB_ALL, 2))
+
+            self.assertEqual(out, msgs)
+
+            # Queued sends are flushed together.
+            for msg in msgs:
+                await pipe.send(msg, c.getsockname())
+
+            self.assertEqual(len(pipe.stream.batch.send_queue), len(msgs))
+            await asyncio.sleep(0.1)
+            out = []
+            for _ in msgs:
+                out.append(await asyncio.get_event_loop().sock_recv(c, 100))
+
+            self.assertEqual(out, msgs)
+            await pipe.close()
+            c.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+from p2pd import *
+
+class FakeNodePipe():
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.codec = None
+        self.handler_tasks = []
+        self.tasks = []
+        self.sent = []
+
+    async def send(self, data, dest_tup=None):
+        self.sent.append(data)
+        return 1
+
+class TestPipeCodec(unittest.IsolatedAsyncioTestCase):
+    async def test_line_codec(self):
+        codec = LineCodec()
+        self.assertEqual(codec.encode(b"meow"), b"meow\n")
+
+        # Messages split across reads are reassembled.
+        self.assertEqual(codec.decode(b"ab"), [])
+        self.assertEqual(codec.decode(b"c\nde"), [b"abc"])
+        self.assertEqual(codec.decode(b"f\ng\nh\n"), [b"def", b"g", b"h"])
+        self.assertEqual(len(codec.buf), 0)
+
+        # Multi-byte delims split across reads.
+        codec = LineCodec(b"\r\n")
+        self.assertEqual(codec.decode(b"abc\r"), [])
+        self.assertEqual(codec.decode(b"\nx"), [b"abc"])
+
+        # Datagrams aren't buffered.
+        codec = LineCodec()
+        self.assertEqual(codec.decode(b"a\nb", is_stream=False), [b"a", b"b"])
+        self.assertEqual(len(codec.buf), 0)
+
+    async def test_len_codec(self):
+        codec = LenCodec()
+        msgs = [b"one\ntwo", b"", os.urandom(1000)]
+        buf = b"".join([codec.encode(msg) for msg in msgs])
+
+        # Feed one byte at a time.
+        out = []
+        for i in range(0, len(buf)):
+            out += codec.decode(buf[i:i + 1])
+
+        self.assertEqual(out, msgs)
+        self.assertEqual(codec.decode(buf), msgs)
+
+        # Oversized frames are dropped.
+        codec = LenCodec(max_frame=10)
+        self.assertEqual(codec.decode(codec.encode(b"x" * 11)), [])
+        self.assertEqual(len(codec.buf), 0)
+
+    async def test_pipe_decode(self):
+        loop = asyncio.get_event_loop()
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        pipe = PipeEvents(sock=s, loop=loop)
+        self.assertEqual(pipe_decode(pipe, b"a\nb"), [b"a"])
+        self.assertEqual(pipe_decode(pipe, b"c\n"), [b"bc"])
+        self.assertTrue(isinstance(pipe.codec, LineCodec))
+        s.close()
+
+    async def test_node_len_codec(self):
+        conf = dict_child({"msg_codec": LenCodec}, NODE_CONF)
+        node = P2PNode(conf=conf)
+        got = []
+        node.add_msg_cb(lambda msg, client_tup, pipe: got.append(msg))
+
+        # Frames from one read are passed to handlers one at a time.
+        pipe = FakeNodePipe()
+        buf = node.frame_msg(pipe, b"long_p2pd_test_string_abcd123")
+        buf += node.frame_msg(pipe, b"line\nbreak")
+        await node.msg_cb(buf[:6], None, pipe)
+        self.assertEqual(got, [])
+        await node.msg_cb(buf[6:], None, pipe)
+        self.assertEqual(got, [b"long_p2pd_test_string_abcd123", b"line\nbreak"])
+
+        # Echo reply uses the same framing.
+        reply = LenCodec().decode(pipe.sent[0])
+        self.assertEqual(reply, [b"p2pd test string"])
+        pipe.sock.close()
+
+    async def test_node_unframed(self):
+        # Default is unframed like data sent by the REST API.
+        node = P2PNode()
+        got = []
+        node.add_msg_cb(lambda msg, client_tup, pipe: got.append(msg))
+        pipe = FakeNodePipe()
+        await node.msg_cb(b"ECHO meow", None, pipe)
+        self.assertEqual(got, [b"ECHO meow"])
+        self.assertEqual(pipe.codec, None)
+
+        # Old echo reply.
+        await node.msg_cb(b"long_p2pd_test_string_abcd123", None, pipe)
+        self.assertEqual(pipe.sent, [b"p2pd test string\r\n\r\n"])
+        self.assertEqual(node.frame_msg(pipe, b"x"), b"x\n")
+
+        # A pipe can opt in to framing.
+        node.use_msg_codec(pipe, LenCodec)
+        await node.msg_cb(LenCodec().encode(b"a\nb")[:5], None, pipe)
+        await node.msg_cb(b"\nb", None, pipe)
+        self.assertEqual(got[-1], b"a\nb")
+        pipe.sock.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+from p2pd import *
+
+class TestPipeSubs(unittest.IsolatedAsyncioTestCase):
+    async def test_sub_literal(self):
+        txid = b"\x00.*[a]\n(x)" + os.urandom(4)
+        self.assertEqual(sub_literal(re.escape(txid)), txid)
+        self.assertEqual(sub_literal(b"meow"), b"meow")
+        self.assertEqual(sub_literal(rb"me\d+ow"), None)
+        self.assertEqual(sub_literal(None), None)
+
+    async def test_sub_index_match(self):
+        index = SubIndex()
+        tup = ("127.0.0.1", 1000)
+        other = ("127.0.0.2", 1000)
+        txids = [os.urandom(12) for _ in range(0, 100)]
+        for i, txid in enumerate(txids):
+            index.add(i, re.escape(txid), tup)
+
+        index.add(100, b"", None)
+        index.add(101, rb"ab[0-9]", ("127.0.0.1", 0))
+        index.add(102, b"", other)
+
+        # Literal at a fixed offset + any host sub.
+        msg = b"\x01" * 8 + txids[50] + b"ab1"
+        self.assertEqual(index.match(msg, tup), [50, 100, 101])
+        self.assertEqual(index.hints, [(8, 12)])
+
+        # Other literals are still found.
+        msg = b"\x02" * 8 + txids[3]
+        self.assertEqual(index.match(msg, tup), [3, 100])
+
+        # Host patterns filter out other senders.
+        self.assertEqual(index.match(msg, other), [100, 102])
+
+        # Removed subs no longer match.
+        index.remove(3)
+        index.remove(102)
+        self.assertEqual(index.match(msg, tup), [100])
+        self.assertEqual(index.match(msg, other), [100])
+        self.assertTrue(other not in index.by_tup)
+
+    async def test_sub_index_two_literals(self):
+        index = SubIndex()
+        tup = ("127.0.0.1", 1000)
+        index.add(0, re.escape(b"txid_one"), None)
+        index.add(1, re.escape(b"other"), None)
+
+        # Learn the offset for the first literal.
+        self.assertEqual(index.match(b"xx" + b"txid_one", tup), [0])
+        self.assertEqual(index.hints, [(2, 8)])
+
+        # Both subs get a msg with one literal at the hinted offset.
+        msg = b"xx" + b"txid_one" + b"---other"
+        self.assertEqual(index.match(msg, tup), [0, 1])
+
+        # With one literal the hint alone is used.
+        index.remove(1)
+        self.assertEqual(index.match(msg, tup), [0])
+
+    async def test_add_msg_index(self):
+        pipe = PipeEvents(sock=None)
+        pipe.connection_made(None)
+        sub = (re.escape(b"txid"), ("127.0.0.1", 1337))
+        pipe.subscribe(SUB_ALL)
+        pipe.subscribe(sub)
+        pipe.stream.add_msg(b"xx txid", ("127.0.0.1", 1337))
+        pipe.stream.add_msg(b"yy txid", ("127.0.0.1", 1338))
+        self.assertEqual(await pipe.recv(sub, 1), b"xx txid")
+        self.assertEqual(await pipe.recv(sub, 0.1), None)
+        self.assertEqual(await pipe.recv(SUB_ALL, 1), b"xx txid")
+        self.assertEqual(await pipe.recv(SUB_ALL, 1), b"yy txid")
+
+        pipe.unsubscribe(sub)
+        self.assertEqual(len(pipe.stream.sub_index), 1)
+
+    async def test_qsize_drop_policy(self):
+        tup = ("127.0.0.1", 1337)
+        for policy, expected in [[QSIZE_DROP_OLDEST, b"1"], [QSIZE_DROP_NEWEST, b"0"]]:
+            conf = dict_child({"max_qsize": 2, "qsize_policy": policy}, NET_CONF)
+            pipe = PipeEvents(sock=None, conf=conf)
+            pipe.connection_made(None)
+            pipe.subscribe(SUB_ALL)
+            for n in range(0, 3):
+                pipe.stream.add_msg(to_b(str(n)), tup)
+
+            self.assertEqual(pipe.stream.drop_count(SUB_ALL), 1)
+            self.assertEqual(await pipe.recv(SUB_ALL, 1), expected)
+
+    async def test_qsize_backpressure(self):
+        loop = asyncio.get_event_loop()
+        conf = dict_child({
+            "max_qsize": 2,
+            "qsize_policy": QSIZE_BACKPRESSURE
+        }, NET_CONF)
+
+        # UDP pipe on loopback.
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(("127.0.0.1", 0))
+        pipe = PipeEvents(sock=s, loop=loop, conf=conf)
+        transport, _ = await create_datagram_endpoint(
+            loop,
+            lambda: pipe,
+            sock=s
+        )
+
+        # Send more messages than the queue holds.
+        pipe.subscribe(SUB_ALL)
+        c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        msgs = [to_b(str(n)) for n in range(0, 5)]
+        for msg in msgs:
+            c.sendto(msg, s.getsockname())
+
+        # Reading stops when the queue fills.
+        await asyncio.sleep(0.5)
+        self.assertTrue(pipe.stream.paused)
+        self.assertEqual(pipe.stream.subs[pipe.stream.hash_sub(SUB_ALL)][1].qsize(), 2)
+
+        # Nothing is lost once the consumer drains the queue.
+        out = []
+        for _ in msgs:
+            out.append(await pipe.recv(SUB_ALL, 2))
+
+        self.assertEqual(out, msgs)
+        self.assertEqual(pipe.stream.drop_count(SUB_ALL), 0)
+        self.assertFalse(pipe.stream.paused)
+        await pipe.close()
+        c.close()
+
+if __name__ == '__main__':
+    main()
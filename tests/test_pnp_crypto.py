@@ -0,0 +1,70 @@
+from p2pd import *
+try:
+    from .pnp_helpers import *
+except:
+    from pnp_helpers import *
+import tempfile
+
+class TestPNPCrypto(unittest.IsolatedAsyncioTestCase):
+    async def test_pnp_crypto_workers(self):
+        tmp = tempfile.TemporaryDirectory()
+        serv_sk, serv_pk = gen_keys()
+        serv = PNPServer(
+            None,
+            None,
+            None,
+            serv_sk.to_string(),
+            serv_pk,
+            FakeClock(),
+            storage=SQLiteStorage(os.path.join(tmp.name, "pnp.sqlite3")),
+            crypto_workers=2
+        )
+        await serv.start()
+        self.assertTrue(serv.crypto.executor is not None)
+
+        # Requests are the same as with inline crypto.
+        sk, vkc = gen_keys()
+        async def request(value=b"", sign=True):
+            reply_sk, reply_pk = gen_keys()
+            pkt = PNPPacket(b"meow", value, vkc, None, time.time_ns() // 1000)
+            pkt.reply_pk = reply_pk
+            pnp_msg = pkt.get_msg_to_sign()
+            sig = sk.sign(pnp_msg) if sign else b""
+            pipe = FakePipe()
+            await serv.msg_cb(encrypt(serv_pk, pnp_msg + sig), ("127.0.0.1", 1337), pipe)
+            return PNPPacket.unpack(decrypt(reply_sk, pipe.sent[0]))
+
+        pkt = await request(b"value")
+        self.assertEqual(pkt.value, b"value")
+        pkt = await request(sign=False)
+        self.assertEqual(pkt.value, b"value")
+        self.assertEqual(pkt.reply_pk, serv_pk)
+
+        await serv.close()
+        self.assertEqual(serv.crypto, None)
+        tmp.cleanup()
+
+    async def test_pnp_verify(self):
+        sk, vkc = gen_keys()
+        sig = sk.sign(b"msg")
+        self.assertTrue(pnp_verify(vkc, sig, b"msg"))
+        self.assertFalse(pnp_verify(vkc, sig, b"other"))
+        self.assertFalse(pnp_verify(b"bad key", sig, b"msg"))
+
+        # Parsed keys are reused.
+        self.assertTrue(load_vk(vkc) is load_vk(vkc))
+
+    async def test_pnp_crypto_inline(self):
+        sk, pk = gen_keys()
+        crypto = PNPCrypto(sk.to_string())
+        self.assertEqual(crypto.executor, None)
+
+        pkt = PNPPacket(b"name", b"value", pk, None, 1)
+        buf = await crypto.encrypt(pk, pkt.get_msg_to_sign())
+        out, msg = await crypto.open_req(buf)
+        self.assertEqual(out.value, b"value")
+        self.assertEqual(msg, pkt.get_msg_to_sign())
+        crypto.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+from p2pd import *
+
+class FakeCursor():
+    async def close(self):
+        pass
+
+class FakeCon():
+    def __init__(self, pool_test):
+        self.pool_test = pool_test
+        self.closed = False
+        self.rollbacks = 0
+
+    async def cursor(self):
+        return FakeCursor()
+
+    async def ping(self, reconnect=False):
+        if self.pool_test.ping_fails:
+            raise Exception("gone away")
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+class TestPNPPool(unittest.IsolatedAsyncioTestCase):
+    async def connect(self):
+        self.opened += 1
+        return FakeCon(self)
+
+    async def test_pnp_pool(self):
+        self.opened = 0
+        self.ping_fails = False
+        pool = await DBPool(self.connect, size=2).start()
+        self.assertEqual(self.opened, 1)
+
+        # Connections are reused.
+        for _ in range(0, 5):
+            async with DBCheckout(pool) as pool_con:
+                self.assertEqual(pool.stats()["in_use"], 1)
+
+        self.assertEqual(self.opened, 1)
+        self.assertEqual(pool_con.con.rollbacks, 5)
+
+        # Checkouts wait when the pool is used up.
+        a = await pool.acquire()
+        b = await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiter.done())
+        await pool.release(a)
+        c = await waiter
+        self.assertTrue(c is a)
+        self.assertTrue(pool.stats()["wait_max"] >= 0.05)
+        await pool.release(b)
+        await pool.release(c)
+
+        # Stale connections that fail a ping are replaced.
+        self.ping_fails = True
+        for pool_con in pool.idle:
+            pool_con.last_used = 0
+
+        async with DBCheckout(pool) as pool_con:
+            pass
+
+        self.assertEqual(self.opened, 3)
+        self.assertEqual(pool.stats()["failures"], 2)
+        self.assertEqual(pool.stats()["open"], 1)
+        await pool.close()
+        self.assertTrue(pool_con.con.closed)
+
+    async def test_db_lock_consts(self):
+        # The PNP modules use the lock values from utils.
+        from p2pd.protocol.pnp import pnp_utils
+        from p2pd.utility import utils
+        self.assertEqual(pnp_utils.DB_READ_LOCK, utils.DB_READ_LOCK)
+        self.assertEqual(pnp_utils.DB_WRITE_LOCK, utils.DB_WRITE_LOCK)
+
+if __name__ == '__main__':
+    main()
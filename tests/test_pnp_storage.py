@@ -0,0 +1,172 @@
+from p2pd import *
+try:
+    from .pnp_helpers import *
+except:
+    from pnp_helpers import *
+import tempfile
+
+class TestPNPStorage(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "pnp.sqlite3")
+        self.serv_sk, self.serv_pk = gen_keys()
+        self.storage = SQLiteStorage(self.db_path, commit_delay=0.05)
+        self.serv = PNPServer(
+            None,
+            None,
+            None,
+            self.serv_sk.to_string(),
+            self.serv_pk,
+            FakeClock(),
+            storage=self.storage
+        )
+        await self.serv.start()
+
+    async def asyncTearDown(self):
+        await self.serv.close()
+        self.tmp.cleanup()
+
+    async def request(self, sk, vkc, name, value=b"", sign=True, client_tup=("127.0.0.1", 1337)):
+        # Built the same way as PNPClient.
+        reply_sk, reply_pk = gen_keys()
+        pkt = PNPPacket(name, value, vkc, None, time.time_ns() // 1000)
+        pkt.reply_pk = reply_pk
+        pnp_msg = pkt.get_msg_to_sign()
+        sig = sk.sign(pnp_msg) if sign else b""
+        af = IP6 if ":" in client_tup[0] else IP4
+        pipe = FakePipe(af)
+        await self.serv.msg_cb(
+            encrypt(self.serv_pk, pnp_msg + sig),
+            client_tup,
+            pipe
+        )
+
+        # Invalid requests get no reply.
+        if not len(pipe.sent):
+            return None
+
+        buf = decrypt(reply_sk, pipe.sent[0])
+        return PNPPacket.unpack(buf)
+
+    async def test_pnp_sqlite(self):
+        sk, vkc = gen_keys()
+        pkt = await self.request(sk, vkc, b"meow", b"value")
+        self.assertEqual(pkt.value, b"value")
+
+        # Fetch doesn't need a sig.
+        pkt = await self.request(sk, vkc, b"meow", sign=False)
+        self.assertEqual(pkt.value, b"value")
+
+        # Only the owner can change a name.
+        other_sk, other_vkc = gen_keys()
+        pkt = await self.request(other_sk, other_vkc, b"meow", b"stolen")
+        self.assertEqual(pkt, None)
+        pkt = await self.request(sk, vkc, b"meow", sign=False)
+        self.assertEqual(pkt.value, b"value")
+
+        # Commits are batched then written.
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.storage.commit_pending, 0)
+        con = sqlite3.connect(self.db_path)
+        rows = con.execute("SELECT name, value FROM names").fetchall()
+        self.assertEqual(rows, [(b"meow", b"value")])
+        con.close()
+
+        # Delete.
+        await self.request(sk, vkc, b"meow", b"")
+        pkt = await self.request(sk, vkc, b"meow", sign=False)
+        self.assertEqual(pkt.value, b"")
+
+    async def test_pnp_sqlite_v6(self):
+        # Iface ID with the high bit set doesn't fit a signed INTEGER.
+        sk, vkc = gen_keys()
+        client_tup = ("2001:db8:1:2:ffff:ffff:ffff:ffff", 1337)
+        pkt = await self.request(sk, vkc, b"v6", b"value", client_tup=client_tup)
+        self.assertEqual(pkt.value, b"value")
+
+        # Same address matches the existing row.
+        pkt = await self.request(sk, vkc, b"v6b", b"value2", client_tup=client_tup)
+        self.assertEqual(pkt.value, b"value2")
+        async with self.storage.checkout() as db:
+            await db.cur.execute("SELECT v6_iface_id FROM ipv6s")
+            rows = await db.cur.fetchall()
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][0], sqlite_int(2 ** 64 - 1))
+
+    async def test_pnp_name_cache(self):
+        sk, vkc = gen_keys()
+        cache = self.storage.name_cache
+        await self.request(sk, vkc, b"meow", b"v1")
+
+        # Repeat fetches are served from the cache.
+        for _ in range(0, 3):
+            pkt = await self.request(sk, vkc, b"meow", sign=False)
+            self.assertEqual(pkt.value, b"v1")
+
+        self.assertEqual(cache.hits, 2)
+
+        # Writes invalidate the cached row.
+        await self.request(sk, vkc, b"meow", b"v2")
+        self.assertFalse(b"meow" in cache.rows)
+        pkt = await self.request(sk, vkc, b"meow", sign=False)
+        self.assertEqual(pkt.value, b"v2")
+
+        # Deletes too.
+        await self.request(sk, vkc, b"meow", b"")
+        pkt = await self.request(sk, vkc, b"meow", sign=False)
+        self.assertEqual(pkt.value, b"")
+
+    async def test_name_cache(self):
+        cache = NameCache(size=2, ttl=60)
+        row = (1, b"a", b"val", b"", 2, 1, time.time())
+        cache.put(b"a", row, cache.gen)
+        self.assertEqual(cache.get(b"a"), row)
+
+        # Reads that overlap an invalidation aren't cached.
+        gen = cache.gen
+        cache.invalidate(b"b")
+        cache.put(b"b", None, gen)
+        self.assertTrue(cache.get(b"b") is NAME_CACHE_MISS)
+
+        # LRU eviction.
+        cache.put(b"b", None, cache.gen)
+        cache.put(b"c", None, cache.gen)
+        self.assertTrue(cache.get(b"a") is NAME_CACHE_MISS)
+        self.assertEqual(len(cache), 2)
+
+        # Expired names are misses.
+        cache.put(b"a", row, cache.gen)
+        self.assertTrue(cache.get(b"a", max_age=0) is NAME_CACHE_MISS)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    async def test_pnp_sqlite_rollback(self):
+        storage = self.storage
+        async with storage.checkout() as db:
+            await db.cur.execute(
+                "INSERT INTO ipv4s (v4_val, timestamp) VALUES (%s, %s)",
+                (1, 1)
+            )
+
+        # Not committed so it's rolled back.
+        async with storage.checkout() as db:
+            await db.cur.execute("SELECT * FROM ipv4s FOR UPDATE")
+            self.assertEqual(await db.cur.fetchone(), None)
+
+    async def test_sqlite_int(self):
+        for x in [0, 1, SQLITE_INT_MAX, SQLITE_INT_MAX + 1, 2 ** 64 - 1]:
+            self.assertTrue(sqlite_int(x) <= SQLITE_INT_MAX)
+            self.assertEqual(sqlite_int(x) % (2 ** 64), x)
+
+        self.assertEqual(sqlite_params((b"a", 2 ** 63)), (b"a", -2 ** 63))
+
+    async def test_pnp_storage_abc(self):
+        with self.assertRaises(TypeError):
+            PNPStorage()
+
+    async def test_sqlite_sql(self):
+        sql = "SELECT * FROM names WHERE name=%s FOR UPDATE"
+        self.assertEqual(sqlite_sql(sql), "SELECT * FROM names WHERE name=?")
+
+if __name__ == '__main__':
+    main()
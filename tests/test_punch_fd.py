@@ -0,0 +1,78 @@
+from p2pd import *
+from p2pd.traversal.tcp_punch.tcp_punch_utils import *
+from concurrent.futures import ProcessPoolExecutor
+
+# Runs in another process like the punching code.
+def proc_connect_and_send(dest, path, token):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(dest)
+    send_punched_sock(path, token, sock)
+    sock.close()
+    return 1
+
+class TestPunchFd(unittest.IsolatedAsyncioTestCase):
+    async def test_punch_fd_passing(self):
+        if not PUNCH_FD_PASSING:
+            return
+
+        # Stands in for the remote peer.
+        listen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen.bind(("127.0.0.1", 0))
+        listen.listen(1)
+        dest = listen.getsockname()
+
+        server, path, token = punch_fd_server()
+        try:
+            loop = asyncio.get_event_loop()
+            recv_task = create_task(recv_punched_sock(server, token))
+            with ProcessPoolExecutor(max_workers=1) as pp_executor:
+                ret = await loop.run_in_executor(
+                    pp_executor,
+                    proc_connect_and_send,
+                    dest,
+                    path,
+                    token
+                )
+                self.assertEqual(ret, 1)
+
+            # The socket still works after the process exits.
+            sock = await asyncio.wait_for(recv_task, 4)
+            remote, _ = listen.accept()
+            self.assertEqual(sock.getpeername(), dest)
+            await loop.sock_sendall(sock, b"meow")
+            self.assertEqual(remote.recv(4), b"meow")
+            sock.close()
+            remote.close()
+        finally:
+            punch_fd_server_close(server, path)
+            listen.close()
+
+        self.assertFalse(os.path.exists(path))
+
+    async def test_punch_fd_bad_token(self):
+        if not PUNCH_FD_PASSING:
+            return
+
+        server, path, token = punch_fd_server()
+        try:
+            recv_task = create_task(recv_punched_sock(server, token))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            await asyncio.get_event_loop().run_in_executor(
+                None,
+                send_punched_sock,
+                path,
+                b"x" * len(token),
+                sock
+            )
+
+            # Still waiting for a valid sock.
+            await asyncio.sleep(0.1)
+            self.assertFalse(recv_task.done())
+            recv_task.cancel()
+            await asyncio.gather(recv_task, return_exceptions=True)
+            sock.close()
+        finally:
+            punch_fd_server_close(server, path)
+
+if __name__ == '__main__':
+    main()
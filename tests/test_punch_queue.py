@@ -0,0 +1,70 @@
+from p2pd import *
+from p2pd.traversal.tcp_punch.tcp_punch_utils import PUNCH_DEADLINE
+
+class FakePuncher():
+    def __init__(self, node):
+        self.node = node
+
+    async def setup_punching_process(self):
+        self.node.running += 1
+        self.node.most = max(self.node.most, self.node.running)
+        await asyncio.sleep(0.05)
+        self.node.running -= 1
+        self.node.done += 1
+
+class FakeNode(P2PNodeExtra):
+    def __init__(self, max_punchers):
+        self.punch_queue = asyncio.Queue()
+        self.punch_worker_task = None
+        self.tcp_punch_clients = {}
+        self.max_punchers = max_punchers
+        self.tasks = []
+        self.running = self.most = self.done = 0
+
+class TestPunchQueue(unittest.IsolatedAsyncioTestCase):
+    async def test_punch_queue_worker(self):
+        node = FakeNode(max_punchers=2)
+        node.start_punch_worker()
+        worker = node.punch_worker_task
+        for n in range(0, 5):
+            pipe_id = to_b(str(n))
+            node.tcp_punch_clients[pipe_id] = FakePuncher(node)
+            node.add_punch_meeting([pipe_id])
+
+        # Unknown pipe IDs and empty params are skipped.
+        node.add_punch_meeting([b"unknown"])
+        node.add_punch_meeting([])
+        await asyncio.sleep(0.4)
+
+        # The same worker runs them all with a concurrency limit.
+        self.assertEqual(node.done, 5)
+        self.assertEqual(node.most, 2)
+        self.assertTrue(node.punch_worker_task is worker)
+        self.assertFalse(worker.done())
+
+        # None ends the worker.
+        node.punch_queue.put_nowait(None)
+        await asyncio.wait_for(worker, 1)
+
+    async def test_punch_deadline(self):
+        clock = SysClock(None, clock_skew=Dec(0))
+        puncher = TCPPuncher(
+            IP4,
+            {"nat": None},
+            {"ip": "8.8.8.8", "nat": None},
+            None,
+            clock,
+            None
+        )
+
+        # Time until the meeting + time to punch.
+        puncher.start_time = clock.time() + Dec(2)
+        deadline = puncher.get_punch_deadline()
+        self.assertTrue(PUNCH_DEADLINE + 1.5 < deadline <= PUNCH_DEADLINE + 2)
+
+        # Meeting already passed.
+        puncher.start_time = clock.time() - Dec(5)
+        self.assertEqual(puncher.get_punch_deadline(), PUNCH_DEADLINE)
+
+if __name__ == '__main__':
+    main()
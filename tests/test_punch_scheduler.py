@@ -0,0 +1,79 @@
+from p2pd import *
+from p2pd.traversal.tcp_punch.tcp_punch_utils import *
+
+class FakeMapping():
+    def __init__(self, local):
+        self.local = local
+        self.sock = None
+
+async def loopback_target(dest_port):
+    route = await Bind(None, IP4, 0, ips="127.0.0.1")
+    dest = Address("127.0.0.1", dest_port)
+    await dest.res()
+    dest = dest.select_ip(IP4)
+    return [FakeMapping(0), route, dest]
+
+class TestPunchScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_punch_scheduler_connect(self):
+        # Stands in for the remote peer.
+        listen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen.bind(("127.0.0.1", 0))
+        listen.listen(5)
+        dest_port = listen.getsockname()[1]
+
+        loop = asyncio.get_event_loop()
+        target = await loopback_target(dest_port)
+        offsets = [n * 0.005 for n in range(0, 100)]
+        scheduler = PunchScheduler([target], offsets, loop, prealloc=4)
+        start_at = loop.time() + 0.05
+        outs = await scheduler.run(start_at, tail=1)
+
+        # First connect wins and the rest are cancelled.
+        self.assertEqual(outs, [target[0]])
+        sock = target[0].sock
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", dest_port))
+        self.assertTrue(len(scheduler.sends) < len(offsets))
+        self.assertEqual(scheduler.pending, {})
+        self.assertEqual(scheduler.pools, [[]])
+        self.assertTrue(scheduler.handle is None)
+
+        # Sends don't happen early.
+        intended, actual = scheduler.sends[0]
+        self.assertEqual(intended, start_at)
+        self.assertTrue(actual >= intended)
+        report = scheduler.timing_report()
+        self.assertEqual(report["sent"], len(scheduler.sends))
+        self.assertEqual(report["intended"], len(offsets))
+        self.assertTrue(0 <= report["mean_ms"] <= report["max_ms"])
+
+        sock.close()
+        listen.close()
+
+    async def test_punch_scheduler_timing(self):
+        # Nothing listening so every attempt fails.
+        listen = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen.bind(("127.0.0.1", 0))
+        dest_port = listen.getsockname()[1]
+        listen.close()
+
+        loop = asyncio.get_event_loop()
+        target = await loopback_target(dest_port)
+        offsets = [n * 0.01 for n in range(0, 10)]
+        scheduler = PunchScheduler([target], offsets, loop, prealloc=2)
+        start_at = loop.time()
+        outs = await scheduler.run(start_at, tail=0.1)
+        self.assertEqual(outs, [])
+        self.assertTrue(target[0].sock is None)
+
+        # Every send happened at its own offset.
+        self.assertEqual(len(scheduler.sends), len(offsets))
+        for n, send in enumerate(scheduler.sends):
+            intended, actual = send
+            self.assertEqual(intended, start_at + offsets[n])
+            self.assertTrue(actual >= intended)
+
+        self.assertEqual(scheduler.pending, {})
+        self.assertEqual(scheduler.pools, [[]])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+from p2pd import *
+
+class FakeRESTPipe():
+    def __init__(self):
+        self.sent = []
+        self.end_cbs = []
+        self.is_running = True
+
+    async def send(self, data, client_tup=None):
+        self.sent.append(data)
+        return 1
+
+    async def close(self):
+        self.is_running = False
+        for end_cb in self.end_cbs:
+            end_cb(None, None, self)
+
+    def add_end_cb(self, end_cb):
+        self.end_cbs.append(end_cb)
+
+class TestRESTServer(RESTD):
+    @RESTD.GET(["proxies"])
+    async def get_proxy(self, v, pipe):
+        return {"api": "proxy", "name": v["name"], "pos": v["pos"]}
+
+    @RESTD.GET(["proxies"], ["toxics"])
+    async def get_toxic(self, v, pipe):
+        return {"api": "toxic", "name": v["name"]}
+
+    @RESTD.GET(["version"])
+    async def get_version(self, v, pipe):
+        return "1.0"
+
+    @RESTD.POST(["proxies"])
+    async def post_proxy(self, v, pipe):
+        return v["body"]
+
+def http_get(path, hdrs=b""):
+    return b"GET %s HTTP/1.1\r\nHost: x\r\n%s\r\n" % (path, hdrs)
+
+def resp_bodies(pipe):
+    out = []
+    for buf in pipe.sent:
+        parser = HTTPResponseParser()
+        parser.feed(buf)
+        out.append(parser.out())
+
+    return out
+
+class TestRESTD(unittest.IsolatedAsyncioTestCase):
+    async def test_req_parser(self):
+        parser = HTTPRequestParser()
+        post = b"POST /a HTTP/1.1\r\nContent-Length: 4\r\nContent-Type: text/plain\r\n\r\nmeow"
+        bufs = http_get(b"/b") + post + http_get(b"/c", b"Connection: close\r\n")
+
+        # Split at every point.
+        for n in range(0, len(bufs)):
+            parser = HTTPRequestParser()
+            reqs = parser.feed(bufs[:n]) + parser.feed(bufs[n:])
+            self.assertEqual([r.path for r in reqs], ["/b", "/a", "/c"])
+            self.assertEqual(reqs[1].command, "POST")
+            self.assertEqual(reqs[1].body, b"meow")
+            self.assertEqual(reqs[1].hdrs["Content-Type"], "text/plain")
+            self.assertEqual([r.keep_alive for r in reqs], [True, True, False])
+            self.assertEqual(len(parser.buf), 0)
+
+        # HTTP/1.0 closes by default.
+        req = parser.feed(b"GET / HTTP/1.0\r\n\r\n")[0]
+        self.assertFalse(req.keep_alive)
+        self.assertEqual(req.hdrs["Origin"], "null")
+
+        with self.assertRaises(Exception):
+            HTTPRequestParser().feed(b"meow\r\n\r\n")
+
+        with self.assertRaises(Exception):
+            HTTPRequestParser(max_hdrs=10).feed(b"GET / HTTP/1.1\r\nHost: x")
+
+    async def test_route_trie(self):
+        server = TestRESTServer()
+        api = server.match_api("GET", "/proxies/p1")
+        self.assertEqual(api.__name__, "REST__get_proxy")
+        api = server.match_api("GET", "/proxies/p1/toxics/t1")
+        self.assertEqual(api.__name__, "REST__get_toxic")
+        api = server.match_api("GET", "/p2p/version")
+        self.assertEqual(api.__name__, "REST__get_version")
+        self.assertTrue(server.match_api("GET", "/meow") is None)
+
+        # Only one POST so it matches any path.
+        api = server.match_api("POST", "/meow")
+        self.assertEqual(api.__name__, "REST__post_proxy")
+        self.assertTrue(server.match_api("PUT", "/proxies") is None)
+
+    async def test_msg_cb(self):
+        server = TestRESTServer()
+        pipe = FakeRESTPipe()
+        client_tup = ("127.0.0.1", 1337)
+
+        # Pipelined and split requests.
+        bufs = http_get(b"/proxies/p1/meow") + http_get(b"/proxies/p1/toxics/t1")
+        bufs += http_get(b"/version", b"Connection: close\r\n")
+        await server.msg_cb(bufs[:10], client_tup, pipe)
+        self.assertEqual(pipe.sent, [])
+        await server.msg_cb(bufs[10:], client_tup, pipe)
+        bodies = resp_bodies(pipe)
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(
+            json.loads(bodies[0]),
+            {"api": "proxy", "name": {"proxies": "p1"}, "pos": {"0": "meow"}}
+        )
+        self.assertEqual(
+            json.loads(bodies[1]),
+            {"api": "toxic", "name": {"proxies": "p1", "toxics": "t1"}}
+        )
+        self.assertEqual(bodies[2], b"1.0")
+
+        # Con stays open until asked to close.
+        self.assertTrue(b"Connection: keep-alive" in pipe.sent[0])
+        self.assertTrue(b"Connection: close" in pipe.sent[2])
+        self.assertFalse(pipe.is_running)
+        self.assertEqual(server.req_parsers, {})
+
+        # JSON bodies are decoded.
+        pipe = FakeRESTPipe()
+        body = b'{"name": "x"}'
+        buf = b"POST /proxies HTTP/1.1\r\nContent-Type: application/json\r\n"
+        buf += b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+        await server.msg_cb(buf, client_tup, pipe)
+        self.assertEqual(json.loads(resp_bodies(pipe)[0]), {"name": "x"})
+        self.assertTrue(pipe.is_running)
+
+        # Bodies over the limit get a 413 and the con is closed.
+        pipe = FakeRESTPipe()
+        buf = http_get(b"/version")
+        buf += b"POST /proxies HTTP/1.1\r\n"
+        buf += b"Content-Length: %d\r\n\r\nmeow" % (HTTP_MAX_BODY + 1)
+        await server.msg_cb(buf, client_tup, pipe)
+        self.assertEqual(resp_bodies(pipe)[0], b"1.0")
+        self.assertTrue(pipe.sent[1].startswith(b"HTTP/1.1 413 "))
+        self.assertEqual(len(pipe.sent), 2)
+        self.assertFalse(pipe.is_running)
+        self.assertFalse(pipe in server.req_parsers)
+
+    async def test_req_parser_max_body(self):
+        parser = HTTPRequestParser(max_body=4)
+        post = b"POST /a HTTP/1.1\r\nContent-Length: %d\r\n\r\n"
+        reqs = parser.feed((post % 4) + b"meow" + (post % 5) + b"meow!")
+        self.assertEqual([req.body for req in reqs], [b"meow"])
+        self.assertTrue(parser.too_large)
+        self.assertEqual(len(parser.buf), 0)
+        self.assertEqual(parser.feed(http_get(b"/b")), [])
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,18 @@
 from p2pd import *
+from p2pd.protocol.ack_udp import ACKUDP, UDP_MAX_DICT_LEN
+try:
+    from .loopback_pipes import *
+except:
+    from loopback_pipes import *
 
+async def loopback_rudp_pipe(conf=NET_CONF):
+    pipe = await loopback_udp_pipe(conf)
+    pipe.set_ack_handlers(
+        is_ack=pipe.stream.is_ack,
+        is_ackable=pipe.stream.is_ackable
+    )
+    pipe.subscribe(SUB_ALL)
+    return pipe
 
 class TestRUDP(unittest.IsolatedAsyncioTestCase):
     async def test_rudp(self):
@@ -26,6 +39,95 @@ class TestRUDP(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(out, msg)
         await pipe.close()
 
+    async def test_ack_retransmit(self):
+        pipes = [await loopback_rudp_pipe() for _ in range(0, 2)]
+
+        # ACKed sends resolve and sample the RTT.
+        a, b = pipes
+        b_tup = b.sock.getsockname()
+        done, event = await a.stream.ack_send(b"meow", b_tup)
+        self.assertEqual(await asyncio.wait_for(done, 2), 1)
+        self.assertTrue(event.is_set())
+        self.assertEqual(await b.recv(SUB_ALL, 2), b"meow")
+        self.assertTrue(a.stream.rtts[b_tup].srtt is not None)
+        self.assertEqual(len(a.stream.ack_pending), 0)
+        self.assertEqual(len(a.stream.ack_timers), 0)
+
+        # Unanswered sends are retransmitted then given up on.
+        c = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        c.bind(("127.0.0.1", 0))
+        c_tup = c.getsockname()
+        a.stream.rtts[c_tup] = RTTEstimator()
+        a.stream.rtts[c_tup].rto = 0.05
+        done, event = await a.stream.ack_send(b"meow", c_tup, tries=3)
+        self.assertEqual(await asyncio.wait_for(done, 2), 0)
+        self.assertFalse(event.is_set())
+        self.assertEqual(len(a.stream.seq), 0)
+        c.setblocking(False)
+        transmits = 0
+        while 1:
+            try:
+                c.recv(100)
+                transmits += 1
+            except BlockingIOError:
+                break
+
+        self.assertEqual(transmits, 3)
+        for pipe in pipes:
+            await pipe.close()
+
+        c.close()
+
+    async def test_sack(self):
+        seqs = [5, 6, 7, 100, 2 ** 63, 8]
+        buf = sack_encode(seqs)
+        self.assertEqual(len(buf), 9 + (3 * 12))
+        ranges = sack_decode(buf)
+        self.assertEqual(ranges, [(5, 4), (100, 1), (2 ** 63, 1)])
+
+        # Both sides need SACKs enabled.
+        conf = dict_child({"sack_delay": 0.05}, NET_CONF)
+        a = await loopback_rudp_pipe(conf)
+        b = await loopback_rudp_pipe(conf)
+
+        # Count ACK frames sent by the receiver.
+        frames = []
+        b_send = b.stream.send
+        async def send(buf, dest_tup):
+            frames.append(buf)
+            return await b_send(buf, dest_tup)
+        b.stream.send = send
+
+        futures = []
+        b_tup = b.sock.getsockname()
+        for n in range(0, 10):
+            done, _ = await a.stream.ack_send(to_b(str(n)), b_tup)
+            futures.append(done)
+
+        out = await asyncio.wait_for(asyncio.gather(*futures), 2)
+        self.assertEqual(out, [1] * 10)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0][8], ACK_FLAG_SACK)
+        for n in range(0, 10):
+            self.assertEqual(await b.recv(SUB_ALL, 2), to_b(str(n)))
+
+        await a.close()
+        await b.close()
+
+    async def test_rtt_eviction(self):
+        stream = ACKUDP()
+        tups = [("127.0.0.1", n) for n in range(0, UDP_MAX_DICT_LEN + 1)]
+        first = stream.get_rtt(tups[0])
+        for tup in tups[1:-1]:
+            stream.get_rtt(tup)
+
+        # Recently used estimates are kept.
+        self.assertTrue(stream.get_rtt(tups[0]) is first)
+        stream.get_rtt(tups[-1])
+        self.assertEqual(len(stream.rtts), UDP_MAX_DICT_LEN)
+        self.assertTrue(tups[0] in stream.rtts)
+        self.assertFalse(tups[1] in stream.rtts)
+
     async def test_is_unique(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         b = PipeEvents(sock=s)
@@ -0,0 +1,143 @@
+from p2pd import *
+try:
+    from .loopback_pipes import *
+except:
+    from loopback_pipes import *
+
+async def stream_pair(conf=NET_CONF):
+    a, b = [await loopback_udp_pipe(conf) for _ in range(0, 2)]
+    a_stream = await rudp_open(b.sock.getsockname(), pipe=a, conf=conf)
+    b_stream = await rudp_open(a.sock.getsockname(), pipe=b, conf=conf)
+    return a_stream, b_stream
+
+# Drop every nth frame a stream sends.
+def lossy(stream, n):
+    send_frame = stream.send_frame
+    count = [0]
+    def wrapper(buf):
+        count[0] += 1
+        if count[0] % n:
+            send_frame(buf)
+
+    stream.send_frame = wrapper
+
+class TestRUDPStream(unittest.IsolatedAsyncioTestCase):
+    async def transfer(self, a, b, size):
+        data = os.urandom(size)
+        task = asyncio.ensure_future(a.send(data))
+        out = await b.recv_all(len(data), 4)
+        self.assertEqual(await task, len(data))
+        self.assertEqual(out, data)
+
+    async def close_pair(self, a, b):
+        await asyncio.gather(a.close(), b.close())
+        self.assertEqual(await b.recv(timeout=2), b"")
+        for stream in [a, b]:
+            await stream.pipe.close()
+
+    async def test_rudp_stream(self):
+        a, b = await stream_pair()
+
+        # Bigger than the initial window in both directions.
+        await self.transfer(a, b, 200000)
+        await self.transfer(b, a, 50000)
+        self.assertEqual(a.snd_una, a.snd_next)
+        self.assertEqual(len(a.inflight), 0)
+        self.assertTrue(a.cwnd > NET_CONF["rudp_init_cwnd"])
+        await self.close_pair(a, b)
+
+    async def test_rudp_stream_loss(self):
+        conf = dict_child({
+            "rudp_mss": 500
+        }, NET_CONF)
+
+        a, b = await stream_pair(conf)
+        a.rtt.rto = ACK_MIN_RTO
+        lossy(a, 7)
+        lossy(b, 5)
+        await self.transfer(a, b, 50000)
+        await self.close_pair(a, b)
+
+    async def test_rudp_stream_flow_control(self):
+        conf = dict_child({
+            "rudp_mss": 500,
+            "rudp_recv_buf": 2000
+        }, NET_CONF)
+
+        a, b = await stream_pair(conf)
+        data = os.urandom(20000)
+        task = asyncio.ensure_future(a.send(data))
+
+        # Sender stops when the receiver's buffer is full.
+        await asyncio.sleep(0.2)
+        self.assertTrue(len(b.recv_buf) <= 2000 + conf["rudp_mss"])
+        self.assertTrue(len(a.send_queue))
+        self.assertEqual(a.peer_wnd, 0)
+
+        # Reading opens the window again.
+        out = await b.recv_all(len(data), 4)
+        self.assertEqual(out, data)
+        self.assertEqual(await task, len(data))
+        await self.close_pair(a, b)
+
+    async def test_rudp_stream_sack_range(self):
+        a, b = await stream_pair()
+        a.send_frame = lambda buf: None
+        a.cwnd = 10
+        a.peer_wnd = 100000
+        await a.send(b"x" * (a.mss * 9))
+        self.assertEqual(list(a.inflight), list(range(1, 10)))
+
+        # SACK block starts before the cumulative ACK.
+        a.on_ack(6, 100000, [(5, 2)])
+        self.assertEqual(list(a.inflight), [7, 8, 9])
+        a.stop()
+        b.stop()
+        await self.close_pair_pipes(a, b)
+
+    async def test_rudp_stream_rto_cwnd(self):
+        a, b = await stream_pair()
+        frames = []
+        a.send_frame = lambda buf: frames.append(buf)
+        a.cwnd = 4
+        a.peer_wnd = 100000
+        await a.send(b"x" * (a.mss * 4))
+        self.assertEqual(len(frames), 4)
+
+        # Every segment times out.
+        for segment in a.inflight.values():
+            a.timers.cancel(segment["timer"])
+        for seq in list(a.inflight):
+            a.on_timeout(seq)
+
+        # Only one resend fits in the reset window.
+        self.assertEqual(a.cwnd, 1)
+        self.assertEqual(len(frames), 5)
+        self.assertEqual(list(a.lost), [2, 3, 4])
+
+        # ACKs open the window for the rest.
+        a.on_ack(2, 100000, [])
+        self.assertEqual(len(frames), 7)
+        self.assertEqual(list(a.lost), [4])
+        a.stop()
+        b.stop()
+        await self.close_pair_pipes(a, b)
+
+    async def test_rudp_stream_own_pipe(self):
+        a = await loopback_udp_pipe()
+        b = await loopback_udp_pipe()
+        a_stream = RUDPStream(a, b.sock.getsockname(), own_pipe=True).start()
+        b_stream = RUDPStream(b, a.sock.getsockname()).start()
+        await asyncio.gather(a_stream.close(), b_stream.close())
+
+        # Only the pipe opened for the stream is closed.
+        self.assertFalse(a.is_running)
+        self.assertTrue(b.is_running)
+        await b.close()
+
+    async def close_pair_pipes(self, a, b):
+        for stream in [a, b]:
+            await stream.pipe.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+from p2pd import *
+
+class FakeMsg():
+    def __init__(self, node_id, n):
+        self.n = n
+        self.routing = type("Routing", (), {})()
+        self.routing.dest = {"node_id": node_id, "signal": [0, 1]}
+
+class FakeNode():
+    def __init__(self, delay=0):
+        self.sig_msg_queue = asyncio.Queue()
+        self.delay = delay
+        self.publishes = []
+        self.running = 0
+        self.max_running = 0
+
+    def sig_msg_buf(self, msg, vk=None):
+        return to_b(to_h(to_b(str(msg.n))))
+
+    async def send_sig_buf(self, buf, dest_node_id, offsets, m=0, relay_no=2):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.publishes.append([dest_node_id, sig_msg_split(buf)])
+        self.running -= 1
+
+class TestSigDispatch(unittest.IsolatedAsyncioTestCase):
+    async def test_sig_dispatch(self):
+        node = FakeNode(delay=0.1)
+        dispatcher = SigDispatcher(node, workers=4, max_batch=16).start()
+
+        # Two peers get msgs in parallel.
+        for n in range(0, 6):
+            for node_id in ["a", "b"]:
+                node.sig_msg_queue.put_nowait([FakeMsg(node_id, n), None, 0])
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(node.max_running, 2)
+
+        # Queued while the peers publish is running.
+        for n in range(6, 9):
+            for node_id in ["a", "b"]:
+                node.sig_msg_queue.put_nowait([FakeMsg(node_id, n), None, 0])
+
+        await asyncio.sleep(0.3)
+
+        # Msgs are batched per peer and kept in order.
+        for node_id in ["a", "b"]:
+            bufs = []
+            publishes = [p for p in node.publishes if p[0] == node_id]
+            for _, parts in publishes:
+                bufs += [h_to_b(part) for part in parts]
+
+            self.assertEqual(len(publishes), 2)
+            self.assertEqual(bufs, [to_b(str(n)) for n in range(0, 9)])
+
+        stats = dispatcher.stats()
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["msgs"], 18)
+        self.assertEqual(stats["publishes"], 4)
+        self.assertTrue(stats["latency_max"] >= 0.1)
+        await dispatcher.close()
+
+    async def test_sig_dispatch_no_batch(self):
+        node = FakeNode(delay=0.05)
+        dispatcher = SigDispatcher(node, workers=4).start()
+        for n in range(0, 4):
+            node.sig_msg_queue.put_nowait([FakeMsg("a", n), None, 0])
+
+        await asyncio.sleep(0.4)
+
+        # One message per publish by default, still in order.
+        parts = [p[1] for p in node.publishes]
+        self.assertEqual(parts, [
+            [to_b(to_h(to_b(str(n))))] for n in range(0, 4)
+        ])
+        await dispatcher.close()
+
+    async def test_sig_msg_split(self):
+        self.assertEqual(sig_msg_split(b"00ab"), [b"00ab"])
+        self.assertEqual(sig_msg_split("00ab 01cd"), [b"00ab", b"01cd"])
+
+if __name__ == '__main__':
+    main()
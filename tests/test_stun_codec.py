@@ -0,0 +1,98 @@
+from p2pd import *
+
+# Binding reply from a RFC 3489 server.
+STUN_3489_REPLY = b'\x01\x01\x000!4Q#\x95\xb2/\xb8@\xa5\xb9\x99[\xe9\xda\xbb\x00\x01\x00\x08\x00\x01\xe1&\x9f\xc4\xc1\xb7\x00\x04\x00\x08\x00\x01\r\x96Xc\xd3\xd8\x00\x05\x00\x08\x00\x01\r\x97Xc\xd3\xd3\x80 \x00\x08\x00\x01\xc0\x12\xbe\xf0\x90\x94'
+
+class TestSTUNCodec(unittest.IsolatedAsyncioTestCase):
+    async def test_stun_decode(self):
+        msg, left = stun_decode(STUN_3489_REPLY)
+        self.assertEqual(msg.msg_type, 0x0101)
+        self.assertEqual(msg.txn_id, STUN_3489_REPLY[8:20])
+        self.assertEqual(len(msg.attrs), 4)
+        self.assertEqual(len(left), 0)
+
+        # Same results as the old decoder.
+        old = STUNMsg.unpack(STUN_3489_REPLY)[0]
+        for attr_code, offset, attr_len in msg.attrs:
+            old_code, _, old_data = old.read_attr()
+            self.assertEqual(attr_code, b_to_i(old_code, "big"))
+            self.assertEqual(msg.get(attr_code), old_data)
+
+        reply, _ = stun_proto(STUN_3489_REPLY, IP4)
+        self.assertEqual(reply.rtup, ("159.196.193.183", 57638))
+        self.assertEqual(reply.ctup, ("88.99.211.211", 3479))
+        self.assertFalse(hasattr(reply, "stup"))
+
+    async def test_stun_decode_invalid(self):
+        with self.assertRaises(Exception):
+            stun_decode(STUN_3489_REPLY[:19])
+
+        # Message len past the end of the buf.
+        with self.assertRaises(Exception):
+            stun_decode(STUN_3489_REPLY[:-4])
+
+        # Attribute len past the end of the message.
+        buf = bytearray(STUN_3489_REPLY)
+        buf[22:24] = b"\x00\xff"
+        with self.assertRaises(Exception):
+            stun_decode(buf)
+
+    async def test_stun_xor_addrs(self):
+        txid = rand_b(12)
+        for ip in ["1.2.3.4", "2001:db8::1"]:
+            value = stun_addr_value(STUN_XOR_PEER_ADDR, ip, 1337, txid)
+            buf = stun_encode(
+                STUNMsgTypes.DataIndication,
+                txid,
+                [
+                    [STUNAttrs.XorPeerAddress, value],
+                    [STUNAttrs.Data, b"meow"],
+                ]
+            )
+
+            msg, _ = stun_decode(buf)
+            self.assertEqual(msg.addr(STUN_XOR_PEER_ADDR), (ip, 1337))
+            self.assertEqual(msg.get(STUN_DATA), b"meow")
+
+            # Matches the old decoder.
+            af = IP6 if ":" in ip else IP4
+            old = STUNAddrTup(
+                af=af,
+                txid=txid,
+                magic_cookie=STUN_MAGIC_COOKIE
+            )
+            old.decode(STUNAttrs.XorPeerAddress, value)
+            self.assertEqual(old.tup, (ip, 1337))
+
+    async def test_stun_pack_into(self):
+        txid = rand_b(12)
+        attrs = [[STUNAttrs.Software, b"abcde"], [STUNAttrs.Lifetime, b"\0\0\0\1"]]
+        size = stun_msg_size(attrs)
+        self.assertEqual(size, 20 + 12 + 8)
+
+        # Reused buffers get the padding cleared.
+        out = bytearray(b"\xff" * (size + 10))
+        end = stun_pack_into(out, 10, STUNMsgTypes.Binding, txid, attrs)
+        self.assertEqual(end, size + 10)
+        self.assertEqual(bytes(out[10:end]), bytes(stun_encode(STUNMsgTypes.Binding, txid, attrs)))
+
+        # Same layout as STUNMsg.
+        m = STUNMsg(mode=RFC5389)
+        m.txn_id = txid
+        for attr_code, attr_data in attrs:
+            m.write_attr(attr_code, attr_data)
+
+        self.assertEqual(bytes(out[10:end]), m.pack())
+        msg, _ = stun_decode(out[10:end])
+        self.assertEqual(msg.get(b_to_i(STUNAttrs.Software, "big")), b"abcde")
+
+        # Decoded msgs (memoryview fields) pack the same.
+        buf, _ = STUNMsg.unpack(m.pack(), mode=RFC5389)
+        self.assertEqual(buf.pack(), m.pack())
+
+        # RFC 3489 keeps its fake cookie.
+        m = STUNMsg(mode=RFC3489)
+        self.assertEqual(bytes(m.pack()[4:8]), b"1234")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+from p2pd import *
+try:
+    from .loopback_pipes import *
+except:
+    from loopback_pipes import *
+
+async def stun_udp_pipe(conf=NET_CONF):
+    pipe = await loopback_udp_pipe(conf)
+    pipe.route = type("Route", (), {"af": IP4})()
+    return pipe
+
+# Binding response with the senders mapped address.
+def stun_resp(req, client_tup):
+    addr = b"\x00\x01" + struct.pack("!H", client_tup[1])
+    addr += socket.inet_aton(client_tup[0])
+    attr = STUNAttrs.MappedAddress + struct.pack("!H", len(addr)) + addr
+    return bytes().join([
+        b"\x01\x01",
+        struct.pack("!H", len(attr)),
+        bytes(req[4:20]),
+        attr
+    ])
+
+class STUNServ():
+    def __init__(self, drop=0):
+        self.drop = drop
+        self.reqs = 0
+
+    async def start(self):
+        self.pipe = await stun_udp_pipe()
+        self.pipe.subscribe((b"", None), self.on_msg)
+        self.tup = self.pipe.sock.getsockname()
+        return self
+
+    def on_msg(self, data, client_tup, pipe):
+        self.reqs += 1
+        if self.reqs <= self.drop:
+            return
+
+        buf = stun_resp(data, client_tup)
+        pipe.tasks.append(create_task(pipe.send(buf, client_tup)))
+
+class TestSTUNMux(unittest.IsolatedAsyncioTestCase):
+    async def test_stun_mux(self):
+        servs = [await STUNServ().start() for _ in range(0, 4)]
+        pipe = await stun_udp_pipe()
+        ltup = pipe.sock.getsockname()
+
+        # Many requests to many servers on one socket.
+        tasks = []
+        for _ in range(0, 5):
+            for serv in servs:
+                tasks.append(
+                    create_task(
+                        get_stun_reply(RFC5389, serv.tup, serv.tup, pipe)
+                    )
+                )
+
+        await asyncio.sleep(0)
+        mux = pipe.stun_mux
+        replies = await asyncio.gather(*tasks)
+        for reply in replies:
+            self.assertEqual(reply.rtup, ltup)
+
+        self.assertEqual(mux.stats()["replies"], 20)
+        self.assertEqual(mux.stats()["pending"], 0)
+
+        # The callers pipe isn't left subscribed to STUN msgs.
+        self.assertEqual(pipe.stun_mux, None)
+        self.assertEqual(len(pipe.stream.subs), 0)
+
+        for p in [pipe] + [serv.pipe for serv in servs]:
+            await p.close()
+
+    async def test_stun_mux_retransmit(self):
+        serv = await STUNServ(drop=2).start()
+        pipe = await stun_udp_pipe()
+        pipe.stun_mux = STUNMux(pipe, rto=0.05)
+
+        # Lost requests are sent again.
+        reply = await get_stun_reply(RFC5389, serv.tup, serv.tup, pipe)
+        self.assertEqual(reply.rtup, pipe.sock.getsockname())
+        self.assertEqual(pipe.stun_mux.sends, 3)
+
+        # Replies from the wrong address are ignored.
+        mux = STUNMux(await stun_udp_pipe(), rto=0.05, rc=2, rm=2)
+        start = time.time()
+        buf = await mux.request(rand_b(12), b"\0" * 20, serv.tup, ("127.0.0.1", 1))
+        self.assertEqual(buf, None)
+        self.assertTrue(time.time() - start >= 0.15)
+        self.assertEqual(mux.stats()["timeouts"], 1)
+
+        await mux.close()
+        for p in [pipe, mux.pipe, serv.pipe]:
+            await p.close()
+
+    async def test_stun_mux_open(self):
+        bind = Bind(None, IP4, ips="127.0.0.1")
+        a = await stun_mux_open(bind)
+        b = await stun_mux_open(Bind(None, IP4, ips="127.0.0.1"))
+
+        # Same route + port = same socket.
+        self.assertTrue(a is b)
+        self.assertEqual(a.refs, 2)
+        stun_mux_close(a)
+        stun_mux_close(b)
+        self.assertTrue(a.linger is not None)
+
+        # Reused if needed before it's closed.
+        c = await stun_mux_open(bind)
+        self.assertTrue(c is a)
+        self.assertEqual(c.linger, None)
+        stun_mux_close(c)
+        stun_mux_expire(c)
+        await asyncio.sleep(0.1)
+        self.assertFalse(stun_mux_key(bind) in STUN_MUXES)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+from p2pd import *
+import tempfile
+
+def serv(ip, port=3478):
+    return {"mode": RFC5389, "primary": {"ip": ip, "port": port}}
+
+class TestSTUNPool(unittest.IsolatedAsyncioTestCase):
+    async def test_stun_pool_order(self):
+        pool = STUNPool()
+        fast, slow = serv("1.1.1.1"), serv("2.2.2.2")
+        for _ in range(0, 5):
+            pool.record_reply(IP4, UDP, ("1.1.1.1", 3478), 0.01)
+            pool.record_reply(IP4, UDP, ("2.2.2.2", 3478), 1)
+
+        # Fast servers are usually picked first.
+        firsts = 0
+        for _ in range(0, 100):
+            if pool.pick([slow, fast], 1, IP4)[0] is fast:
+                firsts += 1
+
+        self.assertTrue(firsts > 90)
+
+        # Stats are per AF + proto.
+        key = stun_serv_key(IP4, UDP, "1.1.1.1", 3478)
+        self.assertEqual(pool.servs[key].replies, 5)
+        self.assertFalse(stun_serv_key(IP4, TCP, "1.1.1.1", 3478) in pool.servs)
+
+    async def test_stun_pool_breaker(self):
+        pool = STUNPool(break_fails=2, break_secs=60)
+        dead, ok = serv("1.1.1.1"), serv("2.2.2.2")
+        key = stun_serv_key(IP4, UDP, "1.1.1.1", 3478)
+        pool.record_timeout(IP4, UDP, ("1.1.1.1", 3478))
+        self.assertFalse(pool.is_broken(key))
+
+        # Broken servers are last.
+        pool.record_timeout(IP4, UDP, ("1.1.1.1", 3478))
+        self.assertTrue(pool.is_broken(key))
+        for _ in range(0, 10):
+            self.assertEqual(pool.order([dead, ok], IP4), [ok, dead])
+
+        # Backs off more with more timeouts.
+        until = pool.servs[key].broken_until
+        pool.record_timeout(IP4, UDP, ("1.1.1.1", 3478))
+        self.assertTrue(pool.servs[key].broken_until - until > 50)
+
+        # A reply fixes it.
+        pool.record_reply(IP4, UDP, ("1.1.1.1", 3478), 0.1)
+        self.assertFalse(pool.is_broken(key))
+        self.assertTrue(pool.servs[key].fail_rate > 0)
+
+    async def test_stun_pool_save(self):
+        tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(tmp.name, "stun_pool.json")
+        pool = STUNPool()
+        pool.record_reply(IP6, UDP, ("2001:db8::1", 3478), 0.2)
+        pool.save(path)
+
+        # Same IP in a different form.
+        pool = STUNPool().load(path)
+        key = stun_serv_key(IP6, UDP, "2001:0db8::0001", 3478)
+        self.assertEqual(pool.servs[key].rtt, 0.2)
+        tmp.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from p2pd import *
+from p2pd.utility.timer_wheel import *
+
+class TestTimerWheel(unittest.IsolatedAsyncioTestCase):
+    async def test_timer_order(self):
+        wheel = TimerWheel()
+        fired = []
+        for delay in [0.3, 0.05, 0.2, 0.1]:
+            wheel.add(delay, fired.append, delay)
+
+        # Cancelled timers don't fire.
+        timer = wheel.add(0.15, fired.append, 0.15)
+        wheel.cancel(timer)
+        self.assertEqual(len(wheel), 4)
+
+        await asyncio.sleep(0.5)
+        self.assertEqual(fired, [0.05, 0.1, 0.2, 0.3])
+        self.assertEqual(len(wheel), 0)
+        self.assertEqual(wheel.handle, None)
+
+    async def test_cascade(self):
+        # Small ticks so timers land in higher levels.
+        loop = asyncio.get_event_loop()
+        wheel = TimerWheel(tick=0.0005)
+        fired = []
+        start = loop.time()
+        for delay in [0.01, 0.2, 0.4]:
+            wheel.add(delay, lambda d: fired.append([d, loop.time() - start]), delay)
+
+        await asyncio.sleep(0.6)
+        self.assertEqual([f[0] for f in fired], [0.01, 0.2, 0.4])
+        for delay, elapsed in fired:
+            self.assertTrue(elapsed >= delay)
+
+    async def test_rtt_estimator(self):
+        rtt = RTTEstimator()
+        self.assertEqual(rtt.rto, ACK_INIT_RTO)
+        rtt.update(0.5)
+        self.assertEqual(rtt.srtt, 0.5)
+        self.assertEqual(rtt.rto, 1.5)
+        rtt.backoff()
+        self.assertEqual(rtt.rto, 3)
+        for _ in range(0, 50):
+            rtt.update(0.001)
+
+        self.assertEqual(rtt.rto, ACK_MIN_RTO)
+
+if __name__ == '__main__':
+    main()
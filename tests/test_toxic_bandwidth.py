@@ -0,0 +1,63 @@
+from p2pd import *
+from p2pd.protocol.toxiproxy.toxiserver import TokenBucket, ToxicBandwidthLimit
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+class FakeDestPipe():
+    def __init__(self):
+        self.chunks = []
+
+    async def send(self, data, dest_tup=None):
+        self.chunks.append(data)
+        return 1
+
+class TestToxicBandwidth(unittest.IsolatedAsyncioTestCase):
+    async def test_token_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(1000, burst=500, clock=clock)
+
+        # Senders wait exactly for the tokens they need.
+        self.assertEqual(bucket.reserve(100), 0.1)
+        self.assertEqual(bucket.reserve(100), 0.2)
+
+        # Debt is paid back over time.
+        clock.now = 0.2
+        self.assertEqual(bucket.reserve(100), 0.1)
+
+        # Tokens never build past the burst size.
+        clock.now = 100
+        bucket.refill()
+        self.assertEqual(bucket.tokens, 500)
+
+        # Which can then be sent at once.
+        self.assertEqual(bucket.reserve(500), 0)
+        self.assertEqual(bucket.reserve(1), 0.001)
+
+    async def test_bandwidth_toxic(self):
+        # 100 KB/s with 10 KB bursts.
+        toxic = ToxicBandwidthLimit().set_params(rate=100, burst=10)
+        pipe = FakeDestPipe()
+        buf = b"x" * (1024 * 30)
+
+        start = time.monotonic()
+        ret = await toxic.run(buf, pipe)
+        duration = time.monotonic() - start
+
+        # 30 KB at 100 KB/s.
+        self.assertTrue(0.28 <= duration < 0.5)
+        self.assertEqual(ret, (None, pipe))
+        self.assertEqual(len(pipe.chunks), 3)
+        self.assertTrue(isinstance(pipe.chunks[0], memoryview))
+        self.assertEqual(b"".join(pipe.chunks), buf)
+
+        # Rate 0 is no limit.
+        toxic = ToxicBandwidthLimit().set_params(rate=0)
+        self.assertEqual(await toxic.run(buf, pipe), (buf, pipe))
+
+if __name__ == '__main__':
+    main()
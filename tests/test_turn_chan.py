@@ -0,0 +1,97 @@
+from p2pd import *
+from p2pd.traversal.turn.turn_process import *
+
+class FakeStream():
+    is_ack = is_ackable = None
+
+    # No ACK headers in these tests.
+    def handle_ack(self, data, is_ack, is_ackable, send, ack_key):
+        return None, data
+
+class FakeTURNPipe():
+    def __init__(self, client, bufs):
+        self.client = client
+        self.bufs = bufs
+        self.route = type("Route", (), {"af": IP4, "ext": lambda x: "1.1.1.1"})()
+
+    async def recv(self, timeout=1):
+        if not len(self.bufs):
+            self.client.state = TURN_ERROR_STOPPED
+            return None
+
+        return self.bufs.pop(0)
+
+class FakeTURNClient():
+    def __init__(self, bufs):
+        self.state = TURN_NOT_STARTED
+        self.tasks = []
+        self.msgs = {}
+        self.chans = {}
+        self.peers = {}
+        self.blank_rudp_headers = False
+        self.stream = FakeStream()
+        self.turn_pipe = FakeTURNPipe(self, bufs)
+        self.turn_client_stopped = asyncio.Event()
+        self.got = []
+
+    def handle_data(self, data, client_tup):
+        self.got.append([data, client_tup])
+
+class TestTURNChan(unittest.IsolatedAsyncioTestCase):
+    async def test_chan_data_codec(self):
+        buf = turn_chan_data_encode(0x4001, b"meow")
+        self.assertEqual(bytes(buf), b"\x40\x01\x00\x04meow")
+        self.assertTrue(is_turn_chan_data(buf))
+        self.assertEqual(turn_chan_data_decode(buf), (0x4001, b"meow"))
+
+        # STUN messages start with 00.
+        msg = STUNMsg(mode=RFC5389)
+        self.assertFalse(is_turn_chan_data(msg.pack()))
+
+        # Len past the end of the buf.
+        self.assertEqual(turn_chan_data_decode(buf[:-1]), (None, None))
+
+    async def test_chan_bind_msg(self):
+        client = TURNClient(IP4, ("127.0.0.1", 3478), None)
+        peer_tup = ("8.8.8.8", 1337)
+        f, _, _ = await client.bind_channel(peer_tup)
+        txid = list(client.chan_binds)[0]
+        self.assertEqual(client.chan_binds[txid], [TURN_CHAN_RANGE[0], peer_tup])
+
+        # Refreshing uses the same channel.
+        await client.bind_channel(peer_tup)
+        self.assertEqual(client.peer_chans, {peer_tup: TURN_CHAN_RANGE[0]})
+
+        msg = client.msgs[txid]["msg"]
+        view, _ = stun_decode(msg.pack())
+        self.assertEqual(view.msg_type, 0x0009)
+        chan_attr = b_to_i(STUNAttrs.ChannelNumber, "big")
+        self.assertEqual(view.get(chan_attr), b"\x40\x00\x00\x00")
+        self.assertEqual(view.addr(STUN_XOR_PEER_ADDR), peer_tup)
+
+    async def test_chan_data_recv(self):
+        peer_tup = ("8.8.8.8", 1337)
+        relay_tup = ("9.9.9.9", 50000)
+        txid = rand_b(12)
+        data_ind = stun_encode(
+            b"\x00\x17",
+            txid,
+            [
+                [STUNAttrs.XorPeerAddress, stun_addr_value(STUN_XOR_PEER_ADDR, *peer_tup, txid)],
+                [STUNAttrs.Data, b"ind"],
+            ]
+        )
+
+        # Data indication, ChannelData, then an unbound channel.
+        client = FakeTURNClient([
+            data_ind,
+            turn_chan_data_encode(0x4000, b"chan"),
+            turn_chan_data_encode(0x4001, b"unbound"),
+        ])
+        client.peers[peer_tup] = relay_tup
+        client.chans[0x4000] = peer_tup
+        await process_replies(client)
+        self.assertEqual(client.got, [[b"ind", peer_tup], [b"chan", peer_tup]])
+
+if __name__ == '__main__':
+    main()